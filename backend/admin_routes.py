@@ -0,0 +1,117 @@
+"""
+管理员诊断路由
+运行中进程的诊断信息（事件循环阻塞、CPU 采样、内存快照、对象计数），
+只允许 settings.admin_usernames 中的用户访问
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Any
+from auth import get_admin_user
+from config import settings
+from database import User
+from loop_monitor import loop_monitor
+from profiling import cpu_profiler, memory_tracker, object_counts
+
+router = APIRouter(prefix="/api/admin", tags=["诊断"])
+
+
+@router.get("/loop-monitor")
+async def get_loop_monitor(
+    top: int = Query(20, ge=1, le=200, description="返回累计阻塞时间最长的调用位置数"),
+    current_user: User = Depends(get_admin_user)
+) -> Dict[str, Any]:
+    """
+    事件循环阻塞检测结果
+
+    包含事件循环延迟分位数、按调用位置汇总的阻塞次数与时长（附调用栈）和最近的阻塞事件
+    """
+    return loop_monitor.snapshot(top)
+
+
+@router.post("/loop-monitor/reset")
+async def reset_loop_monitor(current_user: User = Depends(get_admin_user)) -> Dict[str, Any]:
+    """清空阻塞检测统计"""
+    loop_monitor.reset()
+    return {'message': '已清空'}
+
+
+@router.post("/profile/cpu")
+async def start_cpu_profile(
+    seconds: float = Query(30, gt=0, description="采样时长（秒）"),
+    current_user: User = Depends(get_admin_user)
+) -> Dict[str, Any]:
+    """
+    开始 CPU 采样，到时自动停止
+
+    通过 GET /api/admin/profile/cpu 获取 folded stacks 格式的结果
+    """
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(status_code=400, detail=f"采样时长不能超过 {settings.profiler_max_seconds} 秒")
+    try:
+        cpu_profiler.start(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return cpu_profiler.status()
+
+
+@router.post("/profile/cpu/stop")
+async def stop_cpu_profile(current_user: User = Depends(get_admin_user)) -> Dict[str, Any]:
+    """提前停止 CPU 采样"""
+    cpu_profiler.stop()
+    return cpu_profiler.status()
+
+
+@router.get("/profile/cpu/status")
+async def get_cpu_profile_status(current_user: User = Depends(get_admin_user)) -> Dict[str, Any]:
+    """CPU 采样状态"""
+    return cpu_profiler.status()
+
+
+@router.get("/profile/cpu", response_class=PlainTextResponse)
+async def get_cpu_profile(current_user: User = Depends(get_admin_user)):
+    """
+    最近一次 CPU 采样的结果（folded stacks 格式，可用 flamegraph.pl 或 speedscope 生成火焰图）
+
+    采样进行中时返回目前的结果，响应头 X-Profile-Running 为 true
+    """
+    folded = cpu_profiler.folded()
+    if folded is None:
+        raise HTTPException(status_code=404, detail="尚未进行 CPU 采样")
+    return PlainTextResponse(folded, headers={'X-Profile-Running': str(cpu_profiler.running).lower()})
+
+
+@router.post("/memory/snapshot")
+async def take_memory_snapshot(
+    top: int = Query(30, ge=1, le=500, description="返回的代码位置数"),
+    current_user: User = Depends(get_admin_user)
+) -> Dict[str, Any]:
+    """
+    拍摄 tracemalloc 内存快照
+
+    返回分配最多的代码位置，以及与上一次快照相比变化最大的位置（diff）；
+    第一次调用时开启 tracemalloc，开启期间内存分配会变慢，诊断结束后调用 /memory/stop 关闭
+    """
+    return await memory_tracker.snapshot(top)
+
+
+@router.get("/memory")
+async def get_memory_status(current_user: User = Depends(get_admin_user)) -> Dict[str, Any]:
+    """常驻内存和 tracemalloc 状态"""
+    return memory_tracker.status()
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracing(current_user: User = Depends(get_admin_user)) -> Dict[str, Any]:
+    """关闭 tracemalloc 并丢弃保存的快照"""
+    memory_tracker.stop()
+    return memory_tracker.status()
+
+
+@router.get("/objects")
+async def get_object_counts(current_user: User = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    各子系统的对象计数
+
+    包含存活的 httpx / TOS 客户端、磁盘缓存和内存缓存的条目数、按协程分组的未完成 asyncio 任务和线程
+    """
+    return await object_counts()
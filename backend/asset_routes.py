@@ -0,0 +1,284 @@
+"""
+生成结果资源代理路由
+把 Seedream、即梦、OmniHuman 等返回的结果图片/视频缓存到本地磁盘，
+并通过 /api/assets/{key} 提供支持 Range 的访问
+"""
+import os
+import json
+import asyncio
+import hashlib
+import fnmatch
+import httpx
+from collections import OrderedDict
+from urllib.parse import urlparse
+from fastapi import APIRouter, HTTPException, Request, Depends
+from pydantic import BaseModel
+from typing import Dict, Any, List, Optional, Callable
+from config import settings
+from database import User
+from auth import get_current_user
+from disk_cache import DiskCache
+from file_responses import ranged_file_response
+
+router = APIRouter()
+
+asset_cache = DiskCache(
+    os.path.join(settings.cache_dir, 'assets'),
+    max_bytes=settings.asset_cache_max_bytes,
+    max_age=settings.asset_cache_max_age
+)
+
+# 已登记的资源: key -> 最新的上游URL（只保留最近登记的一部分）
+_asset_urls: "OrderedDict[str, str]" = OrderedDict()
+_MAX_REGISTERED = 10000
+# 正在下载的资源，同一资源并发请求只下载一次
+_inflight: Dict[str, asyncio.Task] = {}
+# 后台预取任务引用，防止被垃圾回收
+_prefetch_tasks = set()
+_prefetch_semaphore = asyncio.Semaphore(settings.asset_prefetch_concurrency)
+# 资源预取完成后的回调，例如生成缩略图: (key, entry) -> None
+_prefetch_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+# 视频资源的扩展名，这类资源额外提供动态预览
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.webm', '.m4v')
+
+
+class AssetRegisterRequest(BaseModel):
+    """资源登记请求"""
+    url: str
+    prefetch: Optional[bool] = True
+
+
+def is_allowed_host(host: str) -> bool:
+    """主机名是否在 settings.asset_allowed_hosts 中（精确匹配或通配模式）"""
+    host = host.lower()
+    return any(fnmatch.fnmatchcase(host, pattern.lower()) for pattern in settings.asset_allowed_hosts)
+
+
+def _is_allowed_url(url: str) -> bool:
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    return is_allowed_host(parsed.hostname)
+
+
+def asset_key(url: str) -> str:
+    """
+    计算资源键
+
+    只取协议、主机和路径，上游每次查询返回的签名参数不同也能命中同一份缓存。
+    """
+    parsed = urlparse(url)
+    return hashlib.sha256(f"{parsed.scheme}://{parsed.netloc}{parsed.path}".encode('utf-8')).hexdigest()
+
+
+def register_asset(url: str) -> Optional[str]:
+    """登记上游资源URL，返回资源键；不在允许列表中的URL返回 None"""
+    if not _is_allowed_url(url):
+        return None
+    key = asset_key(url)
+    # 始终记录最新的URL，签名过期后仍可用新签名回源
+    _asset_urls[key] = url
+    _asset_urls.move_to_end(key)
+    while len(_asset_urls) > _MAX_REGISTERED:
+        _asset_urls.popitem(last=False)
+    return key
+
+
+def asset_proxy_url(key: str) -> str:
+    """资源的代理访问路径"""
+    return f"/api/assets/{key}"
+
+
+def asset_preview_urls(key: str, url: str) -> Dict[str, str]:
+    """资源的预览图访问路径：缩略图、封面图，视频另有动态预览"""
+    variants = ['thumb', 'poster']
+    if urlparse(url).path.lower().endswith(VIDEO_EXTENSIONS):
+        variants.append('animated')
+    return {variant: f"/api/assets/{key}/previews/{variant}" for variant in variants}
+
+
+def on_asset_prefetched(listener: Callable[[str, Dict[str, Any]], None]):
+    """注册资源预取完成后的回调"""
+    _prefetch_listeners.append(listener)
+
+
+async def _download_asset(key: str, url: str) -> Dict[str, Any]:
+    tmp_path = asset_cache.new_temp_path()
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0)) as client:
+            async with client.stream('GET', url) as response:
+                if response.status_code != 200:
+                    raise HTTPException(
+                        status_code=502,
+                        detail=f"上游资源获取失败: HTTP {response.status_code}"
+                    )
+                content_type = response.headers.get('content-type', 'application/octet-stream')
+                # 磁盘写入放到线程中，不阻塞事件循环
+                f = await asyncio.to_thread(open, tmp_path, 'wb')
+                try:
+                    async for chunk in response.aiter_bytes(256 * 1024):
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    entry = await asyncio.to_thread(
+        asset_cache.put_file, key, tmp_path, {'url': url, 'content_type': content_type}
+    )
+    print(f"📦 资源已缓存: {key[:12]}... ({entry['size']} bytes)")
+    return entry
+
+
+async def fetch_asset(key: str) -> Optional[Dict[str, Any]]:
+    """
+    获取资源（优先读缓存，未命中时回源下载）
+
+    Returns:
+        缓存条目；资源未登记时返回 None
+    """
+    entry = asset_cache.get(key)
+    if entry is not None:
+        return entry
+
+    url = _asset_urls.get(key)
+    if url is None:
+        return None
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_download_asset(key, url))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _prefetch(key: str):
+    async with _prefetch_semaphore:
+        try:
+            entry = await fetch_asset(key)
+        except Exception as e:
+            print(f"⚠️ 资源预取失败: {key[:12]}... {type(e).__name__}: {str(e)}")
+            return
+    if entry is not None:
+        for listener in _prefetch_listeners:
+            listener(key, entry)
+
+
+def prefetch_assets(keys: List[str]):
+    """在后台预取资源，不阻塞当前请求"""
+    for key in keys:
+        if key in _inflight:
+            continue
+        if asset_cache.contains(key):
+            # 已缓存的资源也通知回调，由回调自行判断是否已处理过
+            entry = asset_cache.get(key)
+            if entry is not None:
+                for listener in _prefetch_listeners:
+                    listener(key, entry)
+            continue
+        task = asyncio.create_task(_prefetch(key))
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+
+
+def _collect_urls(value: Any, urls: List[str]):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if k == 'resp_data' and isinstance(v, str):
+                # OmniHuman 等接口把结果放在 JSON 字符串里
+                try:
+                    _collect_urls(json.loads(v), urls)
+                except ValueError:
+                    pass
+            elif k not in ('proxy_urls', 'preview_urls'):
+                _collect_urls(v, urls)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_urls(item, urls)
+    elif isinstance(value, str) and value.startswith(('http://', 'https://')):
+        urls.append(value)
+
+
+def attach_proxy_urls(data: Dict[str, Any], prefetch: bool = False) -> Dict[str, Any]:
+    """
+    登记结果数据中的资源URL，并附加 proxy_urls 字段（原始URL -> 代理路径）
+    和 preview_urls 字段（原始URL -> {缩略图、封面图、动态预览的路径}）
+
+    Args:
+        data: 上游返回的任务数据
+        prefetch: 是否立即在后台预取（任务刚完成时使用）
+    """
+    urls: List[str] = []
+    _collect_urls(data, urls)
+
+    proxy_urls = {}
+    preview_urls = {}
+    keys = []
+    for url in urls:
+        key = register_asset(url)
+        if key is None:
+            continue
+        proxy_urls[url] = asset_proxy_url(key)
+        preview_urls[url] = asset_preview_urls(key, url)
+        keys.append(key)
+
+    if proxy_urls:
+        data['proxy_urls'] = proxy_urls
+        data['preview_urls'] = preview_urls
+        if prefetch:
+            prefetch_assets(keys)
+    return data
+
+
+@router.post("/api/assets")
+async def register_asset_url(
+    request: AssetRegisterRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    登记一个上游资源URL，返回代理访问路径（需要登录）
+
+    只允许 settings.asset_allowed_hosts 中的生成结果地址
+    """
+    key = register_asset(request.url)
+    if key is None:
+        raise HTTPException(status_code=400, detail="不支持代理该资源地址")
+    if request.prefetch:
+        prefetch_assets([key])
+    return {'key': key, 'url': asset_proxy_url(key)}
+
+
+@router.get("/api/assets/stats")
+async def get_asset_stats():
+    """资源缓存统计"""
+    return {
+        **asset_cache.stats(),
+        'registered': len(_asset_urls),
+        'downloading': len(_inflight)
+    }
+
+
+@router.get("/api/assets/{key}")
+async def get_asset(key: str, request: Request):
+    """
+    获取缓存的资源
+
+    支持 Range 请求；未缓存时回源下载后返回
+    """
+    try:
+        entry = await fetch_asset(key)
+    except ValueError:
+        entry = None
+
+    if entry is None:
+        raise HTTPException(status_code=404, detail="资源不存在")
+
+    return ranged_file_response(
+        request,
+        entry['path'],
+        entry['meta'].get('content_type', 'application/octet-stream'),
+        headers={'Cache-Control': 'private, max-age=86400'}
+    )
@@ -7,6 +7,7 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database import get_db, User
+from config import settings
 
 # 密码哈希上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -90,3 +91,13 @@ async def get_current_active_user(
         )
     return current_user
 
+async def get_admin_user(
+    current_user: User = Depends(get_current_active_user)
+) -> User:
+    """获取当前管理员用户（用户名需在 settings.admin_usernames 中）"""
+    if current_user.username not in settings.admin_usernames:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return current_user
@@ -0,0 +1,92 @@
+"""
+事件循环延迟基准
+
+模拟视觉服务返回数 MB binary_data_base64 结果时的处理过程（解析响应 JSON、解码 base64、
+序列化写入结果缓存），同时用一个定时器测量事件循环的延迟，
+比较全部在事件循环中处理（阈值设为无穷大）和超过阈值交给工作进程处理两种方式。
+
+用法: python bench_loop_lag.py [图片MB数] [请求数]
+"""
+
+import os
+import sys
+import time
+import json
+import base64
+import asyncio
+from typing import Dict, List
+from config import settings
+import payload_offload
+
+# 定时器间隔（秒）
+TICK = 0.005
+
+
+def _payload(image_mb: float) -> bytes:
+    image = base64.b64encode(os.urandom(int(image_mb * 1024 * 1024))).decode('ascii')
+    return json.dumps({
+        'code': 10000,
+        'data': {'status': 'done', 'binary_data_base64': [image]},
+        'message': 'Success'
+    }).encode('utf-8')
+
+
+async def _ticker(stop: asyncio.Event, lags: List[float]):
+    """按固定间隔唤醒，记录实际唤醒时间比预期晚了多少"""
+    expected = time.perf_counter() + TICK
+    while not stop.is_set():
+        await asyncio.sleep(TICK)
+        now = time.perf_counter()
+        lags.append(max(0.0, now - expected))
+        expected = now + TICK
+
+
+async def _handle(body: bytes):
+    response = await payload_offload.loads(body)
+    images = response['data']['binary_data_base64']
+    decoded = [await payload_offload.b64decode(v) for v in images]
+    await payload_offload.dumps(response)
+    return sum(len(d) for d in decoded)
+
+
+async def run(label: str, threshold: int, body: bytes, requests: int) -> Dict[str, float]:
+    settings.payload_offload_threshold = threshold
+    # 预热（包括启动工作进程），不计入结果
+    await _handle(body)
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(_handle(body) for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    lags.sort()
+    result = {
+        'elapsed_ms': elapsed * 1000,
+        'max_lag_ms': lags[-1] * 1000 if lags else 0.0,
+        'p99_lag_ms': lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000 if lags else 0.0
+    }
+    print(f"{label:<8} 总耗时 {result['elapsed_ms']:8.1f}ms  "
+          f"最大延迟 {result['max_lag_ms']:7.1f}ms  p99 延迟 {result['p99_lag_ms']:7.1f}ms")
+    return result
+
+
+async def main():
+    image_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    body = _payload(image_mb)
+    print(f"📊 {requests} 个响应，每个 {len(body) / 1024 / 1024:.1f}MB")
+
+    threshold = settings.payload_offload_threshold
+    try:
+        await run('inline', sys.maxsize, body, requests)
+        await run('offload', threshold, body, requests)
+    finally:
+        payload_offload.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+本地 Blob 存储路由
+上传文件和解码后的 base64 结果按内容哈希暂存到本地磁盘缓存，并通过 /api/blobs/{digest} 对外提供访问
+"""
+import os
+import hashlib
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, UploadFile
+from file_responses import ranged_file_response
+from typing import Dict, Any, Union, Optional
+from config import settings
+from disk_cache import DiskCache
+import payload_offload
+
+router = APIRouter()
+
+blob_cache = DiskCache(
+    os.path.join(settings.cache_dir, 'blobs'),
+    max_bytes=settings.blob_cache_max_bytes
+)
+
+# 每次从上传流中读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 文件头 -> 内容类型
+_MAGIC_TYPES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def blob_url(digest: str) -> Optional[str]:
+    """获取 Blob 的对外访问地址；未配置 public_base_url 时返回 None"""
+    if not settings.public_base_url:
+        return None
+    return f"{settings.public_base_url.rstrip('/')}/api/blobs/{digest}"
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def read_blob_base64(blob: Dict[str, Any]) -> str:
+    """读取已暂存的文件并编码为 base64（无法以 URL 提交给上游时使用）"""
+    data = await asyncio.to_thread(_read_file, blob['path'])
+    return await payload_offload.b64encode(data)
+
+
+async def save_upload_to_blob(upload: UploadFile) -> Dict[str, Any]:
+    """
+    把上传文件分块写入 Blob 存储，边写边计算 SHA256
+
+    文件不会整体读入内存，也不会经过 base64 编码。
+
+    Args:
+        upload: FastAPI 上传文件对象
+
+    Returns:
+        包含 digest、size、content_type、path 的字典
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    tmp_path = blob_cache.new_temp_path()
+
+    try:
+        # 磁盘写入放到线程中，不阻塞事件循环
+        f = await asyncio.to_thread(open, tmp_path, 'wb')
+        try:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.upload_max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"文件大小超过{settings.upload_max_bytes // (1024 * 1024)}MB限制"
+                    )
+                hasher.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    digest = hasher.hexdigest()
+    content_type = upload.content_type or 'application/octet-stream'
+
+    entry = blob_cache.get(digest)
+    if entry is not None:
+        # 相同内容已经暂存过，直接复用
+        os.remove(tmp_path)
+    else:
+        entry = await asyncio.to_thread(
+            blob_cache.put_file,
+            digest,
+            tmp_path,
+            {'content_type': content_type, 'filename': upload.filename}
+        )
+
+    return {
+        'digest': digest,
+        'size': size,
+        'content_type': content_type,
+        'path': entry['path']
+    }
+
+
+def sniff_content_type(data: bytes) -> str:
+    """按文件头判断图片类型，无法识别时返回 application/octet-stream"""
+    for magic, content_type in _MAGIC_TYPES:
+        if data.startswith(magic):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+async def save_base64_to_blob(value: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    解码 base64 内容（可带 data: 前缀）并写入 Blob 存储
+
+    Returns:
+        包含 digest、size、content_type、url 的字典（未配置 public_base_url 时 url 为 None）
+
+    Raises:
+        binascii.Error: 内容不是合法的 base64
+    """
+    if isinstance(value, str) and value.startswith('data:') and ',' in value:
+        value = value.split(',', 1)[1]
+    data = await payload_offload.b64decode(value, validate=True)
+    digest = await payload_offload.sha256_hex(data)
+    content_type = sniff_content_type(data)
+    if blob_cache.get(digest) is None:
+        await asyncio.to_thread(blob_cache.put_bytes, digest, data, {'content_type': content_type})
+    return {'digest': digest, 'size': len(data), 'content_type': content_type, 'url': blob_url(digest)}
+
+
+@router.get("/api/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """获取暂存的 Blob 文件（支持 Range 和 If-None-Match）"""
+    try:
+        entry = blob_cache.get(digest)
+    except ValueError:
+        entry = None
+
+    if entry is None:
+        raise HTTPException(status_code=404, detail="文件不存在或已过期")
+
+    return ranged_file_response(
+        request,
+        entry['path'],
+        entry['meta'].get('content_type', 'application/octet-stream'),
+        headers={'Cache-Control': 'public, max-age=31536000, immutable'}
+    )
@@ -0,0 +1,333 @@
+"""
+上游熔断器
+按上游主机和接口（动作）分别统计最近一段时间内的失败率和慢调用比例，超过阈值时熔断：
+熔断期间的调用立即失败并返回建议的重试等待时间，不再占用连接等待上游超时。
+
+- closed: 正常放行，统计滚动窗口内的调用结果
+- open: 直接拒绝，到期后进入 half_open；连续熔断时熔断时间加倍（有上限）
+- half_open: 只放行少量探测调用，全部成功后恢复 closed，任一失败或过慢则重新熔断
+
+连接错误、超时和 5xx 计为失败；429 限流按密钥计算，不代表上游故障，不计入统计。
+"""
+import time
+import contextvars
+from collections import deque
+from urllib.parse import urlparse
+from typing import Dict, Any, Optional, Deque, Tuple, List
+import httpx
+from fastapi import HTTPException
+from config import settings
+import deadline
+from credential_pool import POOL_UNAUTHORIZED_CODE, POOL_UNAVAILABLE_CODE
+
+CIRCUIT_OPEN_CODE = 'CIRCUIT_OPEN'
+# 非上游返回的调用失败对应的 HTTP 状态码
+_ERROR_STATUS = {
+    deadline.DEADLINE_EXCEEDED_CODE: 504,
+    POOL_UNAUTHORIZED_CODE: 401,
+    POOL_UNAVAILABLE_CODE: 503
+}
+# half_open 探测名额已满时建议的重试等待时间（秒）
+_PROBE_RETRY_AFTER = 1.0
+
+
+class CircuitOpenError(Exception):
+    """熔断中，调用被拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} 熔断中")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """单个上游主机或接口的熔断器"""
+
+    def __init__(self, name: str, slow_call_seconds: float):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.state = 'closed'
+        # 滚动窗口: (完成时间, 是否失败, 是否过慢)
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._open_until = 0.0
+        self._open_seconds = float(settings.circuit_open_seconds)
+        self._probes = 0
+        self._probe_successes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def _prune(self, now: float):
+        while self._calls and self._calls[0][0] < now - settings.circuit_window_seconds:
+            self._calls.popleft()
+
+    def _rates(self) -> Tuple[int, float, float]:
+        total = len(self._calls)
+        if not total:
+            return 0, 0.0, 0.0
+        failed = sum(1 for _, f, _ in self._calls if f)
+        slow = sum(1 for _, _, s in self._calls if s)
+        return total, failed / total, slow / total
+
+    def _open(self, now: float, reason: str):
+        if self.state == 'half_open':
+            # 探测失败，熔断时间加倍
+            self._open_seconds = min(self._open_seconds * 2, settings.circuit_max_open_seconds)
+        self.state = 'open'
+        self._open_until = now + self._open_seconds
+        self._calls.clear()
+        self.opened += 1
+        print(f"🔌 上游熔断: {self.name} {reason}，{self._open_seconds:.0f}秒后探测")
+
+    def _close(self):
+        self.state = 'closed'
+        self._calls.clear()
+        self._open_seconds = float(settings.circuit_open_seconds)
+        print(f"✅ 上游恢复: {self.name}")
+
+    def acquire(self) -> bool:
+        """
+        申请一次调用
+
+        Returns:
+            是否为 half_open 状态下的探测调用
+
+        Raises:
+            CircuitOpenError: 熔断中
+        """
+        now = time.monotonic()
+        if self.state == 'open':
+            if now < self._open_until:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._open_until - now)
+            self.state = 'half_open'
+            self._probes = 0
+            self._probe_successes = 0
+        if self.state == 'half_open':
+            if self._probes >= settings.circuit_half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, _PROBE_RETRY_AFTER)
+            self._probes += 1
+            return True
+        return False
+
+    def current_state(self) -> str:
+        """当前状态，熔断到期未被调用时视为 half_open"""
+        if self.state == 'open' and time.monotonic() >= self._open_until:
+            return 'half_open'
+        return self.state
+
+    def release(self, probe: bool):
+        """调用未到达上游（参数错误、被取消等），归还探测名额"""
+        if probe and self.state == 'half_open':
+            self._probes -= 1
+
+    def record(self, probe: bool, failed: bool, elapsed: float):
+        """记录一次到达上游的调用结果"""
+        now = time.monotonic()
+        slow = elapsed > self.slow_call_seconds
+        if not failed:
+            self._latencies.append(elapsed)
+
+        if self.state == 'half_open':
+            if not probe:
+                # 熔断前发出的调用，结果不影响探测
+                return
+            if failed or slow:
+                self._open(now, '探测调用失败' if failed else f'探测调用耗时 {elapsed:.1f}秒')
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= settings.circuit_half_open_probes:
+                self._close()
+            return
+        if self.state == 'open':
+            return
+
+        self._calls.append((now, failed, slow))
+        self._prune(now)
+        total, failure_rate, slow_rate = self._rates()
+        if total < settings.circuit_min_calls:
+            return
+        if failure_rate >= settings.circuit_failure_rate:
+            self._open(now, f'失败率 {failure_rate:.0%}')
+        elif slow_rate >= settings.circuit_slow_call_rate:
+            self._open(now, f'慢调用比例 {slow_rate:.0%}')
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._prune(now)
+        total, failure_rate, slow_rate = self._rates()
+        latencies = sorted(self._latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+        return {
+            'state': self.state,
+            'calls': total,
+            'failure_rate': round(failure_rate, 4),
+            'slow_rate': round(slow_rate, 4),
+            'latency_p95_ms': None if p95 is None else round(p95 * 1000, 1),
+            'retry_after': round(max(0.0, self._open_until - now), 1) if self.state == 'open' else None,
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
+
+
+class _CallRecord:
+    """一次服务调用中最后一个上游请求的结果，由 RecordingTransport 填写"""
+
+    def __init__(self):
+        self.failed: Optional[bool] = None
+        self.elapsed = 0.0
+
+
+_current_call: contextvars.ContextVar[Optional[_CallRecord]] = contextvars.ContextVar('upstream_call', default=None)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """记录上游请求结果的传输层，供熔断器统计"""
+
+    def __init__(self, **kwargs):
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        record = _current_call.get()
+        started = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError as e:
+            # 请求预算耗尽引起的超时不代表上游故障
+            if record is not None and not (isinstance(e, httpx.TimeoutException) and deadline.expired()):
+                record.failed = True
+                record.elapsed = time.monotonic() - started
+            raise
+        if record is not None and response.status_code != 429:
+            record.failed = response.status_code >= 500
+            record.elapsed = time.monotonic() - started
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def upstream_transport() -> httpx.AsyncBaseTransport:
+    """上游调用使用的传输层"""
+    return RecordingTransport()
+
+
+def _slow_call_seconds(action: str) -> float:
+    for prefix, seconds in settings.circuit_slow_call_overrides.items():
+        if action.startswith(prefix):
+            return seconds
+    return settings.circuit_slow_call_seconds
+
+
+class CircuitBreakers:
+    """按上游主机和接口管理熔断器"""
+
+    def __init__(self):
+        self._hosts: Dict[str, CircuitBreaker] = {}
+        self._actions: Dict[str, CircuitBreaker] = {}
+
+    def _breakers(self, base_url: str, action: str) -> List[CircuitBreaker]:
+        host = urlparse(base_url).hostname or base_url
+        name = f"{host}/{action}"
+        if host not in self._hosts:
+            self._hosts[host] = CircuitBreaker(host, settings.circuit_slow_call_seconds)
+        if name not in self._actions:
+            self._actions[name] = CircuitBreaker(name, _slow_call_seconds(action))
+        return [self._hosts[host], self._actions[name]]
+
+    def begin(self, base_url: str, action: str) -> "_Call":
+        """
+        开始一次上游调用
+
+        Raises:
+            CircuitOpenError: 主机或接口熔断中
+        """
+        breakers = self._breakers(base_url, action)
+        acquired: List[Tuple[CircuitBreaker, bool]] = []
+        try:
+            for breaker in breakers:
+                acquired.append((breaker, breaker.acquire()))
+        except CircuitOpenError:
+            for breaker, probe in acquired:
+                breaker.release(probe)
+            raise
+        return _Call(acquired)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'hosts': {name: b.snapshot() for name, b in self._hosts.items()},
+            'actions': {name: b.snapshot() for name, b in self._actions.items()}
+        }
+
+    def host_state(self, host: str) -> str:
+        """主机熔断器的状态，未发生过调用的主机视为 closed"""
+        breaker = self._hosts.get(host)
+        return 'closed' if breaker is None else breaker.current_state()
+
+    def degraded(self) -> List[str]:
+        """熔断中或探测中的主机和接口"""
+        return [
+            name for name, b in {**self._hosts, **self._actions}.items()
+            if b.state != 'closed'
+        ]
+
+
+class _Call:
+    """一次已放行的上游调用"""
+
+    def __init__(self, acquired: List[Tuple[CircuitBreaker, bool]]):
+        self._acquired = acquired
+        self._record = _CallRecord()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_call.set(self._record)
+        return self
+
+    @property
+    def upstream_failed(self) -> bool:
+        """最后一个上游请求是否失败（连接错误、超时或 5xx）"""
+        return self._record.failed is True
+
+    def __exit__(self, *exc):
+        _current_call.reset(self._token)
+        for breaker, probe in self._acquired:
+            if self._record.failed is None:
+                breaker.release(probe)
+            else:
+                breaker.record(probe, self._record.failed, self._record.elapsed)
+        return False
+
+
+def circuit_open_result(error: CircuitOpenError) -> Dict[str, Any]:
+    """熔断时返回的 VolcanoAPIService 风格结果"""
+    retry_after = max(1, round(error.retry_after))
+    return {
+        'success': False,
+        'error': {
+            'message': f"上游服务 {error.name} 暂时不可用，请 {retry_after} 秒后重试",
+            'code': CIRCUIT_OPEN_CODE,
+            'retry_after': retry_after
+        }
+    }
+
+
+def upstream_http_error(error: Any) -> HTTPException:
+    """
+    把上游调用失败转换为 HTTP 错误：熔断返回 503 并带 Retry-After，超过截止时间返回 504，
+    凭证池令牌无效返回 401、没有可用密钥返回 503，其余返回 500
+    """
+    code = error.get('code') if isinstance(error, dict) else None
+    if code in _ERROR_STATUS:
+        return HTTPException(status_code=_ERROR_STATUS[code], detail=error)
+    if isinstance(error, dict) and error.get('code') == CIRCUIT_OPEN_CODE:
+        return HTTPException(
+            status_code=503,
+            detail=error,
+            headers={'Retry-After': str(error['retry_after'])}
+        )
+    return HTTPException(status_code=500, detail=error)
+
+
+circuit_breakers = CircuitBreakers()
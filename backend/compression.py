@@ -0,0 +1,240 @@
+"""
+响应压缩中间件
+按请求的 Accept-Encoding 协商压缩算法（zstd、br、gzip，优先级依次降低），只压缩文本类响应：
+
+- 图片、视频、音频等已压缩的媒体和分段（206）响应不压缩
+- 长度已知且小于 compression_min_size 的响应不压缩；较大的响应在线程中整体压缩，不阻塞事件循环
+- 流式响应（如 NDJSON 进度事件）逐块压缩并立即刷新，客户端仍能实时收到每条消息
+- SSE（text/event-stream）不压缩，避免代理缓冲
+
+brotli / zstandard 未安装时对应算法不参与协商，始终可以回退到 gzip。
+"""
+import zlib
+import asyncio
+from typing import Optional, List, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_COMPRESSIBLE_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'application/xml', 'image/svg+xml'
+)
+_stats = {'compressed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=settings.compression_brotli_quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.compress(data)
+        if final:
+            return out + self._compressor.flush()
+        return out + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+def available_encodings() -> List[str]:
+    """服务端支持的压缩算法，按优先级排列"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+_ENCODERS = {'gzip': _GzipEncoder, 'br': _BrotliEncoder, 'zstd': _ZstdEncoder}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    按 Accept-Encoding 选择压缩算法
+
+    Returns:
+        客户端权重最高的算法，权重相同时按服务端优先级；都不接受时返回 None
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _compressible(status: int, headers: Headers) -> bool:
+    if status in (204, 206, 304) or 'content-encoding' in headers or 'content-range' in headers:
+        return False
+    content_type = headers.get('content-type', '').split(';', 1)[0].strip().lower()
+    if content_type == 'text/event-stream':
+        return False
+    return (content_type.startswith('text/') or content_type in _COMPRESSIBLE_TYPES
+            or content_type.endswith('+json') or content_type.endswith('+xml'))
+
+
+def _compress_whole(encoding: str, body: bytes) -> bytes:
+    return _ENCODERS[encoding]().compress(body, final=True)
+
+
+class CompressionMiddleware:
+    """压缩响应体"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.compression_enabled:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(encoding, send).run(self.app, scope, receive)
+
+
+class _Responder:
+    """单个响应的压缩状态：先暂存响应头，收到第一段响应体后决定是否压缩"""
+
+    def __init__(self, encoding: str, send):
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[dict] = None
+        # None: 尚未决定；'identity': 原样转发；'whole': 收齐后整体压缩；'stream': 逐块压缩
+        self.mode: Optional[str] = None
+        self.headers: Optional[MutableHeaders] = None
+        self.buffer: List[bytes] = []
+        self.encoder = None
+
+    async def run(self, app, scope, receive):
+        await app(scope, receive, self.wrapped_send)
+
+    def _headers(self) -> Tuple[MutableHeaders, bool]:
+        headers = MutableHeaders(raw=list(self.start['headers']))
+        compressible = _compressible(self.start['status'], headers)
+        if compressible:
+            headers.add_vary_header('Accept-Encoding')
+        return headers, compressible
+
+    def _encoded_headers(self, headers: MutableHeaders):
+        headers['Content-Encoding'] = self.encoding
+        # 压缩后的表示与原始字节不同，强 ETag 改为弱 ETag
+        etag = headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}' if etag.startswith('"') else f'W/"{etag}"'
+
+    async def wrapped_send(self, message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.mode is None:
+            self.headers, compressible = self._headers()
+            # 声明了长度的响应（包括经 http 中间件转发、被拆成多段的响应）按整体处理
+            declared = self.headers.get('content-length')
+            size = int(declared) if declared is not None else (None if more_body else len(body))
+            if not compressible or (size is not None and size < settings.compression_min_size):
+                self.mode = 'identity'
+                await self.send({**self.start, 'headers': self.headers.raw})
+                await self.send(message)
+                return
+
+            _stats['compressed'] += 1
+            self._encoded_headers(self.headers)
+            if size is None:
+                # 流式响应：长度未知，逐块压缩并立即刷新
+                self.mode = 'stream'
+                del self.headers['Content-Length']
+                self.encoder = _ENCODERS[self.encoding]()
+                await self.send({**self.start, 'headers': self.headers.raw})
+            else:
+                self.mode = 'whole'
+
+        if self.mode == 'identity':
+            await self.send(message)
+            return
+
+        if self.mode == 'stream':
+            compressed = self.encoder.compress(body, final=not more_body)
+            self._count(len(body), len(compressed))
+            await self.send({'type': 'http.response.body', 'body': compressed, 'more_body': more_body})
+            return
+
+        self.buffer.append(body)
+        if more_body:
+            return
+        # 整体响应：一次压缩，较大的响应体放到线程中压缩
+        body = b''.join(self.buffer)
+        self.buffer = []
+        if len(body) >= settings.compression_thread_threshold:
+            compressed = await asyncio.to_thread(_compress_whole, self.encoding, body)
+        else:
+            compressed = _compress_whole(self.encoding, body)
+        self._count(len(body), len(compressed))
+        self.headers['Content-Length'] = str(len(compressed))
+        await self.send({**self.start, 'headers': self.headers.raw})
+        await self.send({'type': 'http.response.body', 'body': compressed})
+
+    @staticmethod
+    def _count(size_in: int, size_out: int):
+        _stats['bytes_in'] += size_in
+        _stats['bytes_out'] += size_out
+
+
+def stats() -> dict:
+    ratio = _stats['bytes_out'] / _stats['bytes_in'] if _stats['bytes_in'] else None
+    return {
+        **_stats,
+        'ratio': None if ratio is None else round(ratio, 3),
+        'encodings': available_encodings()
+    }
@@ -18,7 +18,192 @@ class Settings(BaseSettings):
     
     # CORS配置
     cors_origins: list = ["http://localhost:3000", "http://127.0.0.1:3000"]
-    
+
+    # 写入磁盘的调用凭证的加密密钥（Fernet 密钥），未配置时在 cache_dir 下自动生成
+    credentials_encryption_key: Optional[str] = None
+
+    # 管理员用户名（可访问 /api/admin 下的诊断接口）
+    admin_usernames: list = []
+
+    # 对外访问地址（上游服务回源拉取本服务暂存的文件、视频任务回调时使用），需为上游可访问的地址。
+    # 未配置时：上传的图片改为 base64 提交，视频需指定 TOS 存储桶，结果图片按 base64 返回，不注入回调地址
+    public_base_url: Optional[str] = None
+
+    # 本地缓存配置
+    cache_dir: str = "./cache"
+    blob_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    upload_max_bytes: int = 100 * 1024 * 1024
+
+    # 断点续传上传配置（TOS 分片上传，分片最小 5MB，最多 10000 片）
+    resumable_upload_max_bytes: int = 20 * 1024 * 1024 * 1024
+    resumable_part_size: int = 8 * 1024 * 1024
+    resumable_part_max_bytes: int = 64 * 1024 * 1024
+    # 合并请求中断（如进程退出）后会话停留在 completing 状态，超过该秒数允许重新合并
+    resumable_complete_timeout: int = 600
+
+    # 生成结果资源代理缓存配置
+    asset_cache_max_bytes: int = 10 * 1024 * 1024 * 1024
+    asset_cache_max_age: int = 7 * 24 * 3600
+    asset_prefetch_concurrency: int = 4
+    # 允许代理的上游结果地址：精确主机名或通配模式（fnmatch），只列出生成服务存放结果的存储桶和 CDN 域名
+    asset_allowed_hosts: list = [
+        "ark-content-generation-cn-beijing.tos-cn-beijing.volces.com",
+        "ark-content-generation-v2-cn-beijing.tos-cn-beijing.volces.com",
+        "*-aiop-sign.byteimg.com",
+        "*-aiop-sign.ibyteimg.com"
+    ]
+
+    # 生成结果预览（缩略图、封面图、动态预览）配置
+    preview_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    preview_workers: int = 2
+
+    # 确定性结果缓存配置（结果中的上游URL约24小时过期，缓存时间需短于该时间）
+    result_cache_max_bytes: int = 1024 * 1024 * 1024
+    result_cache_max_age: int = 20 * 3600
+
+    # 视频任务回调配置
+    video_callback_enabled: bool = True
+    video_callback_secret: str = ""
+    # 已注入回调的任务兜底巡检间隔（秒）
+    video_sweep_interval: int = 60
+    # 未注入回调的任务巡检间隔（秒）
+    video_poll_interval: int = 10
+
+    # 上游调用调度配置
+    upstream_concurrency: int = 16
+    upstream_interactive_reserved: int = 4
+    upstream_class_weights: dict = {"batch": 3.0, "background": 1.0}
+
+    # 上游服务端点配置，同一服务可配置多个区域，按探测延迟选择
+    # region 为该端点的签名区域
+    service_endpoints: dict = {
+        "ark": [{"url": "https://ark.cn-beijing.volces.com", "region": "cn-beijing"}],
+        "visual": [{"url": "https://visual.volcengineapi.com", "region": "cn-north-1"}],
+        "vikingdb": [{"url": "https://api-vikingdb.vikingdb.cn-beijing.volces.com", "region": "cn-beijing"}],
+        "tts": [{"url": "https://openspeech.bytedance.com", "region": "cn-beijing"}]
+    }
+    # 端点探测间隔（秒），0 表示不探测
+    endpoint_probe_interval: int = 30
+    endpoint_probe_timeout: float = 5.0
+    # 新端点延迟低于当前端点该比例以上才切换
+    endpoint_switch_margin: float = 0.2
+
+    # 上游熔断配置（按主机和接口分别统计）
+    circuit_window_seconds: int = 60
+    # 窗口内调用数达到该值才判断是否熔断
+    circuit_min_calls: int = 10
+    circuit_failure_rate: float = 0.5
+    circuit_slow_call_seconds: float = 20.0
+    circuit_slow_call_rate: float = 0.8
+    # 按接口名前缀覆盖慢调用阈值，同步生成图片本身耗时较长
+    circuit_slow_call_overrides: dict = {"images.generate": 50.0}
+    circuit_open_seconds: int = 15
+    # 视觉服务按 Action 和 req_key 分别熔断，只有以下取值单独统计，其余归入 other（Action、req_key 由客户端传入）
+    circuit_visual_actions: list = ["CVProcess", "CVSync2AsyncSubmitTask", "CVSync2AsyncGetResult"]
+    circuit_visual_req_keys: list = [
+        "jimeng_t2i_v40", "jimeng_ti2v_v30_pro", "jimeng_imitator_ii2v",
+        "jimeng_realman_avatar_picture_create_video_omni_v15", "realman_avatar_imitator_v2v_gen_video",
+        "dm_seedance_videoedit_tob"
+    ]
+    circuit_max_open_seconds: int = 300
+    circuit_half_open_probes: int = 2
+
+    # 凭证池配置（密钥列表在系统配置 volcano_ark_key_pool / volcano_engine_credential_pool 中维护）
+    credential_pool_refresh_seconds: int = 30
+    # 允许使用凭证池的用户名，未列出的用户（包括自行注册的用户）不能使用凭证池
+    credential_pool_users: list = []
+    # 密钥未配置 qps / concurrency 时的默认值
+    credential_pool_default_qps: float = 2.0
+    credential_pool_default_concurrency: int = 4
+    # 被限流的密钥暂停使用的时间（秒），连续限流时加倍
+    credential_pool_eject_seconds: int = 10
+    credential_pool_max_eject_seconds: int = 300
+    # 提交被限流时最多尝试的密钥数
+    credential_pool_max_attempts: int = 3
+
+    # 请求截止时间配置
+    # 客户端可通过 X-Request-Timeout（秒）指定愿意等待的时间，不超过 request_timeout_max
+    request_timeout_max: float = 600.0
+    # 各路由的默认预算（秒），按路由模板匹配；未配置的路由没有截止时间，上游调用使用各自的默认超时
+    request_budgets: dict = {
+        "/api/volcano/images/generate": 90.0,
+        "/api/volcano/video/create": 60.0,
+        # 长轮询最多等待 60 秒，之后可能还要查询上游
+        "/api/volcano/video/tasks/{task_id}": 90.0,
+        "/api/volcano/video/tasks": 30.0,
+        "/api/volcano/visual/{action}": 60.0,
+        "/api/volcano/visual/{action}/query": 60.0,
+        "/api/volcano/tasks/status:batch": 60.0,
+        "/api/search": 60.0,
+        "/api/tts/synthesize": 60.0
+    }
+
+    # 响应压缩配置（br / zstd 需要安装 brotli / zstandard，未安装时只使用 gzip）
+    compression_enabled: bool = True
+    # 小于该字节数的响应不压缩
+    compression_min_size: int = 1024
+    # 大于该字节数的响应在线程中压缩
+    compression_thread_threshold: int = 256 * 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+    compression_zstd_level: int = 6
+
+    # 大载荷处理卸载配置（JSON 解析/序列化、base64 编解码）
+    # 大于该字节数的载荷交给工作进程处理，较小的载荷直接在事件循环中处理
+    payload_offload_threshold: int = 256 * 1024
+    payload_offload_workers: int = 2
+
+    # 事件循环阻塞检测配置
+    loop_monitor_enabled: bool = True
+    # 延迟测量间隔（秒）
+    loop_monitor_interval: float = 0.1
+    # 事件循环停顿超过该秒数视为阻塞，记录调用位置
+    loop_monitor_block_threshold: float = 0.1
+    # 阻塞期间采集调用栈的间隔（秒）
+    loop_monitor_sample_interval: float = 0.02
+    # 采集调用栈的阻塞事件比例（阻塞时长始终统计），高负载时可调低
+    loop_monitor_sample_rate: float = 1.0
+
+    # 按需性能剖析配置（/api/admin/profile、/api/admin/memory）
+    # CPU 采样间隔（秒）
+    profiler_sample_interval: float = 0.01
+    profiler_max_seconds: int = 300
+    # tracemalloc 记录的调用栈深度
+    tracemalloc_frames: int = 10
+
+    # 批量任务状态查询配置
+    task_status_batch_max: int = 200
+    # 查询上游的并发数
+    task_status_batch_concurrency: int = 8
+    # 方舟任务列表查询每次携带的任务ID数
+    task_status_ark_page_size: int = 100
+    # 已结束的视觉服务任务结果在本地保留的时间（秒），结果中的上游URL约24小时过期
+    task_status_terminal_ttl: int = 3600
+
+    # 后台任务队列配置
+    job_queue_workers: int = 4
+    job_visibility_timeout: int = 300
+    job_max_attempts: int = 5
+    # 各类任务向上游提交的速率上限（次/秒）
+    job_rate_limits: dict = {"video_create": 5.0, "visual_submit": 2.0}
+
+    # 图片预处理配置（binary_data_base64 图片提交上游前缩放、重新编码）
+    image_preprocess_enabled: bool = True
+    image_preprocess_workers: int = 2
+    # 默认最大边长，视觉服务接口分辨率上限为 4096×4096
+    image_max_side: int = 4096
+    # 按 req_key 前缀覆盖最大边长
+    image_max_side_overrides: dict = {"jimeng_imitator": 2048}
+
+    # 驱动视频规范化配置（需要安装 ffmpeg）
+    video_transcode_enabled: bool = True
+    video_transcode_concurrency: int = 2
+    video_transcode_timeout: int = 600
+
+    # 语音合成配置
+    tts_resource_id: str = "seed-tts-1.0"
+    tts_cache_max_bytes: int = 1024 * 1024 * 1024
+
     class Config:
         env_file = ".env"
         case_sensitive = False
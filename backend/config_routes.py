@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy import select, func as sql_func
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
@@ -11,6 +11,7 @@ from schemas import (
     MessageResponse
 )
 from auth import get_current_active_user, User
+from http_cache import json_response
 
 router = APIRouter(
     prefix="/api/configs",
@@ -58,6 +59,7 @@ async def create_config(
 
 @router.get("/", response_model=SystemConfigListResponse)
 async def get_configs(
+    request: Request,
     category: Optional[str] = None,
     is_active: Optional[bool] = None,
     skip: int = 0,
@@ -67,7 +69,7 @@ async def get_configs(
 ):
     """
     获取系统配置列表
-    可以按分类和启用状态筛选
+    可以按分类和启用状态筛选，支持 If-None-Match 条件请求
     """
     query = select(SystemConfig)
     
@@ -92,7 +94,7 @@ async def get_configs(
     result = await db.execute(query)
     configs = result.scalars().all()
     
-    return SystemConfigListResponse(configs=configs, total=total)
+    return json_response(request, SystemConfigListResponse(configs=configs, total=total))
 
 @router.get("/{config_id}", response_model=SystemConfigResponse)
 async def get_config(
@@ -197,6 +199,7 @@ async def delete_config(
 @router.get("/category/{category}", response_model=SystemConfigListResponse)
 async def get_configs_by_category(
     category: str,
+    request: Request,
     is_active: Optional[bool] = True,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
@@ -223,5 +226,5 @@ async def get_configs_by_category(
     result = await db.execute(query.order_by(SystemConfig.config_key))
     configs = result.scalars().all()
     
-    return SystemConfigListResponse(configs=configs, total=total)
+    return json_response(request, SystemConfigListResponse(configs=configs, total=total))
 
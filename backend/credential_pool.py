@@ -0,0 +1,399 @@
+"""
+服务端凭证池
+单个方舟 API Key 或火山引擎 AK/SK 有 QPS 和并发上限，团队共用时很快触顶。
+凭证池在系统配置中登记多个密钥，按各密钥当前的并发占用和剩余速率额度分配调用：
+
+- 方舟: 系统配置 volcano_ark_key_pool，
+  JSON 数组 [{"id": "key-1", "api_key": "...", "qps": 5, "concurrency": 10}]
+- 视觉服务/向量化: 系统配置 volcano_engine_credential_pool，
+  JSON 数组 [{"id": "ak-1", "access_key_id": "...", "secret_access_key": "...", "qps": 2, "concurrency": 2}]
+
+客户端以 pool:<登录令牌> 代替自己的 API Key / Access Key ID 即使用凭证池（Secret Access Key 可为任意值），
+只有配置 credential_pool_users 中列出的用户可以使用。
+返回限流错误的密钥暂时摘除（连续限流时摘除时间加倍），提交请求换用其他密钥重试；
+异步任务的查询和删除固定使用提交该任务的密钥。
+"""
+import json
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable, Set
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from config import settings
+from database import async_session_maker, SystemConfig, CredentialBinding
+from auth import SECRET_KEY, ALGORITHM
+
+POOL_PREFIX = 'pool:'
+POOL_UNAUTHORIZED_CODE = 'POOL_UNAUTHORIZED'
+POOL_UNAVAILABLE_CODE = 'POOL_UNAVAILABLE'
+# 视觉服务的限流错误码：QPS 超限、并发超限
+_THROTTLE_CODES = ('50429', '50430')
+_MAX_BINDINGS = 4096
+
+# 后台队列和巡检执行时令牌可能已过期（入队或登记时已校验），只在这些由服务端自身建立的上下文中跳过过期校验
+_trusted_execution: contextvars.ContextVar[bool] = contextvars.ContextVar('credential_pool_trusted', default=False)
+
+
+@contextmanager
+def trusted_execution():
+    """在服务端后台执行的上下文中使用凭证池（不校验令牌过期），不能由请求参数或请求头开启"""
+    token = _trusted_execution.set(True)
+    try:
+        yield
+    finally:
+        _trusted_execution.reset(token)
+
+
+def is_pool_credential(credential: Optional[str]) -> bool:
+    return bool(credential) and credential.startswith(POOL_PREFIX)
+
+
+def _token_user(credential: str, verify_exp: bool = True) -> Optional[str]:
+    try:
+        payload = jwt.decode(
+            credential[len(POOL_PREFIX):], SECRET_KEY, algorithms=[ALGORITHM],
+            options={'verify_exp': verify_exp}
+        )
+    except JWTError:
+        return None
+    return payload.get('sub')
+
+
+def pool_user(credential: str, verify_exp: bool = True) -> Optional[str]:
+    """校验凭证池令牌，返回登录用户名；令牌无效或用户不在 credential_pool_users 中时返回 None"""
+    user = _token_user(credential, verify_exp)
+    if user is None or user not in settings.credential_pool_users:
+        return None
+    return user
+
+
+def credential_owner(credential: str) -> str:
+    """凭证的归属标识：凭证池令牌按登录用户归属，令牌续期后仍是同一归属"""
+    if is_pool_credential(credential):
+        user = _token_user(credential, verify_exp=False)
+        if user:
+            return f"{POOL_PREFIX}{user}"
+    return credential
+
+
+def _is_throttled(result: Dict[str, Any]) -> bool:
+    if result.get('success'):
+        data = result.get('data')
+        # 视觉服务查询接口把错误放在 data 中返回
+        return isinstance(data, dict) and str(data.get('error_code')) in _THROTTLE_CODES
+    error = result.get('error') or {}
+    if not isinstance(error, dict):
+        return False
+    return 'HTTP 429' in str(error.get('message', '')) or str(error.get('code')) in _THROTTLE_CODES
+
+
+def _error(message: str, code: str) -> Dict[str, Any]:
+    return {'success': False, 'error': {'message': message, 'code': code}}
+
+
+class _PooledKey:
+    """凭证池中的一个密钥及其负载状态"""
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.id = str(entry['id'])
+        self.secrets: Dict[str, str] = {}
+        self.qps = 1.0
+        self.concurrency = 1
+        self.update(entry)
+        self.tokens = self.qps
+        self.refilled = time.monotonic()
+        self.in_flight = 0
+        self.ejected_until = 0.0
+        self.consecutive_throttles = 0
+        self.calls = 0
+        self.throttled = 0
+
+    def update(self, entry: Dict[str, Any]):
+        self.secrets = {k: v for k, v in entry.items() if k not in ('id', 'qps', 'concurrency')}
+        self.qps = float(entry.get('qps') or settings.credential_pool_default_qps)
+        self.concurrency = int(entry.get('concurrency') or settings.credential_pool_default_concurrency)
+
+    def refill(self, now: float):
+        # 令牌桶，突发量为 1 秒的额度
+        self.tokens = min(max(self.qps, 1.0), self.tokens + (now - self.refilled) * self.qps)
+        self.refilled = now
+
+    def wait_time(self, now: float) -> Optional[float]:
+        """距离可用的时间；0 表示立即可用，None 表示需等待其他调用结束"""
+        if now < self.ejected_until:
+            return self.ejected_until - now
+        if self.in_flight >= self.concurrency:
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.qps
+        return 0.0
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        self.refill(now)
+        return {
+            'id': self.id,
+            'in_flight': self.in_flight,
+            'concurrency': self.concurrency,
+            'qps': self.qps,
+            'tokens': round(self.tokens, 2),
+            'ejected_for': round(self.ejected_until - now, 1) if now < self.ejected_until else None,
+            'calls': self.calls,
+            'throttled': self.throttled
+        }
+
+
+class CredentialPool:
+    """一组可互换的上游凭证"""
+
+    def __init__(self, name: str, config_key: str, required_fields: Tuple[str, ...]):
+        self.name = name
+        self.config_key = config_key
+        self.required_fields = required_fields
+        self._keys: "OrderedDict[str, _PooledKey]" = OrderedDict()
+        self._loaded_at = 0.0
+        # 有调用结束时触发，在首次使用时创建以绑定到运行中的事件循环
+        self._changed: Optional[asyncio.Event] = None
+        self._bindings: "OrderedDict[str, str]" = OrderedDict()
+
+    async def _refresh(self):
+        if time.monotonic() - self._loaded_at < settings.credential_pool_refresh_seconds:
+            return
+        self._loaded_at = time.monotonic()
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(SystemConfig.config_value).where(
+                    SystemConfig.config_key == self.config_key,
+                    SystemConfig.is_active.is_(True)
+                )
+            )
+            raw = result.scalar_one_or_none()
+        try:
+            entries = json.loads(raw) if raw else []
+        except json.JSONDecodeError:
+            print(f"⚠️ 凭证池配置不是合法的JSON: {self.config_key}")
+            entries = []
+
+        keys: "OrderedDict[str, _PooledKey]" = OrderedDict()
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or 'id' not in entry or not all(entry.get(f) for f in self.required_fields):
+                print(f"⚠️ 忽略缺少字段的凭证: {self.config_key} {entry.get('id') if isinstance(entry, dict) else entry}")
+                continue
+            # 已有密钥保留负载状态
+            key = self._keys.get(str(entry['id']))
+            if key is None:
+                key = _PooledKey(entry)
+            else:
+                key.update(entry)
+            keys[key.id] = key
+        self._keys = keys
+
+    def _changed_event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _notify(self):
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def _pick(self, candidates: List[_PooledKey]) -> Tuple[Optional[_PooledKey], Optional[float]]:
+        """选出并发占用比例最低、剩余额度最多的可用密钥；都不可用时返回最短等待时间"""
+        now = time.monotonic()
+        best = None
+        wait = None
+        for key in candidates:
+            key.refill(now)
+            key_wait = key.wait_time(now)
+            if key_wait == 0.0:
+                score = (key.in_flight / key.concurrency, -key.tokens / max(key.qps, 1.0))
+                if best is None or score < best[0]:
+                    best = (score, key)
+            elif key_wait is not None:
+                wait = key_wait if wait is None else min(wait, key_wait)
+        if best is not None:
+            return best[1], None
+        return None, wait
+
+    async def lease(self, sticky_id: Optional[str], exclude: Set[str]) -> Optional[_PooledKey]:
+        """
+        租用一个密钥，没有可用密钥时等待
+
+        Returns:
+            密钥；凭证池为空或可选密钥都已排除时返回 None
+        """
+        while True:
+            await self._refresh()
+            if sticky_id is not None and sticky_id in self._keys:
+                candidates = [self._keys[sticky_id]]
+            else:
+                candidates = [key for key in self._keys.values() if key.id not in exclude]
+            if not candidates:
+                return None
+            key, wait = self._pick(candidates)
+            if key is not None:
+                key.in_flight += 1
+                key.tokens -= 1
+                key.calls += 1
+                return key
+            changed = self._changed_event()
+            try:
+                # 等到最早可用的时间，或有调用结束释放并发名额
+                await asyncio.wait_for(changed.wait(), wait if wait is not None else 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, key: _PooledKey, throttled: bool):
+        key.in_flight -= 1
+        if throttled:
+            key.throttled += 1
+            key.consecutive_throttles += 1
+            eject = min(
+                settings.credential_pool_eject_seconds * 2 ** (key.consecutive_throttles - 1),
+                settings.credential_pool_max_eject_seconds
+            )
+            key.ejected_until = time.monotonic() + eject
+            print(f"🚦 凭证被限流，暂停使用 {eject:.0f}秒: {self.name}/{key.id}")
+        else:
+            key.consecutive_throttles = 0
+        self._notify()
+
+    async def bound_key(self, task_id: str) -> Optional[str]:
+        """提交任务时使用的密钥ID"""
+        credential_id = self._bindings.get(task_id)
+        if credential_id is not None:
+            return credential_id
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(CredentialBinding.credential_id).where(
+                    CredentialBinding.task_id == task_id,
+                    CredentialBinding.pool == self.name
+                )
+            )
+            credential_id = result.scalar_one_or_none()
+        if credential_id is not None:
+            self._remember(task_id, credential_id)
+        return credential_id
+
+    async def bind(self, task_id: str, credential_id: str):
+        """记录任务由哪个密钥提交"""
+        self._remember(task_id, credential_id)
+        async with async_session_maker() as session:
+            await session.execute(
+                insert(CredentialBinding)
+                .values(task_id=task_id, pool=self.name, credential_id=credential_id)
+                .on_conflict_do_nothing(index_elements=['task_id'])
+            )
+            await session.commit()
+
+    def _remember(self, task_id: str, credential_id: str):
+        self._bindings[task_id] = credential_id
+        self._bindings.move_to_end(task_id)
+        while len(self._bindings) > _MAX_BINDINGS:
+            self._bindings.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            'keys': [key.snapshot(now) for key in self._keys.values()],
+            'in_flight': sum(key.in_flight for key in self._keys.values())
+        }
+
+
+ark_pool = CredentialPool('ark', 'volcano_ark_key_pool', ('api_key',))
+visual_pool = CredentialPool('visual', 'volcano_engine_credential_pool', ('access_key_id', 'secret_access_key'))
+
+
+def _pool_of(arguments: Dict[str, Any]) -> Optional[Tuple[CredentialPool, str]]:
+    """从服务方法的调用参数中找出凭证池令牌"""
+    if is_pool_credential(arguments.get('access_key_id')):
+        return visual_pool, arguments['access_key_id']
+    if is_pool_credential(arguments.get('api_key')):
+        return ark_pool, arguments['api_key']
+    request_data = arguments.get('request_data')
+    if isinstance(request_data, dict) and is_pool_credential(request_data.get('apiKey')):
+        return ark_pool, request_data['apiKey']
+    return None
+
+
+def _apply(arguments: Dict[str, Any], key: _PooledKey):
+    """把调用参数中的凭证池令牌替换为租用到的密钥"""
+    if 'access_key_id' in key.secrets:
+        arguments['access_key_id'] = key.secrets['access_key_id']
+        arguments['secret_access_key'] = key.secrets['secret_access_key']
+    elif 'api_key' in arguments:
+        arguments['api_key'] = key.secrets['api_key']
+    else:
+        arguments['request_data'] = {**arguments['request_data'], 'apiKey': key.secrets['api_key']}
+
+
+def task_id_of(arguments: Dict[str, Any]) -> Optional[str]:
+    request_data = arguments.get('request_data')
+    if arguments.get('task_id'):
+        return arguments['task_id']
+    if isinstance(request_data, dict) and request_data.get('task_id'):
+        return request_data['task_id']
+    return None
+
+
+def submitted_task_id(result: Dict[str, Any]) -> Optional[str]:
+    data = result.get('data') if result.get('success') else None
+    if isinstance(data, dict):
+        return data.get('task_id') or data.get('id')
+    return None
+
+
+def uses_pool(arguments: Dict[str, Any]) -> bool:
+    return _pool_of(arguments) is not None
+
+
+async def call_with_pool(arguments: Dict[str, Any],
+                         invoke: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    使用凭证池中的密钥执行一次服务调用
+
+    令牌过期校验只在 trusted_execution() 上下文中跳过（后台队列和巡检）
+
+    Args:
+        arguments: 服务方法的调用参数，凭证池令牌会被替换为租用到的密钥
+        invoke: 按替换后的参数执行调用
+    """
+    pool, credential = _pool_of(arguments)
+    if pool_user(credential, verify_exp=not _trusted_execution.get()) is None:
+        return _error('凭证池访问令牌无效、已过期或无权使用凭证池', POOL_UNAUTHORIZED_CODE)
+
+    task_id = task_id_of(arguments)
+    sticky_id = await pool.bound_key(task_id) if task_id else None
+    tried: Set[str] = set()
+    result = None
+    for _ in range(settings.credential_pool_max_attempts):
+        key = await pool.lease(sticky_id, tried)
+        if key is None:
+            break
+        tried.add(key.id)
+        _apply(arguments, key)
+        throttled = False
+        try:
+            result = await invoke()
+            throttled = _is_throttled(result)
+        finally:
+            pool.release(key, throttled)
+
+        submitted = submitted_task_id(result) if task_id is None else None
+        if submitted:
+            await pool.bind(submitted, key.id)
+        # 限流的提交请求未被上游接受，换用其他密钥重试；固定密钥的查询不重试
+        if not throttled or sticky_id is not None:
+            return result
+
+    if result is not None:
+        return result
+    return _error(f'凭证池 {pool.name} 没有可用的密钥', POOL_UNAVAILABLE_CODE)
+
+
+def stats() -> Dict[str, Any]:
+    return {'ark': ark_pool.stats(), 'visual': visual_pool.stats()}
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Float, Index, UniqueConstraint, func
 import os
 
 # 数据库文件路径
@@ -57,6 +57,129 @@ class SystemConfig(Base):
     def __repr__(self):
         return f"<SystemConfig(id={self.id}, key={self.config_key}, category={self.category})>"
 
+# 生成任务模型
+class Task(Base):
+    __tablename__ = "tasks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, nullable=False, comment="任务来源: ark(方舟视频), visual(视觉服务)")
+    task_id = Column(String, nullable=False, comment="上游任务ID")
+    owner = Column(String, nullable=False, comment="任务归属，凭证指纹")
+    req_key = Column(String, nullable=True, comment="视觉服务 req_key 或方舟模型ID")
+    action = Column(String, nullable=True, comment="视觉服务 Action")
+    status = Column(String, nullable=False, comment="任务状态")
+    request_data = Column(Text, nullable=True, comment="提交参数(JSON，不含base64数据)")
+    result_data = Column(Text, nullable=True, comment="最近一次查询结果(JSON)")
+    status_history = Column(Text, nullable=True, comment="状态变更记录(JSON)")
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("provider", "task_id", name="uq_tasks_provider_task_id"),
+        Index("ix_tasks_owner_created_at", "owner", "created_at", "id"),
+        Index("ix_tasks_status", "status"),
+        Index("ix_tasks_req_key", "req_key"),
+    )
+    
+    def __repr__(self):
+        return f"<Task(id={self.id}, provider={self.provider}, task_id={self.task_id}, status={self.status})>"
+
+# 后台任务队列模型
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True, comment="任务ID")
+    kind = Column(String, nullable=False, comment="任务类型: video_create, visual_submit")
+    owner = Column(String, nullable=False, comment="任务归属，凭证指纹")
+    status = Column(String, nullable=False, default="pending", comment="状态: pending, running, succeeded, dead")
+    payload = Column(Text, nullable=False, comment="任务参数(JSON)")
+    credentials = Column(Text, nullable=True, comment="加密的调用凭证，任务结束（成功或死信）后清除")
+    attempts = Column(Integer, nullable=False, default=0, comment="已投递次数")
+    max_attempts = Column(Integer, nullable=False, default=5, comment="最大投递次数")
+    visible_at = Column(Float, nullable=False, comment="可被领取的时间(Unix时间戳)")
+    result = Column(Text, nullable=True, comment="执行结果(JSON)")
+    error = Column(Text, nullable=True, comment="最近一次错误")
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_jobs_status_visible_at", "status", "visible_at"),
+        Index("ix_jobs_owner", "owner"),
+    )
+    
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind={self.kind}, status={self.status}, attempts={self.attempts})>"
+
+# 断点续传上传会话模型
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True, comment="上传会话ID")
+    owner = Column(String, nullable=False, comment="上传归属，凭证指纹")
+    bucket = Column(String, nullable=False, comment="TOS Bucket")
+    region = Column(String, nullable=False, comment="TOS区域")
+    object_key = Column(String, nullable=False, comment="TOS对象键")
+    tos_upload_id = Column(String, nullable=False, comment="TOS分片上传ID")
+    filename = Column(String, nullable=True, comment="原始文件名")
+    content_type = Column(String, nullable=True, comment="文件内容类型")
+    size = Column(Integer, nullable=False, comment="文件总字节数")
+    part_size = Column(Integer, nullable=False, comment="分片大小（最后一片可以更小）")
+    part_count = Column(Integer, nullable=False, comment="分片数")
+    status = Column(String, nullable=False, default="uploading", comment="状态: uploading, completing, completed, aborted")
+    url = Column(String, nullable=True, comment="上传完成后的文件URL")
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_upload_sessions_owner", "owner"),
+    )
+    
+    def __repr__(self):
+        return f"<UploadSession(id={self.id}, object_key={self.object_key}, status={self.status})>"
+
+# 已上传分片模型
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, nullable=False, comment="上传会话ID")
+    part_number = Column(Integer, nullable=False, comment="分片序号，从1开始")
+    size = Column(Integer, nullable=False, comment="分片字节数")
+    sha256 = Column(String, nullable=False, comment="分片SHA256")
+    etag = Column(String, nullable=False, comment="TOS返回的分片ETag")
+    created_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("session_id", "part_number", name="uq_upload_parts_session_part"),
+    )
+    
+    def __repr__(self):
+        return f"<UploadPart(session_id={self.session_id}, part_number={self.part_number}, size={self.size})>"
+
+# 凭证池任务绑定模型（任务查询固定使用提交任务的密钥）
+class CredentialBinding(Base):
+    __tablename__ = "credential_bindings"
+    
+    task_id = Column(String, primary_key=True, comment="上游任务ID")
+    pool = Column(String, nullable=False, comment="凭证池: ark, visual")
+    credential_id = Column(String, nullable=False, comment="提交任务的凭证ID")
+    created_at = Column(DateTime, server_default=func.now())
+    
+    def __repr__(self):
+        return f"<CredentialBinding(task_id={self.task_id}, pool={self.pool}, credential_id={self.credential_id})>"
+
+# 任务端点绑定模型（服务配置了多个区域端点时，任务查询固定发往提交任务的端点）
+class EndpointBinding(Base):
+    __tablename__ = "endpoint_bindings"
+    
+    service = Column(String, primary_key=True, comment="上游服务: ark, visual")
+    task_id = Column(String, primary_key=True, comment="上游任务ID")
+    url = Column(String, nullable=False, comment="提交任务的端点URL")
+    created_at = Column(DateTime, server_default=func.now())
+    
+    def __repr__(self):
+        return f"<EndpointBinding(service={self.service}, task_id={self.task_id}, url={self.url})>"
+
 # 数据库初始化
 async def init_db():
     async with engine.begin() as conn:
@@ -0,0 +1,179 @@
+"""
+请求截止时间
+每个请求有一个时间预算：客户端通过 X-Request-Timeout（秒）指定愿意等待的时间，
+未指定时使用路由的默认预算（settings.request_budgets）。预算在请求上下文中传递，
+上游调用的连接、读取和连接池等待超时都不超过剩余预算，预算耗尽后不再发起上游调用。
+
+客户端断开连接后，仍在执行的请求处理（包括正在进行的上游调用）会被取消。
+响应头 Server-Timing 中带有请求的预算和响应开始时的剩余预算。
+"""
+import time
+import asyncio
+import contextvars
+from typing import Dict, Any, Optional
+import httpx
+from starlette.routing import Match
+from config import settings
+
+DEADLINE_EXCEEDED_CODE = 'DEADLINE_EXCEEDED'
+# 判断超时是否由预算耗尽引起的容差（秒）
+_EXPIRY_TOLERANCE = 0.05
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('request_deadline', default=None)
+_stats = {'disconnected': 0, 'exceeded': 0}
+
+
+def remaining() -> Optional[float]:
+    """当前请求的剩余预算（秒），没有截止时间时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= _EXPIRY_TOLERANCE
+
+
+def bounded(seconds: float, reserve: float = 0.0) -> float:
+    """把等待时间限制在剩余预算内，并为之后的上游调用预留 reserve 秒"""
+    left = remaining()
+    if left is None:
+        return seconds
+    return max(0.0, min(seconds, left - reserve))
+
+
+def timeout(read: float, connect: float = 10.0) -> httpx.Timeout:
+    """
+    上游调用的超时，各项都不超过剩余预算
+
+    Args:
+        read: 没有截止时间时的读取/写入/连接池等待超时
+        connect: 没有截止时间时的连接超时
+    """
+    left = remaining()
+    if left is not None:
+        left = max(left, _EXPIRY_TOLERANCE)
+        read, connect = min(read, left), min(connect, left)
+    return httpx.Timeout(read, connect=connect)
+
+
+def deadline_exceeded_result() -> Dict[str, Any]:
+    """预算耗尽时返回的 VolcanoAPIService 风格结果"""
+    _stats['exceeded'] += 1
+    return {
+        'success': False,
+        'error': {
+            'message': '请求已超过截止时间',
+            'code': DEADLINE_EXCEEDED_CODE
+        }
+    }
+
+
+def _route_budget(app, scope) -> Optional[float]:
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return settings.request_budgets.get(getattr(route, 'path', None))
+    return None
+
+
+def _client_budget(scope) -> Optional[float]:
+    for name, value in scope.get('headers', []):
+        if name == b'x-request-timeout':
+            try:
+                budget = float(value.decode('latin-1'))
+            except ValueError:
+                return None
+            return min(budget, settings.request_timeout_max) if budget > 0 else None
+    return None
+
+
+class DeadlineMiddleware:
+    """设置请求截止时间，并在客户端断开时取消请求处理"""
+
+    def __init__(self, app, router_app=None):
+        self.app = app
+        # 用于匹配路由默认预算的应用（中间件链最内层的 FastAPI 应用）
+        self.router_app = router_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        budget = _client_budget(scope)
+        if budget is None and self.router_app is not None:
+            budget = _route_budget(self.router_app, scope)
+        started = time.monotonic()
+        token = _deadline.set(started + budget if budget is not None else None)
+
+        # 预读请求消息：最多缓冲一条，请求体读完后继续等待 http.disconnect
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+        disconnected = asyncio.Event()
+        # 响应发送完毕后的断开是正常结束，不取消后续处理（如后台任务）
+        response_done = False
+
+        async def pump():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+                await messages.put(message)
+
+        async def wrapped_receive():
+            if not messages.empty():
+                return messages.get_nowait()
+            getter = asyncio.ensure_future(messages.get())
+            waiter = asyncio.ensure_future(disconnected.wait())
+            try:
+                await asyncio.wait({getter, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+                if not getter.done():
+                    getter.cancel()
+            if not getter.cancelled():
+                return getter.result()
+            return {'type': 'http.disconnect'}
+
+        async def timed_send(message):
+            nonlocal response_done
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                response_done = True
+            if message['type'] == 'http.response.start' and budget is not None:
+                left = max(0.0, started + budget - time.monotonic())
+                headers = list(message.get('headers', []))
+                headers.append((
+                    b'server-timing',
+                    f"budget;dur={budget * 1000:.0f}, remaining;dur={left * 1000:.0f}".encode('latin-1')
+                ))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            pump_task = asyncio.ensure_future(pump())
+            app_task = asyncio.ensure_future(self.app(scope, wrapped_receive, timed_send))
+        finally:
+            _deadline.reset(token)
+        disconnect_task = asyncio.ensure_future(disconnected.wait())
+        try:
+            await asyncio.wait({app_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not app_task.done() and not response_done:
+                _stats['disconnected'] += 1
+                print(f"🚫 客户端已断开，取消请求处理: {scope['method']} {scope['path']}")
+                app_task.cancel()
+                try:
+                    await app_task
+                except asyncio.CancelledError:
+                    pass
+                return
+            await app_task
+        finally:
+            for task in (app_task, pump_task, disconnect_task):
+                task.cancel()
+
+
+def stats() -> Dict[str, Any]:
+    return dict(_stats)
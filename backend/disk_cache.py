@@ -0,0 +1,213 @@
+"""
+本地磁盘缓存
+以键（通常是内容哈希）寻址的文件缓存，按总字节数和存活时间做 LRU 淘汰
+"""
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+_KEY_PATTERN = re.compile(r'^[0-9A-Za-z_-]{8,128}$')
+
+
+class DiskCache:
+    """磁盘 LRU 缓存类"""
+
+    def __init__(self, root: str, max_bytes: int, max_age: Optional[float] = None):
+        """
+        初始化磁盘缓存
+
+        Args:
+            root: 缓存根目录
+            max_bytes: 缓存总字节数上限
+            max_age: 条目最长存活秒数，None 表示不过期
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """启动时扫描磁盘，按修改时间重建 LRU 顺序"""
+        found = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard == 'tmp' or not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith('.json') or not _KEY_PATTERN.match(name):
+                    continue
+                stat = os.stat(os.path.join(shard_dir, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+
+        for mtime, key, size in sorted(found):
+            self._entries[key] = {
+                'size': size,
+                'created': mtime,
+                'accessed': mtime,
+                'meta': self._read_meta(key)
+            }
+            self._total_bytes += size
+
+        # 清理上次异常退出留下的临时文件
+        tmp_dir = os.path.join(self.root, 'tmp')
+        for name in os.listdir(tmp_dir):
+            try:
+                os.remove(os.path.join(tmp_dir, name))
+            except OSError:
+                pass
+
+    def _check_key(self, key: str):
+        if not _KEY_PATTERN.match(key):
+            raise ValueError(f"非法的缓存键: {key}")
+
+    def path(self, key: str) -> str:
+        """获取缓存条目的数据文件路径"""
+        self._check_key(key)
+        return os.path.join(self.root, key[:2], key)
+
+    def _meta_path(self, key: str) -> str:
+        return self.path(key) + '.json'
+
+    def _read_meta(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def new_temp_path(self) -> str:
+        """获取一个临时文件路径，写完后通过 put_file 放入缓存"""
+        return os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.max_age is not None and now - entry['created'] > self.max_age
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存条目并刷新其 LRU 位置
+
+        Returns:
+            命中时返回 {'path', 'size', 'meta'}，未命中或已过期返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry, now):
+                self.misses += 1
+                if entry is not None:
+                    self._remove_locked(key)
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            # 同步刷新 mtime，重启后仍能保持 LRU 顺序（间隔一分钟以上才写一次）
+            if now - entry['accessed'] > 60:
+                try:
+                    os.utime(self.path(key), (now, now))
+                except OSError:
+                    pass
+            entry['accessed'] = now
+            return {'path': self.path(key), 'size': entry['size'], 'meta': entry['meta']}
+
+    def contains(self, key: str) -> bool:
+        """检查键是否存在（不影响命中统计和 LRU 顺序）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry, time.time())
+
+    def put_file(self, key: str, src_path: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        把已写好的文件（通常来自 new_temp_path）移动到缓存中
+
+        Args:
+            key: 缓存键
+            src_path: 源文件路径，与缓存目录需在同一文件系统
+            meta: 随条目保存的元数据（如 content_type）
+        """
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        meta = meta or {}
+        with open(self._meta_path(key), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(src_path, dest)
+
+        size = os.path.getsize(dest)
+        now = time.time()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old['size']
+            self._entries[key] = {'size': size, 'created': now, 'accessed': now, 'meta': meta}
+            self._total_bytes += size
+            self._evict_locked(keep=key)
+        return {'path': dest, 'size': size, 'meta': meta}
+
+    def put_bytes(self, key: str, data: bytes, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """写入一段字节数据到缓存"""
+        tmp_path = self.new_temp_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self.put_file(key, tmp_path, meta)
+
+    def delete(self, key: str):
+        """删除缓存条目"""
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry['size']
+        for path in (self.path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict_locked(self, keep: Optional[str] = None):
+        """先淘汰过期条目，再按 LRU 顺序淘汰到字节上限以内"""
+        now = time.time()
+        if self.max_age is not None:
+            for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                self._remove_locked(key)
+
+        while self._total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(key)
+                continue
+            self._remove_locked(key)
+
+    def evict(self):
+        """手动触发一次淘汰"""
+        with self._lock:
+            self._evict_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,226 @@
+"""
+上游服务端点注册表
+每个上游服务（方舟、视觉服务、向量化、语音合成）可在 settings.service_endpoints 中配置多个区域的端点，
+后台定期探测各端点的延迟和可用性，每次调用选择延迟最低的健康端点：
+
+- 探测返回 5xx、超时或连接失败的端点视为不健康；所在主机熔断中的端点同样跳过
+- 新端点的延迟需低于当前端点一定比例（endpoint_switch_margin）才切换，避免来回抖动
+- 异步任务的查询和删除固定发往提交该任务的端点（任务只存在于提交的区域）
+"""
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from typing import Dict, Any, Optional, List
+import httpx
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from config import settings
+from database import async_session_maker, EndpointBinding
+from circuit_breaker import circuit_breakers
+
+# 探测延迟的指数加权平均系数
+_EWMA_ALPHA = 0.3
+_MAX_BINDINGS = 4096
+
+
+class Endpoint:
+    """一个区域的服务端点"""
+
+    def __init__(self, service: str, url: str, region: str):
+        self.service = service
+        self.url = url.rstrip('/')
+        self.region = region
+        self.host = urlparse(self.url).hostname or self.url
+        # 未探测前视为健康，延迟未知
+        self.healthy = True
+        self.latency: Optional[float] = None
+        self.probed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def available(self) -> bool:
+        return self.healthy and circuit_breakers.host_state(self.host) != 'open'
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'region': self.region,
+            'healthy': self.healthy,
+            'available': self.available(),
+            'latency_ms': None if self.latency is None else round(self.latency * 1000, 1),
+            'probed_ago': None if self.probed_at is None else round(time.monotonic() - self.probed_at, 1),
+            'last_error': self.last_error
+        }
+
+
+_current: contextvars.ContextVar[Optional[Endpoint]] = contextvars.ContextVar('upstream_endpoint', default=None)
+
+
+class EndpointRegistry:
+    """按服务管理端点，选择延迟最低的健康端点"""
+
+    def __init__(self, config: Dict[str, List[Dict[str, str]]]):
+        self._services: Dict[str, List[Endpoint]] = {
+            service: [Endpoint(service, entry['url'], entry.get('region', '')) for entry in entries]
+            for service, entries in config.items()
+        }
+        self._selected: Dict[str, Endpoint] = {}
+        self._bindings: "OrderedDict[str, str]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def endpoints(self, service: str) -> List[Endpoint]:
+        endpoints = self._services.get(service)
+        if not endpoints:
+            raise ValueError(f"未配置服务端点: {service}")
+        return endpoints
+
+    def select(self, service: str) -> Endpoint:
+        """选择延迟最低的可用端点；都不可用时使用第一个端点"""
+        endpoints = self.endpoints(service)
+        current = self._selected.get(service)
+        candidates = [e for e in endpoints if e.available()]
+        if not candidates:
+            return current or endpoints[0]
+        best = min(candidates, key=lambda e: (e.latency is None, e.latency or 0.0))
+        if (current is not None and current is not best and current.available()
+                and current.latency is not None and best.latency is not None
+                and best.latency > current.latency * (1 - settings.endpoint_switch_margin)):
+            # 差距不大时保持当前端点
+            best = current
+        if best is not current:
+            if current is not None:
+                print(f"🌐 切换服务端点: {service} {current.url} -> {best.url}")
+            self._selected[service] = best
+        return best
+
+    def current(self, service: str) -> Endpoint:
+        """当前调用使用的端点（由 using 指定），未指定时按延迟选择"""
+        endpoint = _current.get()
+        if endpoint is not None and endpoint.service == service:
+            return endpoint
+        return self.select(service)
+
+    @contextmanager
+    def using(self, endpoint: Endpoint):
+        """在当前上下文中固定使用指定端点"""
+        token = _current.set(endpoint)
+        try:
+            yield endpoint
+        finally:
+            _current.reset(token)
+
+    async def resolve(self, service: str, task_id: Optional[str] = None) -> Endpoint:
+        """选择本次调用的端点；task_id 对应的任务已绑定端点时使用该端点"""
+        endpoints = self.endpoints(service)
+        if task_id and len(endpoints) > 1:
+            url = await self._bound_url(service, task_id)
+            for endpoint in endpoints:
+                if endpoint.url == url:
+                    return endpoint
+        return self.select(service)
+
+    async def _bound_url(self, service: str, task_id: str) -> Optional[str]:
+        cache_key = f"{service}:{task_id}"
+        url = self._bindings.get(cache_key)
+        if url is not None:
+            return url
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(EndpointBinding.url).where(
+                    EndpointBinding.task_id == task_id,
+                    EndpointBinding.service == service
+                )
+            )
+            url = result.scalar_one_or_none()
+        if url is not None:
+            self._remember(cache_key, url)
+        return url
+
+    async def bind(self, endpoint: Endpoint, task_id: str):
+        """记录任务提交到的端点；服务只有一个端点时不需要记录"""
+        if len(self.endpoints(endpoint.service)) < 2:
+            return
+        self._remember(f"{endpoint.service}:{task_id}", endpoint.url)
+        async with async_session_maker() as session:
+            await session.execute(
+                insert(EndpointBinding)
+                .values(task_id=task_id, service=endpoint.service, url=endpoint.url)
+                .on_conflict_do_nothing(index_elements=['service', 'task_id'])
+            )
+            await session.commit()
+
+    def _remember(self, cache_key: str, url: str):
+        self._bindings[cache_key] = url
+        self._bindings.move_to_end(cache_key)
+        while len(self._bindings) > _MAX_BINDINGS:
+            self._bindings.popitem(last=False)
+
+    async def _probe(self, client: httpx.AsyncClient, endpoint: Endpoint):
+        """请求端点根路径，任何非 5xx 响应都说明端点可达"""
+        started = time.monotonic()
+        try:
+            response = await client.get(endpoint.url + '/')
+            elapsed = time.monotonic() - started
+            healthy = response.status_code < 500
+            endpoint.last_error = None if healthy else f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            elapsed = time.monotonic() - started
+            healthy = False
+            endpoint.last_error = f"{type(e).__name__}: {str(e)}"
+
+        if healthy:
+            endpoint.latency = elapsed if endpoint.latency is None else (
+                _EWMA_ALPHA * elapsed + (1 - _EWMA_ALPHA) * endpoint.latency
+            )
+        elif endpoint.healthy:
+            print(f"⚠️ 服务端点探测失败: {endpoint.service} {endpoint.url} {endpoint.last_error}")
+        endpoint.healthy = healthy
+        endpoint.probed_at = time.monotonic()
+
+    async def probe_all(self):
+        """探测全部端点"""
+        timeout = httpx.Timeout(settings.endpoint_probe_timeout)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            await asyncio.gather(*(
+                self._probe(client, endpoint)
+                for endpoints in self._services.values()
+                for endpoint in endpoints
+            ))
+        for service in self._services:
+            self.select(service)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                print(f"❌ 服务端点探测异常: {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(settings.endpoint_probe_interval)
+
+    def start(self):
+        """启动后台探测（只有一个端点的服务也探测，用于健康检查展示）"""
+        if self._task is None and settings.endpoint_probe_interval > 0:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            service: {
+                'selected': self.select(service).url,
+                'endpoints': [e.snapshot() for e in endpoints]
+            }
+            for service, endpoints in self._services.items()
+        }
+
+
+endpoint_registry = EndpointRegistry(settings.service_endpoints)
@@ -0,0 +1,110 @@
+"""
+本地文件响应工具
+为磁盘缓存中的文件提供支持 Range 请求和 If-None-Match 条件请求的 HTTP 响应
+"""
+import os
+import re
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from typing import Dict, Optional, Tuple
+from http_cache import file_etag, not_modified
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# 每次从磁盘读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+
+def _parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 头
+
+    Returns:
+        (start, end) 闭区间；格式不支持时返回 None（按完整文件响应）
+
+    Raises:
+        ValueError: 范围不可满足
+    """
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+
+    start_text, end_text = match.groups()
+    if not start_text and not end_text:
+        return None
+
+    if not start_text:
+        # bytes=-N 表示最后 N 个字节
+        length = int(end_text)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start >= file_size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, file_size - 1)
+
+
+async def _iter_file_range(path: str, start: int, length: int):
+    async with await anyio.open_file(path, 'rb') as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request: Request, path: str, media_type: str,
+                         headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    返回支持 Range 的文件响应
+
+    无 Range 头时返回完整文件；有合法的单段 Range 时返回 206 和对应片段，
+    便于视频拖动进度条时只读取需要的部分。If-None-Match 与文件 ETag 一致时返回 304。
+
+    Args:
+        request: 当前请求
+        path: 文件路径
+        media_type: 内容类型
+        headers: 额外响应头
+    """
+    stat = os.stat(path)
+    file_size = stat.st_size
+    etag = file_etag(file_size, stat.st_mtime)
+    base_headers = {'Accept-Ranges': 'bytes', 'ETag': etag, **(headers or {})}
+
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=base_headers)
+
+    range_header = request.headers.get('range')
+    byte_range = None
+    if range_header:
+        try:
+            byte_range = _parse_range(range_header, file_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**base_headers, 'Content-Range': f'bytes */{file_size}'}
+            )
+
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=base_headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    return StreamingResponse(
+        _iter_file_range(path, start, length),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            **base_headers,
+            'Content-Range': f'bytes {start}-{end}/{file_size}',
+            'Content-Length': str(length)
+        }
+    )
@@ -0,0 +1,58 @@
+"""
+HTTP 条件请求工具
+为 JSON 接口和本地文件生成 ETag，请求携带的 If-None-Match 与当前 ETag 一致时返回 304，
+内容未变化的列表刷新和结果查询不再重复传输响应体。
+"""
+import json
+import hashlib
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from typing import Any, Dict, Optional
+
+# 客户端每次使用前都需向服务端确认（配合 ETag 只返回 304）
+REVALIDATE = 'private, no-cache'
+
+
+def json_etag(body: bytes) -> str:
+    """JSON 响应的弱 ETag（压缩前后的表示语义相同）"""
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def file_etag(size: int, mtime: float) -> str:
+    """本地文件的 ETag，由大小和修改时间决定"""
+    return f'"{hashlib.md5(f"{mtime}-{size}".encode("utf-8")).hexdigest()}"'
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match 是否与当前 ETag 匹配（弱比较）"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(_opaque(tag.strip()) == _opaque(etag) for tag in header.split(','))
+
+
+def json_response(request: Request, content: Any, headers: Optional[Dict[str, str]] = None,
+                  status_code: int = 200) -> Response:
+    """
+    返回带 ETag 的 JSON 响应，内容未变化时返回 304
+
+    Args:
+        request: 当前请求
+        content: 响应内容（可以是 Pydantic 模型或 ORM 对象转换后的模型）
+        headers: 额外响应头，默认要求客户端每次重新验证
+    """
+    body = json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+    etag = json_etag(body)
+    response_headers = {'ETag': etag, 'Cache-Control': REVALIDATE, **(headers or {})}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(body, status_code=status_code, media_type='application/json', headers=response_headers)
@@ -0,0 +1,192 @@
+"""
+图片预处理
+提交给视觉服务的 binary_data_base64 图片在进程池中预处理后再发往上游：
+
+- 按 EXIF 方向摆正后缩放到模型可用的最大边长，超出部分上游也会缩小，只会增加上传和处理耗时
+- 照片重新编码为 JPEG，带透明通道的图片保留为 PNG；未缩放的 JPEG 沿用原量化表，不引入额外损失
+- 只有黑白两色的蒙版（Inpainting mask）无损转为 1 位 PNG
+- 去除 EXIF / XMP 等元数据（保留 ICC 色彩配置）
+
+无需缩放、摆正或去除元数据且处理后不比原图小的图片，以及无法解码的图片原样提交
+"""
+import io
+import asyncio
+import binascii
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import settings
+import payload_offload
+
+# 照片重新编码的 JPEG 质量
+_JPEG_QUALITY = 90
+_EXIF_ORIENTATION = 0x0112
+# 防止解压炸弹
+Image.MAX_IMAGE_PIXELS = 100_000_000
+
+_executor: Optional[ProcessPoolExecutor] = None
+_stats = {'images': 0, 'processed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+
+def max_side_for(req_key: Optional[str]) -> int:
+    """模型可用的最大边长，按 req_key 前缀匹配 settings.image_max_side_overrides"""
+    for prefix, max_side in settings.image_max_side_overrides.items():
+        if req_key and req_key.startswith(prefix):
+            return max_side
+    return settings.image_max_side
+
+
+def _is_binary_mask(image: Image.Image) -> bool:
+    """只有黑白两色的灰度图视为蒙版"""
+    if image.mode not in ('1', 'L', 'LA', 'RGB', 'RGBA', 'P'):
+        return False
+    if image.mode in ('LA', 'RGBA', 'P') and image.convert('RGBA').getextrema()[3][0] < 255:
+        return False
+    colors = image.convert('RGB').getcolors(maxcolors=2)
+    return colors is not None and all(r == g == b and r in (0, 255) for _, (r, g, b) in colors)
+
+
+def _process_image(raw: bytes, max_side: int) -> Tuple[bytes, str, bool]:
+    """
+    预处理单张图片（在子进程中执行）
+
+    Returns:
+        (处理后的字节, 处理方式, 是否必须使用处理结果)；无需处理时返回原字节
+    """
+    image = Image.open(io.BytesIO(raw))
+    source_format = image.format
+    icc_profile = image.info.get('icc_profile')
+    exif = image.getexif()
+    has_metadata = bool(exif or image.info.get('xmp') or image.info.get('comment'))
+    transposed = exif.get(_EXIF_ORIENTATION, 1) != 1
+    if transposed:
+        image = ImageOps.exif_transpose(image)
+
+    resized = max(image.size) > max_side
+    # 缩放、摆正方向或去除元数据后，即使体积变大也要使用处理结果
+    required = resized or transposed or has_metadata
+    is_mask = _is_binary_mask(image)
+
+    if is_mask:
+        image = image.convert('L')
+        if resized:
+            # 蒙版用最近邻缩放，保持黑白两色
+            image.thumbnail((max_side, max_side), Image.NEAREST)
+        image = image.point(lambda v: 255 if v >= 128 else 0).convert('1')
+        output = io.BytesIO()
+        image.save(output, format='PNG', optimize=True)
+        return output.getvalue(), 'mask', required
+
+    if resized:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    elif not has_metadata and source_format == 'JPEG':
+        return raw, 'unchanged', False
+
+    output = io.BytesIO()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        image.save(output, format='PNG', optimize=True, icc_profile=icc_profile)
+        method = 'png'
+    else:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        # 未缩放的 JPEG 沿用原量化表，仅去除元数据
+        quality = 'keep' if source_format == 'JPEG' and not resized else _JPEG_QUALITY
+        try:
+            image.save(output, format='JPEG', quality=quality, optimize=True, icc_profile=icc_profile)
+        except ValueError:
+            # 摆正方向或转换色彩模式后无法沿用原量化表
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=_JPEG_QUALITY, optimize=True, icc_profile=icc_profile)
+        method = 'jpeg'
+    return output.getvalue(), method, required
+
+
+def _process_batch(images: List[bytes], max_side: int) -> List[Tuple[bytes, str]]:
+    """预处理一次提交中的全部图片（在子进程中执行）"""
+    results = []
+    for raw in images:
+        try:
+            processed, method, required = _process_image(raw, max_side)
+        except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+            processed, method, required = raw, 'unchanged', False
+        # 缩放过的图片必须使用处理结果，保证原图与蒙版尺寸一致
+        if not required and len(processed) >= len(raw):
+            processed, method = raw, 'unchanged'
+        results.append((processed, method))
+    return results
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.image_preprocess_workers)
+    return _executor
+
+
+def shutdown():
+    """关闭进程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def preprocess_base64_images(images: List[str], req_key: Optional[str] = None) -> List[str]:
+    """
+    预处理 binary_data_base64 中的图片
+
+    Args:
+        images: base64 图片列表（可带 data: 前缀）
+        req_key: 视觉服务 req_key，用于确定最大边长
+
+    Returns:
+        处理后的 base64 列表，顺序与输入一致；无法解码的项原样返回
+    """
+    if not settings.image_preprocess_enabled or not images:
+        return images
+
+    decoded: List[Optional[bytes]] = []
+    for value in images:
+        payload = value.split(',', 1)[1] if value.startswith('data:') and ',' in value else value
+        try:
+            decoded.append(await payload_offload.b64decode(payload, validate=True))
+        except (binascii.Error, ValueError):
+            decoded.append(None)
+
+    raws = [raw for raw in decoded if raw]
+    if not raws:
+        return images
+
+    loop = asyncio.get_running_loop()
+    processed = iter(await loop.run_in_executor(_get_executor(), _process_batch, raws, max_side_for(req_key)))
+
+    results = []
+    size_in = size_out = 0
+    for value, raw in zip(images, decoded):
+        if not raw:
+            results.append(value)
+            continue
+        data, method = next(processed)
+        size_in += len(raw)
+        size_out += len(data)
+        if method == 'unchanged':
+            results.append(value)
+        else:
+            _stats['processed'] += 1
+            results.append(await payload_offload.b64encode(data))
+
+    _stats['images'] += len(raws)
+    _stats['bytes_in'] += size_in
+    _stats['bytes_out'] += size_out
+    print(f"🗜️ 图片预处理: {len(raws)} 张, {size_in} -> {size_out} bytes")
+    return results
+
+
+def stats() -> Dict[str, Any]:
+    """预处理统计"""
+    saved = _stats['bytes_in'] - _stats['bytes_out']
+    return {
+        **_stats,
+        'saved_ratio': round(saved / _stats['bytes_in'], 4) if _stats['bytes_in'] else 0.0
+    }
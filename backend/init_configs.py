@@ -32,6 +32,15 @@ CONFIG_TEMPLATES = [
         "is_encrypted": False,
         "is_active": True
     },
+    {
+        "config_key": "volcano_ark_key_pool",
+        "config_value": "[]",
+        "config_type": "json",
+        "category": "volcano_ark",
+        "description": "方舟API Key凭证池，JSON数组: [{\"id\", \"api_key\", \"qps\", \"concurrency\"}]",
+        "is_encrypted": True,
+        "is_active": True
+    },
     {
         "config_key": "volcano_ark_endpoint",
         "config_value": "https://ark.cn-beijing.volces.com",
@@ -61,6 +70,15 @@ CONFIG_TEMPLATES = [
         "is_encrypted": True,
         "is_active": True
     },
+    {
+        "config_key": "volcano_engine_credential_pool",
+        "config_value": "[]",
+        "config_type": "json",
+        "category": "volcano_engine",
+        "description": "火山引擎AK/SK凭证池，JSON数组: [{\"id\", \"access_key_id\", \"secret_access_key\", \"qps\", \"concurrency\"}]",
+        "is_encrypted": True,
+        "is_active": True
+    },
     {
         "config_key": "volcano_engine_region",
         "config_value": "cn-beijing",
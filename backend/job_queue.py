@@ -0,0 +1,384 @@
+"""
+持久化后台任务队列
+提交类请求先写入 SQLite 再由后台工作协程按速率上限投递到上游，服务重启后未完成的任务会继续执行。
+
+投递语义为至少一次：任务被领取后在可见性超时内未完成（例如进程崩溃）会被重新投递，
+投递次数达到上限的任务不再执行而是进入死信状态；
+只有超时、连接错误、429 和 5xx 按指数退避重试，超过最大次数或遇到其他错误后进入死信状态。
+
+调用凭证加密保存，任务结束（成功或死信）时清除，无法解密的任务进入死信状态；
+死信任务重新入队时需要调用方再次提供凭证。
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import httpx
+from sqlalchemy import select, update, func
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Tuple
+from config import settings
+from database import async_session_maker, Job
+from upstream_scheduler import upstream_priority
+import credential_pool
+from circuit_breaker import CIRCUIT_OPEN_CODE
+from deadline import DEADLINE_EXCEEDED_CODE
+import secret_box
+
+# 任务处理函数: (payload, credentials) -> VolcanoAPIService 风格的结果 {'success', 'data' | 'error'}
+JobHandler = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+ACTIVE_STATUSES = ('pending', 'running')
+FINISHED_STATUSES = ('succeeded', 'dead')
+# 重试退避的上限（秒）
+_MAX_BACKOFF = 60
+_HTTP_STATUS_PATTERN = re.compile(r'HTTP (\d{3})')
+# 可重试的错误码：超过截止时间、凭证池暂无可用密钥、视觉服务 QPS / 并发超限
+_RETRYABLE_CODES = (DEADLINE_EXCEEDED_CODE, credential_pool.POOL_UNAVAILABLE_CODE, '50429', '50430')
+# 处理函数抛出的可重试异常
+_RETRYABLE_EXCEPTIONS = (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError, ConnectionError)
+
+
+def _is_retryable(error: Any) -> bool:
+    """
+    只有超时、连接错误、429 和 5xx 可以重试；参数错误、4xx 和处理函数中的其他异常重试也不会成功
+    """
+    if not isinstance(error, dict):
+        return False
+    if error.get('retryable') or str(error.get('code')) in _RETRYABLE_CODES:
+        return True
+    match = _HTTP_STATUS_PATTERN.search(str(error.get('message', '')))
+    if match:
+        code = int(match.group(1))
+        return code == 429 or code >= 500
+    return False
+
+
+class _Waiter:
+    """同一任务的等待者共用的完成事件"""
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.count = 0
+
+
+class _KindState:
+    """单类任务的并发与速率控制"""
+
+    def __init__(self, handler: JobHandler, concurrency: int, rate: Optional[float]):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.interval = 1.0 / rate if rate else 0.0
+        self.running = 0
+        self.next_start = 0.0
+        self.credential_fields: Tuple[str, ...] = ()
+
+    def ready(self, now: float) -> bool:
+        return self.running < self.concurrency and now >= self.next_start
+
+
+class JobQueue:
+    """基于 SQLite 的任务队列"""
+
+    def __init__(self):
+        self._kinds: Dict[str, _KindState] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._finished: Dict[str, _Waiter] = {}
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def register_handler(self, kind: str, handler: JobHandler, credential_fields: Tuple[str, ...],
+                         concurrency: int = 2):
+        """
+        注册任务处理函数
+
+        Args:
+            kind: 任务类型
+            handler: 处理函数
+            credential_fields: 处理函数需要的凭证字段，死信任务重新入队时校验
+            concurrency: 该类任务的最大并发数；速率上限取 settings.job_rate_limits
+        """
+        state = _KindState(handler, concurrency, settings.job_rate_limits.get(kind))
+        state.credential_fields = credential_fields
+        self._kinds[kind] = state
+
+    async def enqueue(self, kind: str, owner: str, payload: Dict[str, Any],
+                      credentials: Dict[str, Any]) -> str:
+        """写入一个任务，返回任务ID"""
+        if kind not in self._kinds:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        job_id = uuid.uuid4().hex
+        async with async_session_maker() as session:
+            session.add(Job(
+                id=job_id,
+                kind=kind,
+                owner=owner,
+                status='pending',
+                payload=json.dumps(payload, ensure_ascii=False),
+                credentials=secret_box.encrypt(credentials),
+                attempts=0,
+                max_attempts=settings.job_max_attempts,
+                visible_at=time.time()
+            ))
+            await session.commit()
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with async_session_maker() as session:
+            return await session.get(Job, job_id)
+
+    async def wait(self, job_id: str, timeout: float):
+        """等待任务结束（成功或进入死信），超时后直接返回"""
+        waiter = self._finished.get(job_id)
+        if waiter is None:
+            waiter = self._finished[job_id] = _Waiter()
+        waiter.count += 1
+        try:
+            job = await self.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return
+            await asyncio.wait_for(waiter.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # 最后一个等待者离开时才移除，其他等待者仍在同一个事件上等待
+            waiter.count -= 1
+            if waiter.count == 0 and self._finished.get(job_id) is waiter:
+                del self._finished[job_id]
+
+    def missing_credentials(self, kind: str, credentials: Dict[str, Any]) -> List[str]:
+        """重新入队时缺少的凭证字段"""
+        state = self._kinds.get(kind)
+        fields = state.credential_fields if state is not None else ()
+        return [field for field in fields if not credentials.get(field)]
+
+    async def requeue(self, job_id: str, credentials: Dict[str, Any]) -> bool:
+        """使用调用方重新提供的凭证把死信任务重新入队"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == 'dead')
+                .values(status='pending', attempts=0, visible_at=time.time(), error=None,
+                        credentials=secret_box.encrypt(credentials))
+            )
+            await session.commit()
+        if result.rowcount:
+            self._wakeup.set()
+        return bool(result.rowcount)
+
+    async def stats(self) -> Dict[str, Any]:
+        """各状态任务数量"""
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status)
+            )).all()
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in rows:
+            counts.setdefault(kind, {})[status] = count
+        return {
+            'counts': counts,
+            'running': {kind: state.running for kind, state in self._kinds.items()}
+        }
+
+    async def start(self):
+        """启动调度协程；上次进程退出时仍在执行的任务立即重新投递"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                update(Job).where(Job.status == 'running').values(status='pending', visible_at=time.time())
+            )
+            await session.commit()
+        if result.rowcount:
+            print(f"♻️ 重新投递上次未完成的任务: {result.rowcount} 个")
+        # 唤醒事件绑定到当前事件循环，停止后可在新的事件循环中重新启动
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    async def _dead_letter_exhausted(self, session, now: float):
+        """
+        投递次数已达上限、却因可见性超时或进程重启再次可领取的任务直接进入死信，
+        避免导致工作协程或进程崩溃的任务被无限重新投递
+        """
+        exhausted = (
+            Job.status.in_(ACTIVE_STATUSES),
+            Job.visible_at <= now,
+            Job.attempts >= Job.max_attempts,
+            Job.id.notin_(list(self._running))
+        )
+        job_ids = (await session.execute(select(Job.id).where(*exhausted))).scalars().all()
+        if not job_ids:
+            return
+        await session.execute(
+            update(Job).where(Job.id.in_(job_ids), *exhausted)
+            .values(status='dead', credentials=None, error='投递次数已达上限，上次执行未完成')
+        )
+        await session.commit()
+        for job_id in job_ids:
+            print(f"☠️ 后台任务进入死信: {job_id} 投递次数已达上限，上次执行未完成")
+            waiter = self._finished.pop(job_id, None)
+            if waiter is not None:
+                waiter.event.set()
+
+    async def _claim(self, now: float) -> Optional[Job]:
+        """领取一个可执行的任务"""
+        kinds = [kind for kind, state in self._kinds.items() if state.ready(now)]
+        if not kinds or len(self._running) >= settings.job_queue_workers:
+            return None
+        async with async_session_maker() as session:
+            await self._dead_letter_exhausted(session, now)
+            candidates = (await session.execute(
+                select(Job)
+                .where(
+                    Job.status.in_(ACTIVE_STATUSES),
+                    Job.visible_at <= now,
+                    Job.kind.in_(kinds),
+                    Job.id.notin_(list(self._running))
+                )
+                .order_by(Job.visible_at)
+                .limit(1)
+            )).scalars().all()
+            for job in candidates:
+                # 条件更新，避免与其他实例重复领取
+                result = await session.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.visible_at == job.visible_at)
+                    .values(
+                        status='running',
+                        attempts=Job.attempts + 1,
+                        visible_at=now + settings.job_visibility_timeout
+                    )
+                )
+                await session.commit()
+                if result.rowcount:
+                    await session.refresh(job)
+                    return job
+        return None
+
+    async def _next_visible_delay(self, now: float) -> Optional[float]:
+        """
+        距离下一个任务可被领取的时间
+
+        只考虑未达到并发上限的任务类型，同时计入速率限制；没有可执行的任务时返回 None
+        """
+        kinds = [kind for kind, state in self._kinds.items() if state.running < state.concurrency]
+        if not kinds:
+            return None
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(Job.kind, func.min(Job.visible_at))
+                .where(
+                    Job.status.in_(ACTIVE_STATUSES),
+                    Job.kind.in_(kinds),
+                    Job.id.notin_(list(self._running))
+                )
+                .group_by(Job.kind)
+            )).all()
+        if not rows:
+            return None
+        return min(max(visible_at, self._kinds[kind].next_start) for kind, visible_at in rows) - now
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            try:
+                job = await self._claim(now)
+            except Exception as e:
+                print(f"❌ 领取任务失败: {type(e).__name__}: {str(e)}")
+                job = None
+
+            if job is not None:
+                state = self._kinds[job.kind]
+                state.running += 1
+                state.next_start = now + state.interval
+                self._running[job.id] = asyncio.create_task(self._run(job, state))
+                continue
+
+            delay = None
+            if len(self._running) < settings.job_queue_workers:
+                try:
+                    delay = await self._next_visible_delay(now)
+                except Exception as e:
+                    print(f"❌ 查询待执行任务失败: {type(e).__name__}: {str(e)}")
+                    delay = 1.0
+            try:
+                # 有新任务入队、任务执行结束或到达下一个任务的可见时间时被唤醒
+                await asyncio.wait_for(self._wakeup.wait(), None if delay is None else max(delay, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: Job, state: _KindState):
+        try:
+            try:
+                # 队列中的提交以批量优先级调用上游，不挤占用户的交互请求
+                # 入队时已校验过凭证池令牌，执行时令牌可能已过期
+                credentials = secret_box.decrypt(job.credentials) if job.credentials else None
+                if credentials is None:
+                    result = {'success': False, 'error': {'message': '任务凭证缺失或无法解密'}}
+                else:
+                    with upstream_priority('batch'), credential_pool.trusted_execution():
+                        result = await state.handler(json.loads(job.payload), credentials)
+            except Exception as e:
+                result = {'success': False, 'error': {
+                    'message': f"{type(e).__name__}: {str(e)}",
+                    'retryable': isinstance(e, _RETRYABLE_EXCEPTIONS)
+                }}
+            await self._complete(job, result)
+        except Exception as e:
+            # 状态写回失败时任务保持 running，可见性超时后会被重新投递
+            print(f"❌ 任务状态写回失败: {job.id} {type(e).__name__}: {str(e)}")
+        finally:
+            state.running -= 1
+            self._running.pop(job.id, None)
+            self._wakeup.set()
+
+    async def _complete(self, job: Job, result: Dict[str, Any]):
+        values: Dict[str, Any]
+        if result['success']:
+            values = {
+                'status': 'succeeded',
+                'result': json.dumps(result.get('data'), ensure_ascii=False),
+                'credentials': None,
+                'error': None
+            }
+            print(f"✅ 后台任务完成: {job.kind} {job.id} (第{job.attempts}次投递)")
+        else:
+            error = result.get('error')
+            message = error.get('message') if isinstance(error, dict) else str(error)
+            if isinstance(error, dict) and error.get('code') == CIRCUIT_OPEN_CODE:
+                # 上游熔断中，调用未到达上游，不计入投递次数，等到建议的重试时间后再投递
+                values = {
+                    'status': 'pending',
+                    'attempts': job.attempts - 1,
+                    'visible_at': time.time() + error['retry_after'],
+                    'error': message
+                }
+                print(f"🔌 上游熔断，{error['retry_after']}秒后重新投递: {job.kind} {job.id}")
+            elif _is_retryable(error) and job.attempts < job.max_attempts:
+                backoff = min(_MAX_BACKOFF, 2 ** job.attempts)
+                values = {'status': 'pending', 'visible_at': time.time() + backoff, 'error': message}
+                print(f"⚠️ 后台任务失败，{backoff}秒后重试: {job.kind} {job.id} {message}")
+            else:
+                values = {'status': 'dead', 'error': message, 'credentials': None}
+                print(f"☠️ 后台任务进入死信: {job.kind} {job.id} {message}")
+
+        async with async_session_maker() as session:
+            await session.execute(update(Job).where(Job.id == job.id).values(**values))
+            await session.commit()
+
+        if values['status'] in FINISHED_STATUSES:
+            waiter = self._finished.pop(job.id, None)
+            if waiter is not None:
+                waiter.event.set()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,91 @@
+"""
+后台任务队列路由
+查询后台提交任务的执行结果，并提供死信任务重新入队与队列统计
+"""
+import json
+from fastapi import APIRouter, HTTPException, Header, Query, Depends
+from typing import Dict, Any, Optional
+from database import Job, User
+from auth import get_admin_user
+from job_queue import job_queue
+from task_routes import request_owners
+
+router = APIRouter(tags=["后台任务"])
+
+
+def _to_response(job: Job) -> Dict[str, Any]:
+    return {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at,
+        'updated_at': job.updated_at
+    }
+
+
+async def _get_owned_job(job_id: str, authorization: Optional[str], access_key_id: Optional[str],
+                         secret_access_key: Optional[str]) -> Job:
+    owners = request_owners(authorization, access_key_id, secret_access_key)
+    job = await job_queue.get(job_id)
+    if job is None or job.owner not in owners:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@router.get("/api/jobs/stats")
+async def get_job_stats(current_user: User = Depends(get_admin_user)):
+    """队列统计：各类任务各状态的数量与正在执行的数量（仅管理员）"""
+    return await job_queue.stats()
+
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: Optional[int] = Query(None, ge=0, le=60, description="长轮询等待秒数，任务结束或超时后返回"),
+    authorization: Optional[str] = Header(None),
+    x_access_key_id: Optional[str] = Header(None, alias="X-Access-Key-Id"),
+    x_secret_access_key: Optional[str] = Header(None, alias="X-Secret-Access-Key")
+):
+    """
+    查询后台任务
+
+    status 为 succeeded 时 result 为上游提交接口的返回数据（包含上游任务ID）；
+    status 为 dead 时 error 为最后一次失败原因
+    """
+    job = await _get_owned_job(job_id, authorization, x_access_key_id, x_secret_access_key)
+    if wait and job.status not in ('succeeded', 'dead'):
+        await job_queue.wait(job_id, wait)
+        job = await job_queue.get(job_id)
+    return _to_response(job)
+
+
+@router.post("/api/jobs/{job_id}/retry")
+async def retry_job(
+    job_id: str,
+    authorization: Optional[str] = Header(None),
+    x_access_key_id: Optional[str] = Header(None, alias="X-Access-Key-Id"),
+    x_secret_access_key: Optional[str] = Header(None, alias="X-Secret-Access-Key")
+):
+    """
+    把死信任务重新入队
+
+    任务进入死信状态时已清除保存的凭证，需要重新提供：
+    视频任务使用 Authorization，视觉任务使用 X-Access-Key-Id / X-Secret-Access-Key
+    """
+    job = await _get_owned_job(job_id, authorization, x_access_key_id, x_secret_access_key)
+    credentials = {
+        'api_key': authorization[7:] if authorization and authorization.startswith('Bearer ') else None,
+        'access_key_id': x_access_key_id,
+        'secret_access_key': x_secret_access_key
+    }
+    missing = job_queue.missing_credentials(job.kind, credentials)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"重新入队需要提供凭证: {', '.join(missing)}")
+    credentials = {k: v for k, v in credentials.items() if v}
+    if not await job_queue.requeue(job_id, credentials):
+        raise HTTPException(status_code=400, detail="只有死信任务可以重新入队")
+    return {'job_id': job_id, 'status': 'pending'}
@@ -0,0 +1,226 @@
+"""
+事件循环阻塞检测
+定位在事件循环中执行的同步调用（如同步 SDK 请求、密码哈希、大对象序列化）：
+
+- 延迟测量：协程按 loop_monitor_interval 定时唤醒，记录实际唤醒时间比预期晚了多少
+- 阻塞看门狗：后台线程检查定时协程是否按时唤醒，停顿超过 loop_monitor_block_threshold 时
+  按 loop_monitor_sample_interval 采集事件循环线程的调用栈，阻塞结束后按调用位置汇总并打印日志
+
+事件循环正常运行时看门狗只比较时间戳，只在阻塞期间采集调用栈，并可按 loop_monitor_sample_rate
+只对部分阻塞事件采集，适合在生产环境常开。
+持有 GIL 的 C 扩展调用（如 json.dumps）结束前看门狗线程无法运行，此时采到的是调用返回后的位置，
+通常仍在发起调用的函数中。
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+import traceback
+from collections import deque, Counter
+from typing import Dict, Any, Optional, List, Deque
+from config import settings
+
+_APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+# 每个调用位置保留的调用栈深度
+_STACK_LIMIT = 40
+_MAX_SITES = 200
+_MAX_RECENT = 50
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(_APP_ROOT) and 'site-packages' not in filename
+
+
+def _frame_label(frame: traceback.FrameSummary) -> str:
+    filename = frame.filename
+    if _is_app_frame(filename):
+        filename = os.path.relpath(filename, _APP_ROOT)
+    return f"{filename}:{frame.lineno} {frame.name}"
+
+
+def _call_site(stack: List[traceback.FrameSummary]) -> str:
+    """调用位置：最内层的本项目代码帧，没有时取最内层帧"""
+    for frame in reversed(stack):
+        if _is_app_frame(frame.filename) and frame.filename != __file__:
+            return _frame_label(frame)
+    return _frame_label(stack[-1]) if stack else 'unknown'
+
+
+class LoopMonitor:
+    """事件循环延迟测量与阻塞看门狗"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._loop_thread_id: Optional[int] = None
+        # 定时协程最近一次唤醒的时间，由事件循环线程写入、看门狗线程读取
+        self._last_tick = 0.0
+        self._lags: Deque[float] = deque(maxlen=600)
+        self._max_lag = 0.0
+        # 调用位置 -> {count, total_ms, max_ms, stack}
+        self._sites: Dict[str, Dict[str, Any]] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=_MAX_RECENT)
+        self._blocks = 0
+        self._blocked_ms = 0.0
+
+    def start(self):
+        """在事件循环线程中启动"""
+        if self._task is not None or not settings.loop_monitor_enabled:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = asyncio.ensure_future(self._run())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._stop.set()
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+
+    async def _run(self):
+        interval = settings.loop_monitor_interval
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self._last_tick = now
+            lag = max(0.0, now - expected)
+            self._lags.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+
+    def _sample(self) -> Optional[List[traceback.FrameSummary]]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        return traceback.extract_stack(frame, limit=_STACK_LIMIT)
+
+    def _watch(self):
+        """看门狗线程：定时协程逾期未唤醒时采集事件循环线程的调用栈"""
+        interval = settings.loop_monitor_interval
+        threshold = settings.loop_monitor_block_threshold
+        sample_interval = settings.loop_monitor_sample_interval
+        blocked_tick: Optional[float] = None
+        samples: List[List[traceback.FrameSummary]] = []
+        sampled = False
+
+        while not self._stop.wait(sample_interval):
+            last_tick = self._last_tick
+            overdue = time.monotonic() - last_tick - interval
+            if blocked_tick is not None and last_tick != blocked_tick:
+                # 定时协程已唤醒，阻塞结束
+                self._finish(last_tick - blocked_tick - interval, samples)
+                blocked_tick, samples = None, []
+                continue
+            if overdue < threshold:
+                continue
+            if blocked_tick is None:
+                blocked_tick = last_tick
+                sampled = random.random() < settings.loop_monitor_sample_rate
+            if sampled:
+                stack = self._sample()
+                if stack:
+                    samples.append(stack)
+
+    def _finish(self, duration: float, samples: List[List[traceback.FrameSummary]]):
+        duration_ms = duration * 1000
+        site = None
+        stack: List[str] = []
+        if samples:
+            # 多次采样中出现最多的调用位置
+            sites = Counter(_call_site(s) for s in samples)
+            site = sites.most_common(1)[0][0]
+            stack = [_frame_label(f) for f in next(s for s in samples if _call_site(s) == site)]
+
+        with self._lock:
+            self._blocks += 1
+            self._blocked_ms += duration_ms
+            self._recent.append({
+                'at': time.time(),
+                'duration_ms': round(duration_ms, 1),
+                'site': site,
+                'samples': len(samples)
+            })
+            if site is not None:
+                entry = self._sites.get(site)
+                if entry is None:
+                    if len(self._sites) >= _MAX_SITES:
+                        # 丢弃累计阻塞时间最短的位置
+                        self._sites.pop(min(self._sites, key=lambda k: self._sites[k]['total_ms']))
+                    entry = self._sites[site] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'stack': stack}
+                entry['count'] += 1
+                entry['total_ms'] += duration_ms
+                if duration_ms > entry['max_ms']:
+                    entry['max_ms'] = duration_ms
+                    entry['stack'] = stack
+        print(f"🐢 事件循环阻塞 {duration_ms:.0f}ms，调用位置: {site or '未采样'}")
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._lags.clear()
+            self._max_lag = 0.0
+            self._sites.clear()
+            self._recent.clear()
+            self._blocks = 0
+            self._blocked_ms = 0.0
+
+    def _lag_summary(self) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+        if not lags:
+            return {'p50_ms': None, 'p99_ms': None, 'max_ms': round(self._max_lag * 1000, 1)}
+        return {
+            'p50_ms': round(lags[len(lags) // 2] * 1000, 1),
+            'p99_ms': round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 1),
+            'max_ms': round(self._max_lag * 1000, 1)
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """健康检查中展示的摘要"""
+        return {
+            'enabled': self._task is not None,
+            'lag': self._lag_summary(),
+            'blocks': self._blocks
+        }
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        """
+        完整统计
+
+        Args:
+            top: 返回累计阻塞时间最长的调用位置数
+        """
+        with self._lock:
+            sites = sorted(self._sites.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:top]
+            return {
+                **self.summary(),
+                'blocked_ms': round(self._blocked_ms, 1),
+                'threshold_ms': settings.loop_monitor_block_threshold * 1000,
+                'sites': [
+                    {
+                        'site': site,
+                        'count': entry['count'],
+                        'total_ms': round(entry['total_ms'], 1),
+                        'max_ms': round(entry['max_ms'], 1),
+                        'stack': entry['stack']
+                    }
+                    for site, entry in sites
+                ],
+                'recent': list(self._recent)
+            }
+
+
+loop_monitor = LoopMonitor()
@@ -7,13 +7,49 @@ from auth_routes import auth_router
 from config_routes import router as config_router
 from volcano_routes import router as volcano_router
 from tos_routes import router as tos_router
+from blob_routes import router as blob_router
+from asset_routes import router as asset_router
+from search_routes import router as search_router
+from tts_routes import router as tts_router
+from task_routes import router as task_router
+from job_routes import router as job_router
+from video_routes import router as video_router
+from preview_routes import router as preview_router
+from admin_routes import router as admin_router
+from job_queue import job_queue
+from task_store import video_task_store
+from volcano_api_service import VolcanoAPIService
+from upstream_scheduler import set_upstream_priority
+from circuit_breaker import circuit_breakers
+from endpoint_registry import endpoint_registry
+from loop_monitor import loop_monitor
+from deadline import DeadlineMiddleware
+from compression import CompressionMiddleware
+import deadline
+import compression
+import image_preprocess
+import payload_offload
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时初始化数据库
     await init_db()
     print("数据库初始化完成")
+    # 兜底巡检未收到回调的视频任务
+    video_task_store.start_sweeper(VolcanoAPIService().get_video_task)
+    # 继续执行持久化队列中未完成的提交任务
+    await job_queue.start()
+    # 定期探测各区域上游端点的延迟
+    endpoint_registry.start()
+    # 检测事件循环中的同步阻塞调用
+    loop_monitor.start()
     yield
+    await loop_monitor.stop()
+    await endpoint_registry.stop()
+    await job_queue.stop()
+    await video_task_store.stop_sweeper()
+    image_preprocess.shutdown()
+    payload_offload.shutdown()
     # 关闭时的清理工作
     print("应用关闭")
 
@@ -33,6 +69,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求可通过 X-Request-Priority: batch / background 主动降低上游调用优先级
+@app.middleware("http")
+async def upstream_priority_middleware(request, call_next):
+    priority = request.headers.get("x-request-priority")
+    if priority in ("batch", "background"):
+        set_upstream_priority(priority)
+    return await call_next(request)
+
+# 按 Accept-Encoding 压缩文本类响应
+app.add_middleware(CompressionMiddleware)
+
+# 最外层：设置请求截止时间，客户端断开时取消请求处理
+app.add_middleware(DeadlineMiddleware, router_app=app)
+
 # 根路由
 @app.get("/")
 async def root():
@@ -42,10 +92,19 @@ async def root():
         "status": "运行中"
     }
 
-# 健康检查
+# 健康检查（上游熔断时为 degraded，本服务仍可用）
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    degraded = circuit_breakers.degraded()
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "degraded_upstreams": degraded,
+        "upstreams": circuit_breakers.snapshot(),
+        "endpoints": endpoint_registry.snapshot(),
+        "requests": deadline.stats(),
+        "compression": compression.stats(),
+        "event_loop": loop_monitor.summary()
+    }
 
 # 注册API路由
 app.include_router(api_router, prefix="/api")
@@ -53,6 +112,15 @@ app.include_router(auth_router, prefix="/api")
 app.include_router(config_router)
 app.include_router(volcano_router)
 app.include_router(tos_router)
+app.include_router(blob_router)
+app.include_router(asset_router)
+app.include_router(search_router)
+app.include_router(tts_router)
+app.include_router(task_router)
+app.include_router(job_router)
+app.include_router(video_router)
+app.include_router(preview_router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,156 @@
+"""
+大载荷处理卸载
+即梦 / Inpainting 的结果和提交参数中常带有数 MB 的 binary_data_base64，
+在事件循环中解析 JSON、编解码 base64 会让同时进行的所有请求停顿。
+
+超过 payload_offload_threshold 的载荷交给工作进程处理：
+- JSON 解析/序列化、base64 编解码都持有 GIL，放到线程中同样会阻塞事件循环，因此使用进程池
+- 哈希计算会释放 GIL，放到线程中即可
+阈值以下的小载荷直接在当前线程处理，避免进程间传输的开销。
+"""
+import json
+import base64
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Union, Callable, TypeVar
+from config import settings
+
+T = TypeVar('T')
+
+_executor: Optional[ProcessPoolExecutor] = None
+_stats = {'inline': 0, 'offloaded': 0, 'offloaded_bytes': 0}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.payload_offload_workers)
+    return _executor
+
+
+def shutdown():
+    """关闭进程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _large(size: int) -> bool:
+    return size >= settings.payload_offload_threshold
+
+
+async def _run(size: int, func: Callable[..., T], *args) -> T:
+    """小载荷直接执行，大载荷在进程池中执行"""
+    if not _large(size):
+        _stats['inline'] += 1
+        return func(*args)
+    _stats['offloaded'] += 1
+    _stats['offloaded_bytes'] += size
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), func, *args)
+
+
+def estimated_size(value: Any) -> int:
+    """估算对象序列化后的大小（只累计字符串和字节串的长度，用于判断是否卸载）"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimated_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimated_size(v) for v in value)
+    return 0
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value).encode('utf-8')
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii')
+
+
+def _b64decode(value: Union[str, bytes], validate: bool) -> bytes:
+    return base64.b64decode(value, validate=validate)
+
+
+def _b64_sha256(value: str) -> str:
+    return hashlib.sha256(base64.b64decode(value)).hexdigest()
+
+
+def _sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def loads(data: Union[str, bytes]) -> Any:
+    """
+    解析 JSON
+
+    Raises:
+        json.JSONDecodeError: 内容不是合法的 JSON
+    """
+    return await _run(len(data), json.loads, data)
+
+
+async def dumps(value: Any) -> bytes:
+    """序列化为 JSON（UTF-8 字节）"""
+    return await _run(estimated_size(value), _dumps, value)
+
+
+async def b64encode(data: bytes) -> str:
+    return await _run(len(data), _b64encode, data)
+
+
+async def b64decode(value: Union[str, bytes], validate: bool = False) -> bytes:
+    """
+    解码 base64
+
+    Raises:
+        binascii.Error: validate 为 True 且内容不是合法的 base64
+    """
+    return await _run(len(value), _b64decode, value, validate)
+
+
+async def b64_sha256(value: str) -> str:
+    """base64 内容解码后的 SHA-256（解码结果不传回主进程）"""
+    return await _run(len(value), _b64_sha256, value)
+
+
+async def in_thread(size: int, func: Callable[..., T], *args) -> T:
+    """执行会释放 GIL 的计算（如哈希），大载荷放到线程中执行"""
+    if not _large(size):
+        _stats['inline'] += 1
+        return func(*args)
+    _stats['offloaded'] += 1
+    _stats['offloaded_bytes'] += size
+    return await asyncio.to_thread(func, *args)
+
+
+async def sha256_hex(data: bytes) -> str:
+    """SHA-256（十六进制），如请求签名所需的请求体哈希"""
+    return await in_thread(len(data), _sha256_hex, data)
+
+
+def preview(data: Union[str, bytes], limit: int = 500) -> str:
+    """日志中使用的内容摘要，只解码前 limit 个字节"""
+    if isinstance(data, bytes):
+        text = data[:limit].decode('utf-8', 'replace')
+    else:
+        text = data[:limit]
+    return text + "... (truncated)" if len(data) > limit else text
+
+
+def summarize(value: Any, limit: int = 200) -> Any:
+    """日志中使用的参数摘要，过长的字符串（如 base64 图片）替换为其长度"""
+    if isinstance(value, str) and len(value) > limit:
+        return f"<{len(value)} 字符>"
+    if isinstance(value, dict):
+        return {k: summarize(v, limit) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [summarize(v, limit) for v in value]
+    return value
+
+
+def stats() -> Dict[str, Any]:
+    return {**_stats, 'threshold': settings.payload_offload_threshold}
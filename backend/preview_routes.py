@@ -0,0 +1,231 @@
+"""
+生成结果预览路由
+为生成的图片/视频派生缩略图、封面图和动态预览，任务列表和图库无需加载原始大图和完整视频。
+
+- thumb: 最长边 320 的 WebP 静态缩略图（视频取第 1 秒的画面）
+- poster: 最长边 1280 的 JPEG 封面图，用作 <video poster>
+- animated: 视频前 3 秒、最长边 320 的动态 WebP
+
+资源在任务完成后被预取时自动派生；未派生的预览在首次访问时生成。
+结果保存在磁盘缓存中，以 /api/assets/{key}/previews/{variant} 提供长期缓存的访问。
+"""
+import io
+import os
+import shutil
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from typing import Dict, Any, List
+from PIL import Image, ImageOps
+from config import settings
+from disk_cache import DiskCache
+from file_responses import ranged_file_response
+from asset_routes import fetch_asset, on_asset_prefetched
+
+router = APIRouter(tags=["生成结果预览"])
+
+preview_cache = DiskCache(
+    os.path.join(settings.cache_dir, 'previews'),
+    max_bytes=settings.preview_cache_max_bytes
+)
+
+PREVIEW_VARIANTS: Dict[str, Dict[str, Any]] = {
+    'thumb': {'max_side': 320, 'format': 'WEBP', 'content_type': 'image/webp'},
+    'poster': {'max_side': 1280, 'format': 'JPEG', 'content_type': 'image/jpeg'},
+    'animated': {'max_side': 320, 'duration': 3, 'fps': 10, 'content_type': 'image/webp'},
+}
+# 视频截取静态画面的时间点（秒），视频短于该时间时取首帧
+_STILL_AT = 1.0
+
+_semaphore = asyncio.Semaphore(settings.preview_workers)
+_inflight: Dict[str, asyncio.Task] = {}
+# 后台派生任务引用，防止被垃圾回收
+_background = set()
+_stats = {'derived': 0, 'failed': 0}
+
+
+def _ffmpeg_available() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+def _cache_key(key: str, variant: str) -> str:
+    return f"{key}_{variant}"
+
+
+def _render_still(image: Image.Image, spec: Dict[str, Any]) -> bytes:
+    """把一帧画面缩放并编码为静态预览图（在线程中执行）"""
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((spec['max_side'], spec['max_side']), Image.LANCZOS)
+    if spec['format'] == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    output = io.BytesIO()
+    if spec['format'] == 'JPEG':
+        image.save(output, format='JPEG', quality=82, optimize=True, progressive=True)
+    else:
+        image.save(output, format='WEBP', quality=75, method=4)
+    return output.getvalue()
+
+
+def _render_image(path: str, spec: Dict[str, Any]) -> bytes:
+    with Image.open(path) as image:
+        image.load()
+        return _render_still(image, spec)
+
+
+async def _run_ffmpeg(args: List[str]) -> bytes:
+    """执行 ffmpeg，返回输出到 stdout 的内容"""
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-nostdin', '-loglevel', 'error', *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), settings.video_transcode_timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        message = stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(f"ffmpeg 退出码 {process.returncode}: {message[-1] if message else ''}")
+    return stdout
+
+
+async def _video_frame(path: str) -> Image.Image:
+    """截取视频第 1 秒的画面，视频过短时取首帧"""
+    for at in (_STILL_AT, 0):
+        frame = await _run_ffmpeg([
+            '-ss', str(at), '-i', path, '-frames:v', '1', '-f', 'image2pipe', '-c:v', 'png', '-'
+        ])
+        if frame:
+            return Image.open(io.BytesIO(frame))
+    raise RuntimeError("无法从视频中截取画面")
+
+
+async def _render_animated(path: str, spec: Dict[str, Any]) -> bytes:
+    side = spec['max_side']
+    return await _run_ffmpeg([
+        '-t', str(spec['duration']), '-i', path,
+        '-vf', f"fps={spec['fps']},scale='min({side},iw)':'min({side},ih)':force_original_aspect_ratio=decrease",
+        '-an', '-c:v', 'libwebp', '-loop', '0', '-quality', '60', '-f', 'webp', '-'
+    ])
+
+
+async def _derive(key: str, variant: str) -> Dict[str, Any]:
+    entry = await fetch_asset(key)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="资源不存在")
+
+    spec = PREVIEW_VARIANTS[variant]
+    content_type = entry['meta'].get('content_type', '')
+    is_video = content_type.startswith('video/')
+    if not is_video and not content_type.startswith('image/'):
+        raise HTTPException(status_code=415, detail="该资源不支持生成预览")
+    if variant == 'animated' and not is_video:
+        raise HTTPException(status_code=404, detail="图片资源没有动态预览")
+    if is_video and not _ffmpeg_available():
+        raise HTTPException(status_code=503, detail="服务端未安装 ffmpeg，无法生成视频预览")
+
+    async with _semaphore:
+        if variant == 'animated':
+            data = await _render_animated(entry['path'], spec)
+        elif is_video:
+            frame = await _video_frame(entry['path'])
+            data = await asyncio.to_thread(_render_still, frame, spec)
+        else:
+            data = await asyncio.to_thread(_render_image, entry['path'], spec)
+
+    preview = await asyncio.to_thread(
+        preview_cache.put_bytes, _cache_key(key, variant), data, {'content_type': spec['content_type']}
+    )
+    _stats['derived'] += 1
+    print(f"🖼️ 预览已生成: {key[:12]}... {variant} ({entry['size']} -> {len(data)} bytes)")
+    return preview
+
+
+async def get_preview(key: str, variant: str) -> Dict[str, Any]:
+    """
+    获取资源的预览（优先读缓存，未生成时派生）
+
+    Raises:
+        HTTPException: 资源不存在或不支持该预览
+    """
+    if variant not in PREVIEW_VARIANTS:
+        raise HTTPException(status_code=404, detail="不支持的预览类型")
+    cache_key = _cache_key(key, variant)
+    entry = preview_cache.get(cache_key)
+    if entry is not None:
+        return entry
+
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_derive(key, variant))
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    return await asyncio.shield(task)
+
+
+async def _derive_all(key: str, variants: List[str]):
+    for variant in variants:
+        try:
+            await get_preview(key, variant)
+        except Exception as e:
+            _stats['failed'] += 1
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"⚠️ 预览生成失败: {key[:12]}... {variant} {type(e).__name__}: {detail}")
+
+
+def _on_asset_prefetched(key: str, entry: Dict[str, Any]):
+    """任务结果资源预取完成后，在后台派生全部预览"""
+    content_type = entry['meta'].get('content_type', '')
+    if content_type.startswith('video/'):
+        if not _ffmpeg_available():
+            return
+        variants = ['thumb', 'poster', 'animated']
+    elif content_type.startswith('image/'):
+        variants = ['thumb', 'poster']
+    else:
+        return
+    variants = [v for v in variants if not preview_cache.contains(_cache_key(key, v))]
+    if not variants or any(_cache_key(key, v) in _inflight for v in variants):
+        return
+    task = asyncio.ensure_future(_derive_all(key, variants))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+on_asset_prefetched(_on_asset_prefetched)
+
+
+@router.get("/api/assets/previews/stats")
+async def get_preview_stats():
+    """预览缓存统计"""
+    return {
+        **preview_cache.stats(),
+        **_stats,
+        'deriving': len(_inflight)
+    }
+
+
+@router.get("/api/assets/{key}/previews/{variant}")
+async def get_asset_preview(key: str, variant: str, request: Request):
+    """
+    获取资源的预览图
+
+    variant 为 thumb（缩略图）、poster（封面图）或 animated（视频动态预览）。
+    预览内容只由资源本身决定，响应可被长期缓存。
+    """
+    try:
+        entry = await get_preview(key, variant)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="资源不存在")
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=f"预览生成失败: {str(e)}")
+
+    return ranged_file_response(
+        request,
+        entry['path'],
+        entry['meta'].get('content_type', 'application/octet-stream'),
+        headers={'Cache-Control': 'public, max-age=31536000, immutable'}
+    )
@@ -0,0 +1,272 @@
+"""
+按需性能剖析
+供管理员诊断接口在运行中的进程上使用：
+
+- CPU 采样：后台线程按 profiler_sample_interval 采集所有线程的调用栈，持续指定秒数，
+  结果为 folded stacks 格式（"线程;外层函数;...;内层函数 次数"），可直接用于 flamegraph.pl / speedscope
+- 内存快照：tracemalloc 快照中分配最多的代码位置，以及与上一次快照相比增长最多的位置
+- 对象计数：各子系统中的 httpx / TOS 客户端、缓存条目和未完成的后台协程
+
+只在调用接口时产生开销：未采样时没有后台线程，tracemalloc 在第一次快照时才开启。
+"""
+import gc
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, Optional, List
+import httpx
+import tos
+from config import settings
+from blob_routes import blob_cache
+from asset_routes import asset_cache
+from preview_routes import preview_cache
+from tts_routes import tts_cache
+from task_store import video_task_store
+import result_cache
+import task_status
+
+_APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+# 调用栈最大深度
+_MAX_DEPTH = 128
+
+
+def _relative(filename: str) -> str:
+    """本项目文件显示相对路径，其余文件只显示文件名"""
+    if filename.startswith(_APP_ROOT) and 'site-packages' not in filename:
+        return os.path.relpath(filename, _APP_ROOT)
+    return os.path.basename(filename)
+
+
+def _function_label(frame) -> str:
+    return f"{_relative(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def _folded(frame) -> str:
+    labels: List[str] = []
+    while frame is not None and len(labels) < _MAX_DEPTH:
+        labels.append(_function_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class CpuProfiler:
+    """采样式 CPU 剖析器，同一时间只运行一次采样"""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float):
+        """
+        开始采样，到时自动停止
+
+        Raises:
+            RuntimeError: 已有采样在进行中
+        """
+        if self.running:
+            raise RuntimeError("已有 CPU 采样在进行中")
+        self._stop.clear()
+        self._stacks = Counter()
+        self._samples = 0
+        self._seconds = seconds
+        self._started = time.time()
+        self._finished = None
+        self._thread = threading.Thread(target=self._run, name='cpu-profiler', daemon=True)
+        self._thread.start()
+        print(f"🔬 开始 CPU 采样: {seconds:.0f}秒")
+
+    def stop(self):
+        """提前停止采样"""
+        self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        interval = settings.profiler_sample_interval
+        until = time.monotonic() + self._seconds
+        while not self._stop.wait(interval) and time.monotonic() < until:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                self._stacks[f"{names.get(thread_id, thread_id)};{_folded(frame)}"] += 1
+            self._samples += 1
+        self._finished = time.time()
+        print(f"🔬 CPU 采样结束: {self._samples} 次")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'started': self._started,
+            'finished': self._finished,
+            'seconds': self._seconds,
+            'samples': self._samples,
+            'interval': settings.profiler_sample_interval,
+            'stacks': len(self._stacks)
+        }
+
+    def folded(self) -> Optional[str]:
+        """folded stacks 格式的采样结果（采样进行中时为目前的结果），从未采样时返回 None"""
+        if self._started is None:
+            return None
+        return ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+def _rss_bytes() -> Optional[int]:
+    """当前常驻内存（只支持 Linux）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _stat_entry(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    entry = {
+        'location': f"{_relative(frame.filename)}:{frame.lineno}",
+        'size': stat.size,
+        'count': stat.count
+    }
+    if hasattr(stat, 'size_diff'):
+        entry['size_diff'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+class MemoryTracker:
+    """tracemalloc 快照与差异"""
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._previous_at: Optional[float] = None
+
+    def _take(self, top: int) -> Dict[str, Any]:
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        result: Dict[str, Any] = {
+            'top': [_stat_entry(s) for s in snapshot.statistics('lineno')[:top]],
+            'diff': None,
+            'previous_at': self._previous_at
+        }
+        if self._previous is not None:
+            result['diff'] = [_stat_entry(s) for s in snapshot.compare_to(self._previous, 'lineno')[:top]]
+        self._previous = snapshot
+        self._previous_at = time.time()
+        return result
+
+    async def snapshot(self, top: int = 30) -> Dict[str, Any]:
+        """
+        拍摄内存快照：返回分配最多的代码位置和与上一次快照相比变化最大的位置
+
+        第一次调用时开启 tracemalloc，只能看到开启之后的分配
+        """
+        started = False
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.tracemalloc_frames)
+            started = True
+            print("🧠 已开启 tracemalloc")
+        result = await asyncio.to_thread(self._take, top)
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'started_tracing': started,
+            'rss': _rss_bytes(),
+            'traced': traced,
+            'traced_peak': peak,
+            **result
+        }
+
+    def stop(self):
+        """关闭 tracemalloc 并丢弃保存的快照"""
+        self._previous = None
+        self._previous_at = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            print("🧠 已关闭 tracemalloc")
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        traced, peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+        return {'tracing': tracing, 'rss': _rss_bytes(), 'traced': traced, 'traced_peak': peak,
+                'previous_at': self._previous_at}
+
+
+def _count_clients() -> Dict[str, Any]:
+    """遍历 gc 跟踪的对象，统计存活的 httpx / TOS 客户端"""
+    httpx_open = httpx_closed = tos_clients = 0
+    objects = gc.get_objects()
+    for obj in objects:
+        if isinstance(obj, (httpx.AsyncClient, httpx.Client)):
+            if obj.is_closed:
+                httpx_closed += 1
+            else:
+                httpx_open += 1
+        elif isinstance(obj, tos.TosClientV2):
+            tos_clients += 1
+    return {
+        'httpx': {'open': httpx_open, 'closed_not_collected': httpx_closed},
+        'tos': {'clients': tos_clients},
+        'gc': {'objects': len(objects), 'counts': gc.get_count()}
+    }
+
+
+def _task_label(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    code = getattr(coro, 'cr_code', None)
+    if code is None:
+        return type(coro).__name__
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}.{code.co_name}"
+
+
+def _cache_entry(stats: Dict[str, Any]) -> Dict[str, Any]:
+    return {'entries': stats['entries'], 'bytes': stats['bytes']}
+
+
+async def object_counts() -> Dict[str, Any]:
+    """各子系统的对象计数"""
+    clients = await asyncio.to_thread(_count_clients)
+    tasks = Counter(_task_label(task) for task in asyncio.all_tasks() if not task.done())
+    return {
+        **clients,
+        'disk_caches': {
+            'blobs': _cache_entry(blob_cache.stats()),
+            'assets': _cache_entry(asset_cache.stats()),
+            'previews': _cache_entry(preview_cache.stats()),
+            'results': _cache_entry(result_cache.result_cache.stats()),
+            'tts': _cache_entry(tts_cache.stats())
+        },
+        'memory_caches': {
+            'result_cache_pending_tasks': result_cache.stats()['pending_tasks'],
+            'visual_task_results': task_status.stats()['visual_results'],
+            'video_tasks': video_task_store.stats()
+        },
+        'asyncio_tasks': {
+            'total': sum(tasks.values()),
+            'by_coroutine': dict(tasks.most_common())
+        },
+        'threads': [thread.name for thread in threading.enumerate()]
+    }
+
+
+cpu_profiler = CpuProfiler()
+memory_tracker = MemoryTracker()
@@ -0,0 +1,221 @@
+"""
+确定性结果缓存
+固定 seed 的 Seedream / 即梦生成和同步 CVProcess 调用（如 Inpainting）在输入完全相同时输出相同，
+按规范化请求的哈希缓存结果，编辑器撤销/重做时重复提交同一步骤可以直接返回。
+
+- 缓存键包含调用方的凭证指纹，不同凭证之间不共享结果
+- binary_data_base64 替换为解码后内容的哈希；image_urls / video_urls 中本服务暂存的文件替换为其摘要，
+  生成结果地址（settings.asset_allowed_hosts）去掉签名参数后按地址参与计算（不下载），同一对象换用新的签名URL仍能命中
+- seed 为空或 -1 的请求结果随机，不参与缓存（Inpainting、文生图等页面默认 seed 为 -1，
+  需要指定固定 seed 才会命中缓存）
+"""
+import os
+import re
+import json
+import hmac
+import hashlib
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from typing import Dict, Any, Optional
+from config import settings
+from disk_cache import DiskCache
+from asset_routes import is_allowed_host
+import payload_offload
+
+result_cache = DiskCache(
+    os.path.join(settings.cache_dir, 'results'),
+    max_bytes=settings.result_cache_max_bytes,
+    max_age=settings.result_cache_max_age
+)
+
+# 等待结果的异步任务: task_id -> 缓存键
+_pending_tasks: "OrderedDict[str, str]" = OrderedDict()
+_MAX_PENDING_TASKS = 4096
+# 命中缓存的异步提交返回的任务ID前缀
+CACHED_TASK_PREFIX = 'cache-'
+
+_BLOB_URL_PATTERN = re.compile(r'/api/blobs/([0-9a-f]{64})$')
+# 签名URL中随每次签名变化的参数（TOS / S3 兼容签名、CDN 鉴权）
+_SIGNATURE_PARAM_PREFIXES = ('x-tos-', 'x-amz-', 'x-signature', 'x-expires')
+_SIGNATURE_PARAMS = ('signature', 'expires', 'policy', 'accessid', 'auth_key', 'x-signature', 'x-expires')
+# 图片处理参数影响内容，保留
+_KEPT_PARAMS = ('x-tos-process',)
+# 不影响输出结果的字段
+_IGNORED_FIELDS = ('apiKey', 'stream', 'callback_url')
+# 不使用 seed 或 seed 为 -1 时结果随机
+_RANDOM_SEEDS = (None, -1)
+
+_stats = {'bypassed': 0, 'uncacheable': 0, 'stored': 0}
+
+
+def cache_mode(cache_control: Optional[str]) -> str:
+    """
+    根据请求的 Cache-Control 头确定缓存方式
+
+    Returns:
+        'default' 读写缓存；'refresh'（no-cache）跳过读取但写入新结果；'bypass'（no-store）不读不写
+    """
+    directives = {d.strip().lower() for d in (cache_control or '').split(',')}
+    if 'no-store' in directives:
+        return 'bypass'
+    if 'no-cache' in directives:
+        return 'refresh'
+    return 'default'
+
+
+def is_deterministic(request_data: Dict[str, Any]) -> bool:
+    """指定了 seed 的请求才是确定性的"""
+    return request_data.get('seed') not in _RANDOM_SEEDS
+
+
+async def _hash_base64(value: str) -> str:
+    if value.startswith('data:') and ',' in value:
+        value = value.split(',', 1)[1]
+    return 'sha256:' + await payload_offload.b64_sha256(value)
+
+
+def _is_signature_param(name: str) -> bool:
+    name = name.lower()
+    if name in _KEPT_PARAMS:
+        return False
+    return name in _SIGNATURE_PARAMS or name.startswith(_SIGNATURE_PARAM_PREFIXES)
+
+
+def _url_identity(url: str) -> Optional[str]:
+    """
+    URL 在缓存键中的表示：本服务暂存的文件使用其摘要；生成结果地址去掉签名参数后的地址；
+    其他地址的内容可能随时变化，返回 None（不参与缓存）
+    """
+    parsed = urlparse(url)
+    match = _BLOB_URL_PATTERN.search(parsed.path)
+    if match:
+        return 'sha256:' + match.group(1)
+
+    host = (parsed.hostname or '').lower()
+    if not is_allowed_host(host):
+        return None
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if not _is_signature_param(k))
+    return 'url:' + urlunparse(('https', host, parsed.path, '', urlencode(query), ''))
+
+
+def _drop_empty(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _drop_empty(v) for k, v in value.items() if v is not None and k not in _IGNORED_FIELDS}
+    if isinstance(value, list):
+        return [_drop_empty(v) for v in value]
+    return value
+
+
+async def request_key(kind: str, owner: str, request_data: Dict[str, Any]) -> Optional[str]:
+    """
+    计算规范化请求的缓存键
+
+    Args:
+        kind: 调用类型，如 'images' 或 'visual:CVProcess'
+        owner: 调用方的凭证指纹
+        request_data: 请求参数
+
+    Returns:
+        缓存键；请求不是确定性的或输入内容无法获取时返回 None
+    """
+    if not is_deterministic(request_data):
+        _stats['uncacheable'] += 1
+        return None
+
+    normalized = _drop_empty(request_data)
+    try:
+        if normalized.get('binary_data_base64'):
+            normalized['binary_data_base64'] = [await _hash_base64(v) for v in normalized['binary_data_base64']]
+    except ValueError:
+        _stats['uncacheable'] += 1
+        return None
+
+    for field in ('image_urls', 'video_urls'):
+        if normalized.get(field):
+            identities = [_url_identity(url) for url in normalized[field]]
+            if None in identities:
+                _stats['uncacheable'] += 1
+                return None
+            normalized[field] = identities
+
+    material = json.dumps([kind, owner, normalized], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _read_entry(key: str) -> Optional[bytes]:
+    try:
+        entry = result_cache.get(key)
+    except ValueError:
+        return None
+    if entry is None:
+        return None
+    with open(entry['path'], 'rb') as f:
+        return f.read()
+
+
+async def lookup(key: Optional[str], mode: str = 'default') -> Optional[Any]:
+    """读取缓存结果"""
+    if key is None:
+        return None
+    if mode != 'default':
+        _stats['bypassed'] += 1
+        return None
+    body = await asyncio.to_thread(_read_entry, key)
+    # 缓存的视觉服务结果可能带有数 MB 的 base64 图片
+    return None if body is None else await payload_offload.loads(body)
+
+
+async def store(key: Optional[str], mode: str, data: Any):
+    """写入缓存结果"""
+    if key is None or mode == 'bypass':
+        return
+    body = await payload_offload.dumps(data)
+    await asyncio.to_thread(result_cache.put_bytes, key, body, {'content_type': 'application/json'})
+    _stats['stored'] += 1
+
+
+def track_task(task_id: str, key: Optional[str], mode: str):
+    """记录异步任务对应的缓存键，任务完成时写入结果"""
+    if key is None or mode == 'bypass':
+        return
+    _pending_tasks[task_id] = key
+    while len(_pending_tasks) > _MAX_PENDING_TASKS:
+        _pending_tasks.popitem(last=False)
+
+
+async def complete_task(task_id: str, data: Dict[str, Any]):
+    """异步任务查询到最终结果时写入缓存"""
+    key = _pending_tasks.pop(task_id, None)
+    if key is not None:
+        await store(key, 'default', data)
+
+
+def _owner_tag(key: str, owner: str) -> str:
+    return hashlib.sha256(f"{owner}:{key}".encode('utf-8')).hexdigest()[:16]
+
+
+def cached_task_id(key: str, owner: str) -> str:
+    """命中缓存的异步提交返回的任务ID，绑定提交者的凭证指纹"""
+    return f"{CACHED_TASK_PREFIX}{key}-{_owner_tag(key, owner)}"
+
+
+def is_cached_task(task_id: str) -> bool:
+    return task_id.startswith(CACHED_TASK_PREFIX)
+
+
+def cached_task_key(task_id: str, owner: str) -> Optional[str]:
+    """缓存任务ID对应的缓存键；任务ID格式错误或不属于该凭证时返回 None"""
+    key, _, tag = task_id[len(CACHED_TASK_PREFIX):].partition('-')
+    if not tag or not hmac.compare_digest(tag, _owner_tag(key, owner)):
+        return None
+    return key
+
+
+def stats() -> Dict[str, Any]:
+    """缓存统计"""
+    return {
+        **result_cache.stats(),
+        **_stats,
+        'pending_tasks': len(_pending_tasks)
+    }
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Any
 
 # 用户相关的Schema
 
@@ -98,3 +98,24 @@ class SystemConfigListResponse(BaseModel):
     configs: List[SystemConfigResponse]
     total: int
 
+
+# 生成任务相关的Schema
+
+class TaskResponse(BaseModel):
+    """生成任务响应模型"""
+    id: int
+    provider: str
+    task_id: str
+    req_key: Optional[str] = None
+    action: Optional[str] = None
+    status: str
+    request_data: Optional[Any] = None
+    result_data: Optional[Any] = None
+    status_history: List[Any] = []
+    created_at: datetime
+    updated_at: datetime
+
+class TaskListResponse(BaseModel):
+    """生成任务列表响应（游标分页）"""
+    items: List[TaskResponse]
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多数据")
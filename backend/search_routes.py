@@ -0,0 +1,394 @@
+"""
+本地向量检索路由
+提供与 VikingDB SearchByMultiModal / UpsertData 请求格式兼容的本地检索接口，
+向量存放在本机的内存映射索引中，检索无需远程往返。
+
+所有接口需要 X-Access-Key-Id / X-Secret-Access-Key，数据集归属于创建它的凭证
+"""
+import os
+import re
+import json
+import uuid
+import base64
+import asyncio
+import numpy as np
+from collections import OrderedDict
+from fastapi import APIRouter, HTTPException, Header
+from pydantic import BaseModel, Field
+from typing import Dict, Any, Optional, List, Union, Callable, Tuple
+from config import settings
+from vector_index import VectorIndex
+from volcano_api_service import VolcanoAPIService
+from circuit_breaker import upstream_http_error
+from task_routes import access_key_fingerprint
+import credential_pool
+
+router = APIRouter()
+api_service = VolcanoAPIService()
+
+VECTOR_ROOT = os.path.join(settings.cache_dir, 'vector')
+_COLLECTION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+# 与 VikingDB need_instruction 行为一致的检索指令前缀
+SEARCH_INSTRUCTION = "根据这个问题，找到能回答这个问题的相应文本或图片："
+# 单次 Embedding 请求最多的数据条数
+EMBEDDING_BATCH_SIZE = 10
+
+_indexes: Dict[str, VectorIndex] = {}
+_schemas: Dict[str, Dict[str, Any]] = {}
+# 查询向量缓存，相同的查询不再重复调用 Embedding
+_query_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+_QUERY_CACHE_SIZE = 1024
+
+
+class SearchCollectionRequest(BaseModel):
+    """创建本地检索数据集请求"""
+    collection_name: str
+    primary_key: str = "id"
+    vector_field: Optional[str] = Field(None, description="直接写入向量的字段名")
+    vectorize: Optional[Dict[str, str]] = Field(None, description="向量化字段映射，如 {'text': 'f_text', 'image': 'f_image', 'video': 'f_video'}")
+    dense_model: Optional[Dict[str, Any]] = Field(None, description="稠密模型 {name, version, dim}")
+    dim: Optional[int] = None
+
+
+class UpsertDataRequest(BaseModel):
+    """数据写入请求（兼容 UpsertData）"""
+    collection_name: str
+    data: List[Dict[str, Any]] = Field(..., max_length=100)
+
+
+class DeleteDataRequest(BaseModel):
+    """数据删除请求"""
+    collection_name: str
+    ids: List[Union[str, int]]
+
+
+class SearchByMultiModalRequest(BaseModel):
+    """多模态检索请求（兼容 SearchByMultiModal）"""
+    collection_name: str
+    index_name: Optional[str] = None
+    text: Optional[str] = None
+    image: Optional[str] = None
+    video: Optional[Union[str, Dict[str, Any]]] = None
+    need_instruction: Optional[bool] = False
+    output_fields: Optional[List[str]] = None
+    limit: int = Field(10, ge=1, le=1000)
+    filter: Optional[Dict[str, Any]] = None
+    # 本地扩展参数
+    dense_vector: Optional[List[float]] = None
+    nprobe: Optional[int] = None
+
+
+def _check_collection_name(name: str):
+    if not _COLLECTION_NAME_PATTERN.match(name):
+        raise HTTPException(status_code=400, detail=f"非法的数据集名称: {name}")
+
+
+def _schema_path(name: str) -> str:
+    return os.path.join(VECTOR_ROOT, name, 'collection.json')
+
+
+def _request_owner(access_key_id: str, secret_access_key: str) -> str:
+    """请求凭证的归属指纹"""
+    if credential_pool.is_pool_credential(access_key_id) and credential_pool.pool_user(access_key_id) is None:
+        raise HTTPException(status_code=401, detail="凭证池访问令牌无效、已过期或无权使用凭证池")
+    return access_key_fingerprint(access_key_id, secret_access_key)
+
+
+def _write_schema(name: str, schema: Dict[str, Any]):
+    with open(_schema_path(name), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False)
+
+
+def _get_collection(name: str, owner: str) -> Tuple[Dict[str, Any], VectorIndex]:
+    """获取数据集的 schema 和索引，数据集不属于该凭证或没有归属时视为不存在"""
+    _check_collection_name(name)
+    if name not in _schemas:
+        path = _schema_path(name)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"数据集 '{name}' 不存在")
+        with open(path, 'r', encoding='utf-8') as f:
+            _schemas[name] = json.load(f)
+    schema = _schemas[name]
+    if schema.get('owner') != owner:
+        raise HTTPException(status_code=404, detail=f"数据集 '{name}' 不存在")
+    if name not in _indexes:
+        _indexes[name] = VectorIndex(os.path.join(VECTOR_ROOT, name), schema['dim'])
+    return schema, _indexes[name]
+
+
+def _public_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in schema.items() if k != 'owner'}
+
+
+def _normalize_video(video: Union[str, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+    if video is None or isinstance(video, dict):
+        return video
+    return {'value': video}
+
+
+def _decode_vector(value: Union[str, List[float]]) -> np.ndarray:
+    """向量字段支持浮点数组，或 float32 压缩为 bytes 后的 base64 编码"""
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _compile_filter(spec: Optional[Dict[str, Any]]) -> Optional[Callable[[Dict[str, Any]], bool]]:
+    """
+    把 VikingDB 过滤表达式编译为本地过滤函数
+
+    支持 must / must_not / range / and / or
+    """
+    if not spec:
+        return None
+
+    op = spec.get('op')
+    if op in ('and', 'or'):
+        children = [_compile_filter(child) for child in spec.get('conds', [])]
+        combine = all if op == 'and' else any
+        return lambda fields: combine(child(fields) for child in children)
+
+    field = spec.get('field')
+    if op in ('must', 'must_not'):
+        conds = set(spec.get('conds', []))
+
+        def match(fields):
+            value = fields.get(field)
+            values = value if isinstance(value, list) else [value]
+            return any(v in conds for v in values)
+
+        return match if op == 'must' else (lambda fields: not match(fields))
+
+    if op == 'range':
+        def in_range(fields):
+            value = fields.get(field)
+            if value is None:
+                return False
+            return all([
+                'gt' not in spec or value > spec['gt'],
+                'gte' not in spec or value >= spec['gte'],
+                'lt' not in spec or value < spec['lt'],
+                'lte' not in spec or value <= spec['lte'],
+            ])
+        return in_range
+
+    raise HTTPException(status_code=400, detail=f"不支持的过滤操作: {op}")
+
+
+async def _embed(schema: Dict[str, Any], data: List[Dict[str, Any]],
+                 access_key_id: Optional[str], secret_access_key: Optional[str]) -> List[List[float]]:
+    if not schema.get('dense_model'):
+        raise HTTPException(status_code=400, detail="数据集未配置 dense_model，需直接提供向量")
+    if not access_key_id or not secret_access_key:
+        raise HTTPException(status_code=401, detail="向量化需要提供 X-Access-Key-Id 和 X-Secret-Access-Key")
+
+    vectors = []
+    for begin in range(0, len(data), EMBEDDING_BATCH_SIZE):
+        result = await api_service.embed_multimodal(
+            data[begin:begin + EMBEDDING_BATCH_SIZE],
+            schema['dense_model'],
+            access_key_id,
+            secret_access_key
+        )
+        if not result['success']:
+            raise upstream_http_error(result['error'])
+        vectors.extend(result['data'])
+    return vectors
+
+
+def _response(result: Any) -> Dict[str, Any]:
+    return {
+        'code': 'Success',
+        'message': 'The API call was executed successfully.',
+        'request_id': uuid.uuid4().hex,
+        'result': result
+    }
+
+
+@router.post("/api/search/collections")
+async def create_collection(
+    request: SearchCollectionRequest,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """
+    创建本地检索数据集
+
+    dim 未提供时取 dense_model.dim
+    """
+    owner = _request_owner(x_access_key_id, x_secret_access_key)
+    _check_collection_name(request.collection_name)
+    dim = request.dim or (request.dense_model or {}).get('dim')
+    if not dim:
+        raise HTTPException(status_code=400, detail="需要提供 dim 或 dense_model.dim")
+    if not request.vector_field and not request.vectorize:
+        raise HTTPException(status_code=400, detail="需要提供 vector_field 或 vectorize")
+    if os.path.exists(_schema_path(request.collection_name)):
+        raise HTTPException(status_code=400, detail=f"数据集 '{request.collection_name}' 已存在")
+
+    schema = {**request.model_dump(), 'dim': dim, 'owner': owner}
+    os.makedirs(os.path.dirname(_schema_path(request.collection_name)), exist_ok=True)
+    _write_schema(request.collection_name, schema)
+
+    return _response(_public_schema(schema))
+
+
+@router.get("/api/search/collections/{collection_name}")
+async def get_collection(
+    collection_name: str,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """获取本地检索数据集信息"""
+    schema, index = _get_collection(collection_name, _request_owner(x_access_key_id, x_secret_access_key))
+    return _response({**_public_schema(schema), 'stats': index.stats()})
+
+
+@router.post("/api/search/collections/{collection_name}/compact")
+async def compact_collection(
+    collection_name: str,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """压缩数据集索引：删除被覆盖和删除的数据占用的空间"""
+    _, index = _get_collection(collection_name, _request_owner(x_access_key_id, x_secret_access_key))
+    await asyncio.to_thread(index.compact)
+    return _response(index.stats())
+
+
+@router.post("/api/search/upsert")
+async def upsert_data(
+    request: UpsertDataRequest,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """
+    写入数据（兼容 UpsertData）
+
+    带 vector_field 的数据直接写入；否则按 vectorize 映射调用 Embedding 计算向量
+    """
+    schema, index = _get_collection(request.collection_name, _request_owner(x_access_key_id, x_secret_access_key))
+    primary_key = schema['primary_key']
+    vector_field = schema.get('vector_field')
+    vectorize = schema.get('vectorize') or {}
+
+    vectors: List[Optional[np.ndarray]] = []
+    to_embed = []
+    for item in request.data:
+        if primary_key not in item:
+            raise HTTPException(status_code=400, detail=f"数据缺少主键字段 {primary_key}")
+        if vector_field and item.get(vector_field) is not None:
+            vectors.append(_decode_vector(item[vector_field]))
+            continue
+
+        embed_item = {}
+        for modality in ('text', 'image', 'video'):
+            field = vectorize.get(modality)
+            if field and item.get(field):
+                embed_item[modality] = _normalize_video(item[field]) if modality == 'video' else item[field]
+        if not embed_item:
+            raise HTTPException(status_code=400, detail=f"数据 {item[primary_key]} 缺少向量或向量化字段")
+        vectors.append(None)
+        to_embed.append(embed_item)
+
+    if to_embed:
+        embedded = iter(await _embed(schema, to_embed, x_access_key_id, x_secret_access_key))
+        vectors = [v if v is not None else np.asarray(next(embedded), dtype=np.float32) for v in vectors]
+
+    items = [
+        (
+            str(item[primary_key]),
+            vector,
+            {k: v for k, v in item.items() if k != vector_field}
+        )
+        for item, vector in zip(request.data, vectors)
+    ]
+    try:
+        await asyncio.to_thread(index.upsert, items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _response(None)
+
+
+@router.post("/api/search/delete")
+async def delete_data(
+    request: DeleteDataRequest,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """按主键删除数据"""
+    _, index = _get_collection(request.collection_name, _request_owner(x_access_key_id, x_secret_access_key))
+    await asyncio.to_thread(index.delete, [str(i) for i in request.ids])
+    return _response(None)
+
+
+@router.post("/api/search")
+async def search_by_multi_modal(
+    request: SearchByMultiModalRequest,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """
+    多模态检索（兼容 SearchByMultiModal）
+
+    查询文本/图片/视频经 Embedding 转为向量后在本地索引中检索；
+    相同查询的向量会被缓存，也可以通过 dense_vector 直接提供查询向量
+    """
+    schema, index = _get_collection(request.collection_name, _request_owner(x_access_key_id, x_secret_access_key))
+
+    real_text_query = request.text
+    if request.text and request.need_instruction:
+        real_text_query = SEARCH_INSTRUCTION + request.text
+
+    if request.dense_vector is not None:
+        query_vector = request.dense_vector
+    else:
+        query = {}
+        if real_text_query:
+            query['text'] = real_text_query
+        if request.image:
+            query['image'] = request.image
+        if request.video:
+            query['video'] = _normalize_video(request.video)
+        if not query:
+            raise HTTPException(status_code=400, detail="text、image、video 至少提供一个")
+
+        cache_key = json.dumps([request.collection_name, query], sort_keys=True, ensure_ascii=False)
+        query_vector = _query_vectors.get(cache_key)
+        if query_vector is None:
+            query_vector = (await _embed(schema, [query], x_access_key_id, x_secret_access_key))[0]
+            _query_vectors[cache_key] = query_vector
+            while len(_query_vectors) > _QUERY_CACHE_SIZE:
+                _query_vectors.popitem(last=False)
+        else:
+            _query_vectors.move_to_end(cache_key)
+
+    try:
+        hits = await asyncio.to_thread(
+            index.search,
+            np.asarray(query_vector, dtype=np.float32),
+            request.limit,
+            request.nprobe,
+            _compile_filter(request.filter)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    data = []
+    for hit in hits:
+        fields = hit['fields']
+        if request.output_fields is not None:
+            fields = {k: v for k, v in fields.items() if k in request.output_fields}
+        data.append({
+            'id': hit['id'],
+            'fields': fields,
+            'score': hit['score'],
+            'ann_score': hit['score']
+        })
+
+    return _response({
+        'data': data,
+        'total_return_count': len(data),
+        'real_text_query': real_text_query
+    })
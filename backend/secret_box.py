@@ -0,0 +1,50 @@
+"""
+服务端凭证加密
+需要写入磁盘的调用凭证（如后台队列任务的 AK/SK、API Key）以 Fernet 加密后保存。
+
+加密密钥取 settings.credentials_encryption_key；未配置时在 cache_dir 下生成 credentials.key
+（仅当前用户可读），多实例部署或数据库与缓存目录分开备份时应显式配置。
+"""
+import os
+import json
+from typing import Dict, Any, Optional
+from cryptography.fernet import Fernet, InvalidToken
+from config import settings
+
+_fernet: Optional[Fernet] = None
+
+
+def _load_key() -> bytes:
+    if settings.credentials_encryption_key:
+        return settings.credentials_encryption_key.encode('ascii')
+    path = os.path.join(settings.cache_dir, 'credentials.key')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read().strip()
+    os.makedirs(settings.cache_dir, exist_ok=True)
+    key = Fernet.generate_key()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    print(f"🔐 未配置 credentials_encryption_key，已生成凭证加密密钥: {path}")
+    return key
+
+
+def _get_fernet() -> Fernet:
+    global _fernet
+    if _fernet is None:
+        _fernet = Fernet(_load_key())
+    return _fernet
+
+
+def encrypt(value: Dict[str, Any]) -> str:
+    """加密凭证字典"""
+    return _get_fernet().encrypt(json.dumps(value).encode('utf-8')).decode('ascii')
+
+
+def decrypt(token: str) -> Optional[Dict[str, Any]]:
+    """解密凭证，密钥不匹配、内容被篡改或不是加密格式时返回 None"""
+    try:
+        return json.loads(_get_fernet().decrypt(token.encode('ascii')))
+    except (InvalidToken, UnicodeEncodeError, ValueError):
+        return None
@@ -6,7 +6,10 @@ import hmac
 import hashlib
 from datetime import datetime
 from urllib.parse import urlparse, quote, parse_qs
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
+
+# 请求体类型：推荐直接传入已编码的 bytes / memoryview，签名与发送共用同一块缓冲区
+Payload = Union[bytes, bytearray, memoryview, str]
 
 
 class SignatureV4:
@@ -19,7 +22,7 @@ class SignatureV4:
         Args:
             access_key_id: 访问密钥ID
             secret_access_key: 访问密钥密钥
-            service: 服务类型 (cv: 视觉服务, tos: 对象存储)
+            service: 服务类型 (cv: 视觉服务, vikingdb: 向量库, tos: 对象存储)
             region: 区域
         """
         self.access_key_id = access_key_id
@@ -27,7 +30,8 @@ class SignatureV4:
         self.service = service
         self.region = region
     
-    def sign(self, method: str, url: str, headers: Dict[str, str], body: Optional[str] = None) -> Dict[str, str]:
+    def sign(self, method: str, url: str, headers: Dict[str, str], body: Optional[Payload] = None,
+             payload_hash: Optional[str] = None) -> Dict[str, str]:
         """
         生成签名的主函数
         
@@ -35,22 +39,26 @@ class SignatureV4:
             method: HTTP方法
             url: 请求URL
             headers: 请求头
-            body: 请求体
+            body: 请求体，bytes / memoryview 会被直接哈希，不产生额外拷贝
+            payload_hash: 预先计算好的请求体SHA256（十六进制），提供时不再哈希 body
             
         Returns:
             包含签名的请求头字典
         """
+        # 请求体只哈希一次，之后各签名流程都使用这个哈希值
+        hashed_payload = payload_hash or self._hash_payload(body)
+        
         if self.service == 'tos':
             # 火山引擎 TOS 使用 TOS4-HMAC-SHA256 签名
-            return self._sign_tos(method, url, headers, body)
-        elif self.service == 'cv':
-            # 火山引擎视觉服务使用简单的 HMAC-SHA256 签名
-            return self._sign_cv(method, url, headers, body)
+            return self._sign_tos(method, url, headers, hashed_payload)
+        elif self.service in ('cv', 'vikingdb'):
+            # 火山引擎视觉服务、向量库使用简单的 HMAC-SHA256 签名
+            return self._sign_cv(method, url, headers, hashed_payload)
         else:
             # 其他服务使用 AWS4 签名
-            return self._sign_aws4(method, url, headers, body)
+            return self._sign_aws4(method, url, headers, hashed_payload, has_body=bool(body))
     
-    def _sign_tos(self, method: str, url: str, headers: Dict[str, str], body: Optional[str] = None) -> Dict[str, str]:
+    def _sign_tos(self, method: str, url: str, headers: Dict[str, str], hashed_payload: str) -> Dict[str, str]:
         """火山引擎 TOS 签名方法 - 使用 TOS4-HMAC-SHA256"""
         # 解析URL
         url_obj = urlparse(url)
@@ -68,7 +76,7 @@ class SignatureV4:
         
         # 构建规范请求
         canonical_request = self._create_tos_canonical_request(
-            method, path, query_string, headers, body, host
+            method, path, query_string, headers, hashed_payload, host
         )
         
         # 构建待签名字符串
@@ -94,7 +102,7 @@ class SignatureV4:
         }
     
     def _create_tos_canonical_request(self, method: str, path: str, query_string: str, 
-                                     headers: Dict[str, str], body: Optional[str], host: str) -> str:
+                                     headers: Dict[str, str], hashed_payload: str, host: str) -> str:
         """创建 TOS 规范请求"""
         http_method = method.upper()
         canonical_uri = self._get_canonical_uri(path)
@@ -104,9 +112,6 @@ class SignatureV4:
         canonical_headers = f"host:{host}\n"
         signed_headers = "host"
         
-        # 计算负载哈希
-        hashed_payload = self._sha256_hash(body or '')
-        
         return '\n'.join([
             http_method,
             canonical_uri,
@@ -124,7 +129,7 @@ class SignatureV4:
         k_signing = self._hmac_sha256('request', k_service)
         return k_signing
     
-    def _sign_cv(self, method: str, url: str, headers: Dict[str, str], body: Optional[str] = None) -> Dict[str, str]:
+    def _sign_cv(self, method: str, url: str, headers: Dict[str, str], hashed_payload: str) -> Dict[str, str]:
         """火山引擎视觉服务签名方法 - 使用火山引擎官方签名格式"""
         # 解析URL
         url_obj = urlparse(url)
@@ -142,17 +147,17 @@ class SignatureV4:
         
         # 构建规范请求
         canonical_request = self._create_volcano_canonical_request(
-            method, path, query_string, headers, body, host, timestamp
+            method, path, query_string, headers, hashed_payload, host, timestamp
         )
         
         # 构建待签名字符串
-        credential_scope = f"{date_stamp}/{self.region}/cv/request"
+        credential_scope = f"{date_stamp}/{self.region}/{self.service}/request"
         string_to_sign = f"{algorithm}\n{timestamp}\n{credential_scope}\n{self._sha256_hash(canonical_request)}"
         
         # 计算签名密钥 - 火山引擎的密钥派生方式
         k_date = self._hmac_sha256(date_stamp, self.secret_access_key.encode('utf-8'))
         k_region = self._hmac_sha256(self.region, k_date)
-        k_service = self._hmac_sha256('cv', k_region)
+        k_service = self._hmac_sha256(self.service, k_region)
         k_signing = self._hmac_sha256('request', k_service)
         
         # 计算签名
@@ -171,7 +176,7 @@ class SignatureV4:
         }
     
     def _create_volcano_canonical_request(self, method: str, path: str, query_string: str, 
-                                         headers: Dict[str, str], body: Optional[str], host: str, timestamp: str) -> str:
+                                         headers: Dict[str, str], hashed_payload: str, host: str, timestamp: str) -> str:
         """创建火山引擎规范请求"""
         http_method = method.upper()
         canonical_uri = self._get_canonical_uri(path)
@@ -181,9 +186,6 @@ class SignatureV4:
         canonical_headers = f"host:{host}\nx-date:{timestamp}\n"
         signed_headers = "host;x-date"
         
-        # 计算负载哈希
-        hashed_payload = self._sha256_hash(body or '')
-        
         return '\n'.join([
             http_method,
             canonical_uri,
@@ -194,7 +196,7 @@ class SignatureV4:
         ])
     
     def _create_cv_canonical_request(self, method: str, path: str, query_string: str, 
-                                    headers: Dict[str, str], body: Optional[str], host: str, timestamp: str) -> str:
+                                    headers: Dict[str, str], hashed_payload: str, host: str, timestamp: str) -> str:
         """创建视觉服务规范请求"""
         http_method = method.upper()
         canonical_uri = self._get_canonical_uri(path)
@@ -204,9 +206,6 @@ class SignatureV4:
         canonical_headers = f"host:{host}\nx-amz-date:{timestamp}\n"
         signed_headers = "host;x-amz-date"
         
-        # 计算负载哈希
-        hashed_payload = self._sha256_hash(body or '')
-        
         return '\n'.join([
             http_method,
             canonical_uri,
@@ -224,7 +223,8 @@ class SignatureV4:
         k_signing = self._hmac_sha256('request', k_service)
         return k_signing
     
-    def _sign_aws4(self, method: str, url: str, headers: Dict[str, str], body: Optional[str] = None) -> Dict[str, str]:
+    def _sign_aws4(self, method: str, url: str, headers: Dict[str, str], hashed_payload: str,
+                   has_body: bool = False) -> Dict[str, str]:
         """AWS4 签名方法"""
         # 解析URL
         url_obj = urlparse(url)
@@ -248,12 +248,12 @@ class SignatureV4:
         }
         
         # 如果有body，添加Content-Type
-        if body and 'Content-Type' not in sign_headers:
+        if has_body and 'Content-Type' not in sign_headers:
             sign_headers['Content-Type'] = 'application/json'
         
         # Step 1: 创建规范请求
         canonical_request = self._create_canonical_request(
-            method, path, query_string, sign_headers, body
+            method, path, query_string, sign_headers, hashed_payload
         )
         
         # Step 2: 创建待签名字符串
@@ -276,14 +276,13 @@ class SignatureV4:
         }
     
     def _create_canonical_request(self, method: str, path: str, query_string: str, 
-                                  headers: Dict[str, str], body: Optional[str]) -> str:
+                                  headers: Dict[str, str], hashed_payload: str) -> str:
         """创建规范请求"""
         http_method = method.upper()
         canonical_uri = self._get_canonical_uri(path)
         canonical_query_string = self._get_canonical_query_string(query_string)
         canonical_headers = self._get_canonical_headers(headers)
         signed_headers = self._get_signed_headers(headers)
-        hashed_payload = self._hash_payload(body)
         
         return '\n'.join([
             http_method,
@@ -360,17 +359,18 @@ class SignatureV4:
         """获取已签名头部列表"""
         return ';'.join(sorted(key.lower() for key in headers.keys()))
     
-    def _hash_payload(self, body: Optional[str]) -> str:
+    def _hash_payload(self, body: Optional[Payload]) -> str:
         """计算请求体哈希"""
         if not body:
-            return self._sha256_hash('')
+            return self._sha256_hash(b'')
         
-        payload = body if isinstance(body, str) else str(body)
-        return self._sha256_hash(payload)
+        return self._sha256_hash(body)
     
-    def _sha256_hash(self, data: str) -> str:
-        """SHA256哈希"""
-        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    def _sha256_hash(self, data: Payload) -> str:
+        """SHA256哈希（bytes / memoryview 直接哈希，str 按 UTF-8 编码）"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
     
     def _hmac_sha256(self, data: str, key) -> bytes:
         """HMAC-SHA256 (返回bytes)"""
@@ -0,0 +1,231 @@
+"""
+生成任务历史路由
+记录方舟视频任务和视觉服务任务的提交与状态变更，并提供按凭证归属的游标分页查询
+"""
+import hmac
+import json
+import base64
+import hashlib
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from sqlalchemy import select, and_, or_
+from typing import Dict, Any, Optional, List
+from database import async_session_maker, Task
+from schemas import TaskResponse, TaskListResponse
+from credential_pool import credential_owner, is_pool_credential
+from http_cache import json_response
+
+router = APIRouter(tags=["生成任务"])
+
+# 提交参数中超过该长度的字符串不入库（base64 图片等）
+_MAX_FIELD_LENGTH = 2048
+# 不记录的提交参数
+_EXCLUDED_FIELDS = ('apiKey', 'binary_data_base64', 'callback_url')
+
+
+def key_fingerprint(key: str, secret: Optional[str] = None) -> str:
+    """
+    凭证指纹，用于标识任务归属而不保存凭证本身
+
+    Access Key ID 不是秘密，火山引擎 AK/SK 的指纹以 Secret Access Key 为密钥对 AK 计算 HMAC；
+    方舟 API Key 和凭证池令牌本身即为秘密，不需要 secret
+    """
+    owner = credential_owner(key).encode('utf-8')
+    if secret is None or is_pool_credential(key):
+        return hashlib.sha256(owner).hexdigest()[:32]
+    return hmac.new(secret.encode('utf-8'), owner, hashlib.sha256).hexdigest()[:32]
+
+
+def access_key_fingerprint(access_key_id: str, secret_access_key: Optional[str]) -> str:
+    """
+    火山引擎凭证的归属指纹，只提供 Access Key ID 时拒绝（凭证池令牌除外）
+
+    Raises:
+        HTTPException: 缺少 Secret Access Key
+    """
+    if not is_pool_credential(access_key_id) and not secret_access_key:
+        raise HTTPException(status_code=401, detail="X-Access-Key-Id 需要同时提供 X-Secret-Access-Key")
+    return key_fingerprint(access_key_id, secret_access_key)
+
+
+def _sanitize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _sanitize(v) for k, v in value.items() if k not in _EXCLUDED_FIELDS and v is not None}
+    if isinstance(value, list):
+        return [_sanitize(v) for v in value]
+    if isinstance(value, str) and len(value) > _MAX_FIELD_LENGTH:
+        return f"<{len(value)} chars omitted>"
+    return value
+
+
+async def record_task_submit(provider: str, task_id: str, owner: str, req_key: Optional[str],
+                             action: Optional[str], request_data: Dict[str, Any], status: str):
+    """
+    记录任务提交
+
+    记录失败只打印日志，不影响任务提交本身
+    """
+    now = datetime.utcnow()
+    try:
+        async with async_session_maker() as session:
+            existing = await session.execute(
+                select(Task.id).where(Task.provider == provider, Task.task_id == task_id)
+            )
+            if existing.scalar_one_or_none() is not None:
+                return
+            session.add(Task(
+                provider=provider,
+                task_id=task_id,
+                owner=owner,
+                req_key=req_key,
+                action=action,
+                status=status,
+                request_data=json.dumps(_sanitize(request_data), ensure_ascii=False),
+                status_history=json.dumps([{'status': status, 'at': int(now.timestamp())}]),
+                # 显式写入时间，保证与游标中的时间格式一致
+                created_at=now,
+                updated_at=now
+            ))
+            await session.commit()
+    except Exception as e:
+        print(f"⚠️ 记录任务提交失败: {provider}/{task_id} {type(e).__name__}: {str(e)}")
+
+
+async def record_task_status(provider: str, task_id: str, status: Optional[str],
+                             result_data: Optional[Dict[str, Any]] = None):
+    """
+    记录任务状态变更
+
+    状态未变化时不写库；未登记的任务（例如在其他服务实例提交的）直接忽略
+    """
+    if not status:
+        return
+    try:
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(Task).where(Task.provider == provider, Task.task_id == task_id)
+            )
+            task = result.scalar_one_or_none()
+            if task is None or task.status == status:
+                return
+
+            now = datetime.utcnow()
+            history = json.loads(task.status_history or '[]')
+            history.append({'status': status, 'at': int(now.timestamp())})
+            task.status = status
+            task.status_history = json.dumps(history)
+            if result_data is not None:
+                task.result_data = json.dumps(_sanitize(result_data), ensure_ascii=False)
+            task.updated_at = now
+            await session.commit()
+    except Exception as e:
+        print(f"⚠️ 记录任务状态失败: {provider}/{task_id} {type(e).__name__}: {str(e)}")
+
+
+def _encode_cursor(task: Task) -> str:
+    raw = json.dumps([task.created_at.isoformat(), task.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def request_owners(authorization: Optional[str], access_key_id: Optional[str],
+                   secret_access_key: Optional[str]) -> List[str]:
+    """根据请求凭证确定可查看的任务归属"""
+    owners = []
+    if authorization and authorization.startswith('Bearer '):
+        owners.append(key_fingerprint(authorization[7:]))
+    if access_key_id:
+        owners.append(access_key_fingerprint(access_key_id, secret_access_key))
+    if not owners:
+        raise HTTPException(status_code=401, detail="需要提供 Authorization 或 X-Access-Key-Id / X-Secret-Access-Key")
+    return owners
+
+
+def _to_response(task: Task) -> TaskResponse:
+    return TaskResponse(
+        id=task.id,
+        provider=task.provider,
+        task_id=task.task_id,
+        req_key=task.req_key,
+        action=task.action,
+        status=task.status,
+        request_data=json.loads(task.request_data) if task.request_data else None,
+        result_data=json.loads(task.result_data) if task.result_data else None,
+        status_history=json.loads(task.status_history or '[]'),
+        created_at=task.created_at,
+        updated_at=task.updated_at
+    )
+
+
+@router.get("/api/tasks", response_model=TaskListResponse)
+async def list_tasks(
+    request: Request,
+    provider: Optional[str] = None,
+    status: Optional[str] = None,
+    req_key: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    x_access_key_id: Optional[str] = Header(None, alias="X-Access-Key-Id"),
+    x_secret_access_key: Optional[str] = Header(None, alias="X-Secret-Access-Key")
+):
+    """
+    查询任务历史
+
+    按创建时间倒序，使用 next_cursor 获取下一页；
+    只返回请求凭证（Authorization 的 API Key 或 X-Access-Key-Id 与 X-Secret-Access-Key）提交的任务；
+    支持 If-None-Match 条件请求，列表未变化时返回 304
+    """
+    owners = request_owners(authorization, x_access_key_id, x_secret_access_key)
+    query = select(Task).where(Task.owner.in_(owners))
+    if provider:
+        query = query.where(Task.provider == provider)
+    if status:
+        query = query.where(Task.status == status)
+    if req_key:
+        query = query.where(Task.req_key == req_key)
+    if cursor:
+        created_at, last_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            Task.created_at < created_at,
+            and_(Task.created_at == created_at, Task.id < last_id)
+        ))
+
+    query = query.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit + 1)
+    async with async_session_maker() as session:
+        tasks = (await session.execute(query)).scalars().all()
+
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    return json_response(request, TaskListResponse(
+        items=[_to_response(task) for task in tasks],
+        next_cursor=_encode_cursor(tasks[-1]) if has_more else None
+    ))
+
+
+@router.get("/api/tasks/{provider}/{task_id}", response_model=TaskResponse)
+async def get_task(
+    provider: str,
+    task_id: str,
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    x_access_key_id: Optional[str] = Header(None, alias="X-Access-Key-Id"),
+    x_secret_access_key: Optional[str] = Header(None, alias="X-Secret-Access-Key")
+):
+    """查询单个任务的历史记录"""
+    owners = request_owners(authorization, x_access_key_id, x_secret_access_key)
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Task).where(Task.provider == provider, Task.task_id == task_id, Task.owner.in_(owners))
+        )
+        task = result.scalar_one_or_none()
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return json_response(request, _to_response(task))
@@ -0,0 +1,260 @@
+"""
+批量任务状态查询
+任务列表刷新时一次提交全部待更新的方舟视频任务和视觉服务任务：
+
+- 已结束的任务直接返回本地状态（方舟任务来自回调和巡检，视觉服务任务来自之前的查询结果）
+- 其余方舟任务通过 filter.task_ids 一次列表查询取回，列表中缺失的任务再单独查询
+- 视觉服务没有批量查询接口，逐个查询，并发数受 task_status_batch_concurrency 限制
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+from config import settings
+from volcano_api_service import VolcanoAPIService
+from asset_routes import attach_proxy_urls
+from task_store import video_task_store
+from task_routes import key_fingerprint, record_task_status
+from endpoint_registry import endpoint_registry
+import credential_pool
+import result_cache
+
+VISUAL_TERMINAL_STATUSES = ('done', 'not_found', 'expired')
+MISSING_CREDENTIALS_CODE = 'MISSING_CREDENTIALS'
+_MAX_VISUAL_RESULTS = 4096
+
+api_service = VolcanoAPIService()
+
+# 已结束的视觉服务任务结果: (凭证指纹, task_id) -> (记录时间, 结果)
+_visual_results: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_stats = {'batches': 0, 'local': 0, 'upstream': 0, 'ark_list_calls': 0}
+
+
+def _visual_result(owner: str, task_id: str) -> Optional[Dict[str, Any]]:
+    entry = _visual_results.get((owner, task_id))
+    if entry is None:
+        return None
+    # 结果中的上游URL会过期，超过有效期后重新查询
+    if time.monotonic() - entry[0] > settings.task_status_terminal_ttl:
+        _visual_results.pop((owner, task_id), None)
+        return None
+    return entry[1]
+
+
+async def finish_visual_query(task_id: str, access_key_id: str, secret_access_key: str,
+                              data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    处理视觉服务任务的查询结果：记录任务状态，完成时写入结果缓存并预取结果资源
+
+    Returns:
+        附加了代理地址的结果
+    """
+    status = data.get('status')
+    await record_task_status('visual', task_id, status, data)
+    if status == 'done':
+        await result_cache.complete_task(task_id, data)
+    data = attach_proxy_urls(data, prefetch=status == 'done')
+    if status in VISUAL_TERMINAL_STATUSES:
+        key = (key_fingerprint(access_key_id, secret_access_key), task_id)
+        _visual_results[key] = (time.monotonic(), data)
+        _visual_results.move_to_end(key)
+        while len(_visual_results) > _MAX_VISUAL_RESULTS:
+            _visual_results.popitem(last=False)
+    return data
+
+
+async def lookup_cached_task(task_id: str, access_key_id: str, secret_access_key: str) -> Dict[str, Any]:
+    """
+    读取命中结果缓存的异步提交（cache- 开头的任务ID）的结果
+
+    先校验凭证，任务ID只对提交时的凭证有效
+
+    Returns:
+        成功时 data 为缓存的结果；失败时 error 中的 status 为对应的 HTTP 状态码
+    """
+    if credential_pool.is_pool_credential(access_key_id) and credential_pool.pool_user(access_key_id) is None:
+        return {'success': False, 'error': {
+            'message': '凭证池访问令牌无效、已过期或无权使用凭证池', 'code': credential_pool.POOL_UNAUTHORIZED_CODE, 'status': 401
+        }}
+    cache_key = result_cache.cached_task_key(task_id, key_fingerprint(access_key_id, secret_access_key))
+    if cache_key is None:
+        return {'success': False, 'error': {'message': '任务不存在', 'code': 'NOT_FOUND', 'status': 404}}
+    cached = await result_cache.lookup(cache_key)
+    if cached is None:
+        return {'success': False, 'error': {
+            'message': '缓存结果已过期，请重新提交任务', 'code': 'CACHE_EXPIRED', 'status': 404
+        }}
+    return {'success': True, 'data': cached}
+
+
+def _ref(task: Dict[str, Any]) -> Dict[str, Any]:
+    return {'provider': task['provider'], 'task_id': task['task_id']}
+
+
+def _local(task: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    _stats['local'] += 1
+    return {**_ref(task), 'success': True, 'source': 'local', 'status': data.get('status'), 'data': data}
+
+
+def _fetched(task: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    return {**_ref(task), 'success': True, 'source': 'upstream', 'status': data.get('status'), 'data': data}
+
+
+def _failed(task: Dict[str, Any], error: Any) -> Dict[str, Any]:
+    return {**_ref(task), 'success': False, 'error': error}
+
+
+def _missing_credentials(task: Dict[str, Any], header: str) -> Dict[str, Any]:
+    return _failed(task, {'message': f"缺少 {header} 请求头", 'code': MISSING_CREDENTIALS_CODE})
+
+
+async def _query_visual(task: Dict[str, Any], access_key_id: str, secret_access_key: str,
+                        semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    task_id = task['task_id']
+    if result_cache.is_cached_task(task_id):
+        cached = await lookup_cached_task(task_id, access_key_id, secret_access_key)
+        if not cached['success']:
+            return _failed(task, cached['error'])
+        return _local(task, attach_proxy_urls(cached['data']))
+
+    data = _visual_result(key_fingerprint(access_key_id, secret_access_key), task_id)
+    if data is not None:
+        return _local(task, data)
+    if not task.get('req_key'):
+        return _failed(task, {'message': '视觉服务任务缺少 req_key', 'code': 'INVALID_REQUEST'})
+
+    async with semaphore:
+        _stats['upstream'] += 1
+        result = await api_service.query_visual_task(
+            action=task['action'],
+            version=task['version'],
+            request_data={'req_key': task['req_key'], 'task_id': task_id},
+            access_key_id=access_key_id,
+            secret_access_key=secret_access_key
+        )
+    if not result['success']:
+        return _failed(task, result['error'])
+    return _fetched(task, await finish_visual_query(task_id, access_key_id, secret_access_key, result['data']))
+
+
+async def _get_ark(task: Dict[str, Any], api_key: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    async with semaphore:
+        _stats['upstream'] += 1
+        result = await api_service.get_video_task(task['task_id'], api_key)
+    if not result['success']:
+        return _failed(task, result['error'])
+    state = await video_task_store.update(task['task_id'], result['data'], api_key)
+    return _fetched(task, state.data if state is not None else result['data'])
+
+
+def _can_list(api_key: str) -> bool:
+    """
+    能否用一次列表查询取回多个任务：凭证池中的任务由各自提交时的密钥查询，
+    多个方舟端点时任务分布在不同区域，都只能逐个查询
+    """
+    return not credential_pool.is_pool_credential(api_key) and len(endpoint_registry.endpoints('ark')) == 1
+
+
+async def _list_ark(task_ids: List[str], api_key: str,
+                    semaphore: asyncio.Semaphore) -> Dict[str, Dict[str, Any]]:
+    """通过 filter.task_ids 批量查询方舟任务，返回查到的任务（task_id -> 最新状态）"""
+    found: Dict[str, Dict[str, Any]] = {}
+    size = settings.task_status_ark_page_size
+
+    async def list_chunk(chunk: List[str]):
+        async with semaphore:
+            _stats['upstream'] += 1
+            _stats['ark_list_calls'] += 1
+            result = await api_service.get_video_tasks(
+                {'page_num': 1, 'page_size': len(chunk), 'filter.task_ids': chunk},
+                api_key
+            )
+        if not result['success']:
+            print(f"⚠️ 方舟任务批量查询失败，改为逐个查询: {result['error']}")
+            return
+        for item in result['data'].get('items') or []:
+            if item.get('id') in chunk:
+                state = await video_task_store.update(item['id'], item, api_key)
+                found[item['id']] = state.data if state is not None else item
+
+    await asyncio.gather(*(list_chunk(task_ids[i:i + size]) for i in range(0, len(task_ids), size)))
+    return found
+
+
+async def _query_ark(tasks: List[Dict[str, Any]], api_key: str,
+                     semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tasks)
+    pending: List[int] = []
+    for i, task in enumerate(tasks):
+        state = video_task_store.track(task['task_id'], api_key)
+        if state.data is not None and state.fresh:
+            results[i] = _local(task, state.data)
+        else:
+            pending.append(i)
+
+    found: Dict[str, Dict[str, Any]] = {}
+    if len(pending) > 1 and _can_list(api_key):
+        found = await _list_ark([tasks[i]['task_id'] for i in pending], api_key, semaphore)
+    for i in pending:
+        if tasks[i]['task_id'] in found:
+            results[i] = _fetched(tasks[i], found[tasks[i]['task_id']])
+
+    missing = [i for i in pending if results[i] is None]
+    fetched = await asyncio.gather(*(_get_ark(tasks[i], api_key, semaphore) for i in missing))
+    for i, result in zip(missing, fetched):
+        results[i] = result
+    return results
+
+
+async def batch_status(tasks: List[Dict[str, Any]], api_key: Optional[str],
+                       access_key_id: Optional[str], secret_access_key: Optional[str]) -> Dict[str, Any]:
+    """
+    批量查询任务状态
+
+    Args:
+        tasks: [{provider, task_id, req_key, action, version}]，provider 为 ark 或 visual
+        api_key: 方舟 API Key，查询方舟任务时需要
+        access_key_id: 视觉服务访问密钥ID，查询视觉服务任务时需要
+        secret_access_key: 视觉服务访问密钥密钥
+
+    Returns:
+        按提交顺序排列的各任务结果，重复的任务只查询一次
+    """
+    _stats['batches'] += 1
+    semaphore = asyncio.Semaphore(settings.task_status_batch_concurrency)
+    unique: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+    for task in tasks:
+        unique.setdefault((task['provider'], task['task_id']), task)
+
+    ark_tasks = [t for t in unique.values() if t['provider'] == 'ark']
+    visual_tasks = [t for t in unique.values() if t['provider'] == 'visual']
+
+    async def ark_results() -> List[Dict[str, Any]]:
+        if not ark_tasks:
+            return []
+        if not api_key:
+            return [_missing_credentials(t, 'Authorization') for t in ark_tasks]
+        return await _query_ark(ark_tasks, api_key, semaphore)
+
+    async def visual_results() -> List[Dict[str, Any]]:
+        if not access_key_id or not secret_access_key:
+            return [_missing_credentials(t, 'X-Access-Key-Id / X-Secret-Access-Key') for t in visual_tasks]
+        return list(await asyncio.gather(*(
+            _query_visual(t, access_key_id, secret_access_key, semaphore) for t in visual_tasks
+        )))
+
+    ark, visual = await asyncio.gather(ark_results(), visual_results())
+    by_key = {(r['provider'], r['task_id']): r for r in [*ark, *visual]}
+    results = [by_key[(t['provider'], t['task_id'])] for t in tasks]
+    local = sum(1 for r in by_key.values() if r.get('source') == 'local')
+    print(f"📋 批量查询任务状态: {len(by_key)} 个任务，本地 {local} 个")
+    return {
+        'tasks': results,
+        'local': local,
+        'upstream': sum(1 for r in by_key.values() if r.get('source') == 'upstream'),
+        'failed': sum(1 for r in by_key.values() if not r['success'])
+    }
+
+
+def stats() -> Dict[str, Any]:
+    return {**_stats, 'visual_results': len(_visual_results)}
@@ -0,0 +1,350 @@
+"""
+视频任务本地状态存储
+创建方舟视频任务时注入本服务的回调地址，回调到达后更新本地状态并通知等待中的客户端；
+未按时收到回调的任务由后台巡检兜底查询上游
+
+用户提供的 callback_url 由本服务转发，只接受 https 地址，发送前解析域名并拒绝内网、回环、链路本地等非公网地址，
+连接固定到解析出的地址且不跟随重定向
+"""
+import hmac
+import time
+import socket
+import asyncio
+import hashlib
+import secrets
+import ipaddress
+import httpx
+from collections import OrderedDict
+from urllib.parse import urlparse, urlunparse
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from config import settings
+from asset_routes import attach_proxy_urls
+from task_routes import key_fingerprint, record_task_status
+from upstream_scheduler import upstream_priority
+import credential_pool
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+# 最多保留的任务数，超出后优先淘汰最久未更新的任务
+_MAX_TASKS = 10000
+# 巡检循环的间隔（秒）
+_SWEEP_TICK = 5
+# 转发用户回调的重试次数
+_RELAY_ATTEMPTS = 3
+
+# 回调地址签名密钥；未配置时每次启动随机生成，重启前注入的回调将无法通过校验，由巡检兜底
+_callback_secret = (settings.video_callback_secret or secrets.token_hex(32)).encode('utf-8')
+
+
+def _sign_nonce(nonce: str) -> str:
+    return hmac.new(_callback_secret, nonce.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _callback_reachable() -> bool:
+    """public_base_url 指向本机时上游无法回调，不注入回调地址"""
+    if not settings.public_base_url:
+        return False
+    host = (urlparse(settings.public_base_url).hostname or '').lower()
+    return host not in ('', 'localhost', '127.0.0.1', '0.0.0.0', '::1')
+
+
+def _is_public_address(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def validate_callback_url(url: str) -> str:
+    """
+    校验用户提供的回调地址：必须是 https，主机为 IP 时必须是公网地址（域名在转发时解析校验）
+
+    Raises:
+        ValueError: 地址不符合要求
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != 'https' or not parsed.hostname:
+        raise ValueError('callback_url 必须是 https 地址')
+    try:
+        ipaddress.ip_address(parsed.hostname)
+    except ValueError:
+        return url
+    if not _is_public_address(parsed.hostname):
+        raise ValueError('callback_url 不能指向内网地址')
+    return url
+
+
+async def _resolve_public(host: str, port: int) -> Optional[str]:
+    """解析回调域名，任一解析结果不是公网地址时返回 None，否则返回用于连接的地址"""
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        return None
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(_is_public_address(address) for address in addresses):
+        return None
+    return addresses[0]
+
+
+class VideoTaskState:
+    """单个视频任务的本地状态"""
+
+    def __init__(self, task_id: str, api_key: str, callback_nonce: Optional[str],
+                 user_callback_url: Optional[str]):
+        self.task_id = task_id
+        self.owner = key_fingerprint(api_key)
+        # 仅保存在内存中，用于兜底巡检时查询上游
+        self.api_key = api_key
+        self.callback_nonce = callback_nonce
+        self.user_callback_url = user_callback_url
+        self.data: Optional[Dict[str, Any]] = None
+        self.version = 0
+        # 最近一次通过回调或查询上游获得状态的时间
+        self.checked_at = 0.0
+        # 注入了回调的任务只需低频巡检
+        self.sweep_after = settings.video_sweep_interval if callback_nonce else settings.video_poll_interval
+
+    @property
+    def status(self) -> Optional[str]:
+        return (self.data or {}).get('status')
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    @property
+    def fresh(self) -> bool:
+        """本地状态是否足够新，可以直接返回而无需查询上游"""
+        return self.terminal or time.monotonic() - self.checked_at < self.sweep_after
+
+
+class VideoTaskStore:
+    """视频任务状态存储与通知"""
+
+    def __init__(self):
+        self._tasks: "OrderedDict[str, VideoTaskState]" = OrderedDict()
+        self._nonces: Dict[str, str] = {}
+        # 任务创建接口返回之前就到达的回调
+        self._early_callbacks: Dict[str, Dict[str, Any]] = {}
+        self._changed = asyncio.Condition()
+        self._sweeper: Optional[asyncio.Task] = None
+        self._background = set()
+
+    def new_callback(self) -> Tuple[Optional[str], Optional[str]]:
+        """
+        生成一个带签名的回调地址
+
+        Returns:
+            (nonce, callback_url)；未启用回调或上游无法访问本服务时返回 (None, None)
+        """
+        if not settings.video_callback_enabled or not _callback_reachable():
+            return None, None
+        nonce = secrets.token_urlsafe(16)
+        base_url = settings.public_base_url.rstrip('/')
+        return nonce, f"{base_url}/api/volcano/video/callback/{nonce}/{_sign_nonce(nonce)}"
+
+    def verify_callback(self, nonce: str, signature: str) -> bool:
+        """校验回调地址签名"""
+        return hmac.compare_digest(_sign_nonce(nonce), signature)
+
+    async def register(self, task_id: str, api_key: str, callback_nonce: Optional[str],
+                       user_callback_url: Optional[str]) -> VideoTaskState:
+        """登记新创建的任务"""
+        state = VideoTaskState(task_id, api_key, callback_nonce, user_callback_url)
+        state.checked_at = time.monotonic()
+        self._tasks[task_id] = state
+        if callback_nonce:
+            self._nonces[callback_nonce] = task_id
+        self._evict()
+
+        early = self._early_callbacks.pop(callback_nonce, None) if callback_nonce else None
+        if early is not None:
+            await self.update(task_id, early)
+        return state
+
+    def _evict(self):
+        while len(self._tasks) > _MAX_TASKS:
+            _, state = self._tasks.popitem(last=False)
+            if state.callback_nonce:
+                self._nonces.pop(state.callback_nonce, None)
+
+    def get(self, task_id: str, api_key: str) -> Optional[VideoTaskState]:
+        """获取任务状态；API Key 与创建时不一致时视为不存在"""
+        state = self._tasks.get(task_id)
+        if state is None or not hmac.compare_digest(state.owner, key_fingerprint(api_key)):
+            return None
+        return state
+
+    def track(self, task_id: str, api_key: str) -> VideoTaskState:
+        """
+        获取任务状态，未登记时返回一个不登记的空状态
+
+        未登记的任务（例如服务重启前创建的任务）在上游查询成功后由 update(..., api_key) 登记，
+        任意任务ID不会占用本地存储
+        """
+        state = self.get(task_id, api_key)
+        if state is None:
+            state = VideoTaskState(task_id, api_key, None, None)
+        return state
+
+    async def update(self, task_id: str, data: Dict[str, Any],
+                     api_key: Optional[str] = None) -> Optional[VideoTaskState]:
+        """
+        写入任务的最新状态并通知等待方
+
+        乱序到达的旧状态（updated_at 更小）会被忽略
+
+        Args:
+            api_key: 用该 API Key 查询上游得到的状态，任务未登记时登记为未注入回调的任务
+        """
+        state = self._tasks.get(task_id)
+        if state is None:
+            if api_key is None or data.get('id') != task_id:
+                return None
+            state = self._tasks[task_id] = VideoTaskState(task_id, api_key, None, None)
+            self._evict()
+
+        state.checked_at = time.monotonic()
+        old = state.data or {}
+        if (data.get('updated_at') or 0) < (old.get('updated_at') or 0):
+            return state
+
+        status_changed = data.get('status') != old.get('status')
+        attach_proxy_urls(data, prefetch=data.get('status') == 'succeeded')
+        self._tasks.move_to_end(task_id)
+
+        async with self._changed:
+            state.data = data
+            state.version += 1
+            self._changed.notify_all()
+
+        if status_changed:
+            print(f"🎬 视频任务状态更新: {task_id} -> {data.get('status')}")
+            await record_task_status('ark', task_id, data.get('status'), data)
+            if state.user_callback_url:
+                self._spawn(self._relay_callback(state.user_callback_url, data))
+        return state
+
+    async def ingest_callback(self, nonce: str, data: Dict[str, Any]) -> bool:
+        """
+        处理上游回调
+
+        Returns:
+            回调是否对应一个已登记的任务
+        """
+        task_id = self._nonces.get(nonce)
+        if task_id is None:
+            # 创建接口尚未返回时先暂存，登记任务时再应用
+            if data.get('id') and len(self._early_callbacks) < _MAX_TASKS:
+                self._early_callbacks[nonce] = data
+            return False
+        if data.get('id') != task_id:
+            print(f"⚠️ 回调任务ID不匹配: 期望 {task_id}, 实际 {data.get('id')}")
+            return False
+        await self.update(task_id, data)
+        return True
+
+    async def wait_for_change(self, state: VideoTaskState, version: int, timeout: float) -> bool:
+        """
+        等待任务状态版本超过 version
+
+        Returns:
+            超时前是否发生了变化
+        """
+        try:
+            async with self._changed:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: state.version > version or state.terminal),
+                    timeout
+                )
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _relay_callback(self, url: str, data: Dict[str, Any]):
+        """把任务状态转发给用户提供的回调地址"""
+        payload = {k: v for k, v in data.items() if k not in ('proxy_urls', 'preview_urls')}
+        parsed = urlparse(url)
+        for attempt in range(_RELAY_ATTEMPTS):
+            try:
+                address = await _resolve_public(parsed.hostname, parsed.port or 443)
+                if address is None:
+                    print(f"⚠️ 拒绝转发视频任务回调: {parsed.hostname} 不是公网地址")
+                    return
+                # 连接固定到校验过的地址，证书仍按原域名校验
+                host = f"[{address}]" if ':' in address else address
+                pinned = urlunparse(parsed._replace(netloc=f"{host}:{parsed.port or 443}"))
+                async with httpx.AsyncClient(timeout=10.0, follow_redirects=False, trust_env=False) as client:
+                    response = await client.post(
+                        pinned, json=payload,
+                        headers={'Host': parsed.netloc.rsplit('@', 1)[-1]},
+                        extensions={'sni_hostname': parsed.hostname}
+                    )
+                if response.status_code < 500:
+                    return
+            except Exception as e:
+                print(f"⚠️ 转发视频任务回调失败 ({attempt + 1}/{_RELAY_ATTEMPTS}): {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(2 ** attempt)
+
+    def _spawn(self, coro: Awaitable):
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def start_sweeper(self, fetch: Callable[[str, str], Awaitable[Dict[str, Any]]]):
+        """
+        启动兜底巡检
+
+        Args:
+            fetch: 查询上游任务的函数 (task_id, api_key) -> VolcanoAPIService 风格的结果
+        """
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(fetch))
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self, fetch: Callable[[str, str], Awaitable[Dict[str, Any]]]):
+        # 巡检的任务在登记时已校验过凭证池令牌
+        with upstream_priority('background'), credential_pool.trusted_execution():
+            await self._sweep_forever(fetch)
+
+    async def _sweep_forever(self, fetch: Callable[[str, str], Awaitable[Dict[str, Any]]]):
+        while True:
+            await asyncio.sleep(_SWEEP_TICK)
+            # 查询失败过且从未获得状态的任务（如任务ID不存在）不参与巡检
+            due = [
+                state for state in list(self._tasks.values())
+                if (state.data is not None or state.callback_nonce) and not state.terminal and not state.fresh
+            ]
+            for state in due:
+                try:
+                    result = await fetch(state.task_id, state.api_key)
+                except Exception as e:
+                    result = {'success': False, 'error': {'message': str(e)}}
+                if result['success']:
+                    await self.update(state.task_id, result['data'])
+                else:
+                    # 查询失败时推迟到下一个巡检周期
+                    state.checked_at = time.monotonic()
+                    print(f"⚠️ 巡检视频任务失败: {state.task_id} {result['error'].get('message')}")
+
+    def stats(self) -> Dict[str, Any]:
+        """跟踪中的任务数"""
+        return {
+            'tasks': len(self._tasks),
+            'active': sum(1 for state in self._tasks.values() if not state.terminal),
+            'early_callbacks': len(self._early_callbacks),
+            'background': len(self._background)
+        }
+
+
+video_task_store = VideoTaskStore()
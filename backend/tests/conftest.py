@@ -0,0 +1,18 @@
+"""
+测试环境：数据库和缓存使用相对路径，在临时目录中运行
+"""
+import os
+import sys
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from config import settings  # noqa: E402
+
+settings.endpoint_probe_interval = 0
+
+from database import init_db  # noqa: E402
+
+asyncio.run(init_db())
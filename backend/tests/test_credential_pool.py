@@ -0,0 +1,65 @@
+"""
+凭证池令牌校验
+过期令牌只能在服务端后台执行的上下文（任务队列、巡检）中使用，不能通过请求头绕过；
+只有 credential_pool_users 中的用户可以使用凭证池
+"""
+import asyncio
+from datetime import timedelta
+from fastapi.testclient import TestClient
+from auth import create_access_token
+from config import settings
+from upstream_scheduler import upstream_priority
+from volcano_api_service import VolcanoAPIService
+import credential_pool
+import main
+
+EXPIRED_TOKEN = credential_pool.POOL_PREFIX + create_access_token(
+    {'sub': 'alice'}, expires_delta=timedelta(days=-30)
+)
+
+
+def _get_video_task():
+    return VolcanoAPIService().get_video_task('cgt-expired', EXPIRED_TOKEN)
+
+
+def test_expired_token_rejected_with_batch_priority():
+    async def run():
+        with upstream_priority('batch'):
+            return await _get_video_task()
+
+    result = asyncio.run(run())
+    assert result['success'] is False
+    assert result['error']['code'] == credential_pool.POOL_UNAUTHORIZED_CODE
+
+
+def test_expired_token_rejected_with_batch_header():
+    with TestClient(main.app) as client:
+        response = client.get(
+            '/api/volcano/video/tasks/cgt-expired',
+            headers={'Authorization': f'Bearer {EXPIRED_TOKEN}', 'X-Request-Priority': 'batch'}
+        )
+    assert response.status_code == 401
+    assert response.json()['detail']['code'] == credential_pool.POOL_UNAUTHORIZED_CODE
+
+
+def test_expired_token_accepted_in_trusted_execution(monkeypatch):
+    monkeypatch.setattr(settings, 'credential_pool_users', ['alice'])
+
+    async def run():
+        with credential_pool.trusted_execution():
+            return await _get_video_task()
+
+    result = asyncio.run(run())
+    # 通过令牌校验，凭证池中没有登记密钥
+    assert result['error']['code'] == credential_pool.POOL_UNAVAILABLE_CODE
+
+
+def test_unlisted_user_rejected():
+    token = credential_pool.POOL_PREFIX + create_access_token({'sub': 'mallory'})
+
+    async def run():
+        with credential_pool.trusted_execution():
+            return await VolcanoAPIService().get_video_task('cgt-unlisted', token)
+
+    result = asyncio.run(run())
+    assert result['error']['code'] == credential_pool.POOL_UNAUTHORIZED_CODE
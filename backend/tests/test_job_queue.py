@@ -0,0 +1,147 @@
+"""
+后台任务队列：重试判定、凭证加密与清除、等待者计数、投递次数上限
+"""
+import json
+import asyncio
+from sqlalchemy import select, update
+from database import async_session_maker, Job
+from job_queue import JobQueue, _is_retryable
+import secret_box
+
+
+def test_retryable_errors():
+    assert _is_retryable({'message': 'HTTP 503: Service Unavailable'})
+    assert _is_retryable({'message': 'HTTP 429: Too Many Requests'})
+    assert _is_retryable({'message': 'ConnectTimeout: ', 'retryable': True})
+    assert _is_retryable({'code': '50429', 'message': 'qps limit'})
+
+
+def test_other_errors_are_terminal():
+    assert not _is_retryable({'message': 'HTTP 400: Bad Request'})
+    assert not _is_retryable({'message': "KeyError: 'data'"})
+    assert not _is_retryable({'code': 'API_ERROR', 'message': 'invalid req_key'})
+    assert not _is_retryable('unexpected')
+
+
+async def _stored_credentials(job_id):
+    async with async_session_maker() as session:
+        return (await session.execute(select(Job.credentials).where(Job.id == job_id))).scalar_one()
+
+
+def test_credentials_encrypted_and_wiped_on_dead():
+    queue = JobQueue()
+
+    async def fail(payload, credentials):
+        assert credentials == {'api_key': 'sk-secret'}
+        return {'success': False, 'error': {'message': 'HTTP 400: Bad Request'}}
+
+    queue.register_handler('test_dead', fail, ('api_key',))
+
+    async def run():
+        job_id = await queue.enqueue('test_dead', 'owner', {}, {'api_key': 'sk-secret'})
+        stored = await _stored_credentials(job_id)
+        assert 'sk-secret' not in stored
+        assert secret_box.decrypt(stored) == {'api_key': 'sk-secret'}
+
+        await queue.start()
+        try:
+            await queue.wait(job_id, 5)
+        finally:
+            await queue.stop()
+        job = await queue.get(job_id)
+        assert job.status == 'dead'
+        assert await _stored_credentials(job_id) is None
+
+        assert queue.missing_credentials('test_dead', {}) == ['api_key']
+        assert await queue.requeue(job_id, {'api_key': 'sk-secret'})
+        assert secret_box.decrypt(await _stored_credentials(job_id)) == {'api_key': 'sk-secret'}
+
+    asyncio.run(run())
+
+
+def test_waiter_timeout_keeps_shared_event():
+    queue = JobQueue()
+    release = None
+
+    async def slow(payload, credentials):
+        await release.wait()
+        return {'success': True, 'data': {'ok': True}}
+
+    queue.register_handler('test_wait', slow, ('api_key',))
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        job_id = await queue.enqueue('test_wait', 'owner', {}, {'api_key': 'k'})
+        await queue.start()
+        try:
+            long_wait = asyncio.ensure_future(queue.wait(job_id, 5))
+            # 另一个等待者先超时离开，不能影响仍在等待的请求
+            await queue.wait(job_id, 0.1)
+            release.set()
+            await asyncio.wait_for(long_wait, 2)
+        finally:
+            await queue.stop()
+        job = await queue.get(job_id)
+        assert job.status == 'succeeded'
+        assert json.loads(job.result) == {'ok': True}
+
+    asyncio.run(run())
+
+
+def test_exhausted_job_dead_lettered_on_redelivery():
+    queue = JobQueue()
+    calls = []
+
+    async def handler(payload, credentials):
+        calls.append(payload)
+        return {'success': True, 'data': {}}
+
+    queue.register_handler('test_exhausted', handler, ('api_key',))
+
+    async def run():
+        job_id = await queue.enqueue('test_exhausted', 'owner', {}, {'api_key': 'k'})
+        # 模拟每次执行都导致进程退出：任务停在 running，投递次数已达上限
+        async with async_session_maker() as session:
+            await session.execute(
+                update(Job).where(Job.id == job_id).values(status='running', attempts=Job.max_attempts)
+            )
+            await session.commit()
+        await queue.start()
+        try:
+            await queue.wait(job_id, 5)
+        finally:
+            await queue.stop()
+        job = await queue.get(job_id)
+        assert job.status == 'dead'
+        assert job.credentials is None
+        assert calls == []
+
+    asyncio.run(run())
+
+
+def test_undecryptable_credentials_dead_lettered():
+    queue = JobQueue()
+
+    async def handler(payload, credentials):
+        raise AssertionError('不应执行')
+
+    queue.register_handler('test_plain', handler, ('api_key',))
+
+    async def run():
+        job_id = await queue.enqueue('test_plain', 'owner', {}, {'api_key': 'k'})
+        async with async_session_maker() as session:
+            await session.execute(
+                update(Job).where(Job.id == job_id).values(credentials=json.dumps({'api_key': 'k'}))
+            )
+            await session.commit()
+        await queue.start()
+        try:
+            await queue.wait(job_id, 5)
+        finally:
+            await queue.stop()
+        job = await queue.get(job_id)
+        assert job.status == 'dead'
+        assert job.credentials is None
+
+    asyncio.run(run())
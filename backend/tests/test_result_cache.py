@@ -0,0 +1,43 @@
+"""
+结果缓存键：按凭证隔离、签名URL规范化、缓存任务ID绑定提交者
+"""
+import asyncio
+import result_cache
+
+REQUEST = {'req_key': 'jimeng_i2i_v30', 'prompt': 'x', 'seed': 42}
+
+
+def _key(owner, request_data):
+    return asyncio.run(result_cache.request_key('visual:CVProcess:2022-08-31', owner, request_data))
+
+
+def test_key_includes_owner():
+    assert _key('owner-a', REQUEST) != _key('owner-b', REQUEST)
+    assert _key('owner-a', REQUEST) == _key('owner-a', dict(REQUEST))
+
+
+def test_random_seed_not_cached():
+    assert _key('owner-a', {**REQUEST, 'seed': -1}) is None
+
+
+def test_signed_urls_share_key():
+    signed = 'https://ark-content-generation-v2-cn-beijing.tos-cn-beijing.volces.com/a/b.png?X-Tos-Algorithm=TOS4-HMAC-SHA256&X-Tos-Signature={}'
+    first = _key('owner-a', {**REQUEST, 'image_urls': [signed.format('aaa')]})
+    second = _key('owner-a', {**REQUEST, 'image_urls': [signed.format('bbb')]})
+    assert first is not None and first == second
+
+    processed = _key('owner-a', {**REQUEST, 'image_urls': [signed.format('aaa') + '&x-tos-process=image/resize,w_100']})
+    assert processed != first
+
+
+def test_unknown_host_not_cached():
+    assert _key('owner-a', {**REQUEST, 'image_urls': ['https://example.com/a.png']}) is None
+
+
+def test_cached_task_id_bound_to_owner():
+    key = _key('owner-a', REQUEST)
+    task_id = result_cache.cached_task_id(key, 'owner-a')
+    assert result_cache.is_cached_task(task_id)
+    assert result_cache.cached_task_key(task_id, 'owner-a') == key
+    assert result_cache.cached_task_key(task_id, 'owner-b') is None
+    assert result_cache.cached_task_key(result_cache.CACHED_TASK_PREFIX + key, 'owner-a') is None
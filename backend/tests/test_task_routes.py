@@ -0,0 +1,32 @@
+"""
+任务历史归属：火山引擎凭证需要同时提供 AK 和 SK
+"""
+import asyncio
+from fastapi.testclient import TestClient
+from task_routes import key_fingerprint, record_task_submit
+import main
+
+OWNER = key_fingerprint('ak-owner', 'sk-owner')
+asyncio.run(record_task_submit('visual', 'task-owned', OWNER, 'jimeng_t2i_v40', 'CVSync2AsyncSubmitTask',
+                               {'prompt': 'x'}, 'in_queue'))
+
+
+def test_access_key_id_alone_rejected():
+    with TestClient(main.app) as client:
+        response = client.get('/api/tasks/visual/task-owned', headers={'X-Access-Key-Id': 'ak-owner'})
+    assert response.status_code == 401
+
+
+def test_wrong_secret_cannot_read_task():
+    with TestClient(main.app) as client:
+        response = client.get('/api/tasks/visual/task-owned',
+                              headers={'X-Access-Key-Id': 'ak-owner', 'X-Secret-Access-Key': 'guess'})
+    assert response.status_code == 404
+
+
+def test_owner_reads_task():
+    with TestClient(main.app) as client:
+        response = client.get('/api/tasks/visual/task-owned',
+                              headers={'X-Access-Key-Id': 'ak-owner', 'X-Secret-Access-Key': 'sk-owner'})
+    assert response.status_code == 200
+    assert response.json()['task_id'] == 'task-owned'
@@ -0,0 +1,45 @@
+"""
+视频任务本地状态：用户回调地址校验，未确认存在的任务不占用本地存储
+"""
+import asyncio
+import pytest
+from task_store import VideoTaskStore, validate_callback_url, _resolve_public
+
+
+@pytest.mark.parametrize('url', [
+    'http://example.com/hook',
+    'https://127.0.0.1/hook',
+    'https://10.0.0.8/hook',
+    'https://169.254.169.254/latest/meta-data',
+    'https://[::1]/hook',
+    'https://[::ffff:192.168.1.1]/hook',
+    'file:///etc/passwd',
+])
+def test_callback_url_rejected(url):
+    with pytest.raises(ValueError):
+        validate_callback_url(url)
+
+
+def test_callback_url_accepted():
+    assert validate_callback_url('https://hooks.example.com/video') == 'https://hooks.example.com/video'
+
+
+def test_private_hostname_not_resolved_for_relay():
+    assert asyncio.run(_resolve_public('localhost', 443)) is None
+
+
+def test_track_registers_only_after_upstream_confirms():
+    store = VideoTaskStore()
+
+    async def run():
+        state = store.track('cgt-unknown', 'key-a')
+        assert state.data is None
+        assert store.stats()['tasks'] == 0
+        # 用其他任务ID的数据不能登记
+        assert await store.update('cgt-unknown', {'id': 'cgt-other', 'status': 'running'}, 'key-a') is None
+        await store.update('cgt-unknown', {'id': 'cgt-unknown', 'status': 'running'}, 'key-a')
+        assert store.stats()['tasks'] == 1
+        assert store.get('cgt-unknown', 'key-a').status == 'running'
+        assert store.get('cgt-unknown', 'key-b') is None
+
+    asyncio.run(run())
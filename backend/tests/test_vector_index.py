@@ -0,0 +1,80 @@
+"""
+向量索引压缩：只保留有效行，压缩前后检索结果一致；压缩中途崩溃不影响已有数据
+"""
+import os
+import tempfile
+import numpy as np
+import vector_index
+from vector_index import VectorIndex
+
+DIM = 8
+
+
+def _vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def _fill(index, count):
+    vectors = _vectors(count)
+    index.upsert([(f"id-{i}", vectors[i], {'n': i}) for i in range(count)])
+    return vectors
+
+
+def test_compact_keeps_live_rows():
+    root = tempfile.mkdtemp()
+    index = VectorIndex(root, DIM)
+    vectors = _fill(index, 100)
+    index.delete([f"id-{i}" for i in range(0, 100, 2)])
+    # 覆盖写入产生一条失效行
+    index.upsert([('id-1', vectors[1], {'n': 'updated'})])
+    before = index.search(vectors[3], limit=5)
+
+    index.compact()
+    assert index.stats()['rows'] == 50
+    assert index.dead_ratio == 0
+    assert index.search(vectors[3], limit=5) == before
+
+    reopened = VectorIndex(root, DIM)
+    assert reopened.count == 50
+    assert reopened.search(vectors[1], limit=1)[0]['fields'] == {'n': 'updated'}
+    with open(reopened._records_path, encoding='utf-8') as f:
+        assert sum(1 for _ in f) == 50
+    assert not os.path.exists(os.path.join(root, 'records.jsonl'))
+
+    reopened.compact()
+    assert sorted(os.listdir(root)) == ['gen-2', 'index.json']
+
+
+def test_compact_on_load_past_dead_ratio(monkeypatch):
+    monkeypatch.setattr(vector_index, 'COMPACT_MIN_ROWS', 10)
+    root = tempfile.mkdtemp()
+    index = VectorIndex(root, DIM)
+    vectors = _fill(index, 40)
+    index.delete([f"id-{i}" for i in range(30)])
+
+    reopened = VectorIndex(root, DIM)
+    assert reopened.stats()['rows'] == 10
+    assert reopened.search(vectors[35], limit=1)[0]['id'] == 'id-35'
+
+
+def test_interrupted_compact_keeps_previous_generation(monkeypatch):
+    root = tempfile.mkdtemp()
+    index = VectorIndex(root, DIM)
+    vectors = _fill(index, 20)
+    index.delete(['id-0'])
+
+    def crash():
+        raise OSError('disk full')
+
+    # 新一代的数据文件写完、切换 index.json 之前崩溃
+    monkeypatch.setattr(index, '_save_meta', crash)
+    try:
+        index.compact()
+    except OSError:
+        pass
+    assert os.path.isdir(os.path.join(root, 'gen-1'))
+
+    reopened = VectorIndex(root, DIM)
+    assert not os.path.exists(os.path.join(root, 'gen-1'))
+    assert reopened.count == 19
+    assert reopened.search(vectors[7], limit=1)[0]['id'] == 'id-7'
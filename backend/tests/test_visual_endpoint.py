@@ -0,0 +1,20 @@
+"""
+视觉服务熔断器名称：客户端传入的未知 Action / req_key 归入 other
+"""
+from volcano_api_service import _visual_endpoint
+
+
+def _endpoint(action, req_key=None):
+    return _visual_endpoint({'action': action, 'request_data': {'req_key': req_key} if req_key else {}})
+
+
+def test_known_action_and_req_key():
+    assert _endpoint('CVSync2AsyncSubmitTask', 'jimeng_t2i_v40') == ('visual', 'CVSync2AsyncSubmitTask:jimeng_t2i_v40')
+    assert _endpoint('CVProcess') == ('visual', 'CVProcess')
+
+
+def test_unknown_values_bucketed():
+    assert _endpoint('CVProcess', 'inpainting_1700000000000') == ('visual', 'CVProcess:other')
+    assert _endpoint('Anything', 'jimeng_t2i_v40') == ('visual', 'other:jimeng_t2i_v40')
+    names = {_endpoint('CVProcess', f"random_{i}")[1] for i in range(100)}
+    assert names == {'CVProcess:other'}
@@ -1,16 +1,28 @@
 """
 TOS (对象存储) 文件上传路由
-提供文件上传到火山引擎TOS的HTTP接口
+提供文件上传到火山引擎TOS的HTTP接口，以及基于 TOS 分片上传的断点续传接口
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Header, Request
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
 import httpx
 import hashlib
+import base64
+import uuid
+import math
 import os
+import asyncio
 from datetime import datetime
+from sqlalchemy import select, update, delete, or_, and_, func
+from sqlalchemy.dialects.sqlite import insert
 from signature_v4 import SignatureV4
 import tos
+from tos.models2 import UploadedPart
+from config import settings
+from database import async_session_maker, UploadSession, UploadPart
+from blob_routes import save_upload_to_blob
+from task_routes import key_fingerprint, access_key_fingerprint
+import video_transcode
 
 router = APIRouter()
 
@@ -32,6 +44,43 @@ class TOSUploadResponse(BaseModel):
     error: Optional[str] = None
 
 
+# Bucket 实际所在区域，HeadBucket 成功后缓存
+_bucket_regions: Dict[str, str] = {}
+
+
+async def bucket_region(bucket: str, region: str, access_key_id: str, secret_access_key: str) -> str:
+    """
+    查询 Bucket 实际所在的区域，上传发往该区域的端点，避免跨区域传输
+
+    Args:
+        bucket: TOS Bucket名称
+        region: 客户端提供的区域，查询失败时使用
+        access_key_id: 访问密钥ID
+        secret_access_key: 访问密钥密钥
+    """
+    cached = _bucket_regions.get(bucket)
+    if cached is not None:
+        return cached
+
+    def _head():
+        return _tos_client_v2(access_key_id, secret_access_key, region).head_bucket(bucket).region
+
+    try:
+        actual = await asyncio.to_thread(_head)
+    except tos.exceptions.TosServerError as e:
+        # 跨区域访问时服务端在响应头中返回 Bucket 所在区域
+        actual = (e.header or {}).get('x-tos-bucket-region')
+    except Exception as e:
+        print(f"⚠️ 查询 Bucket 区域失败，使用 {region}: {type(e).__name__}: {str(e)}")
+        return region
+    if not actual:
+        return region
+    if actual != region:
+        print(f"🌐 Bucket {bucket} 位于 {actual}，上传改用该区域（客户端提供 {region}）")
+    _bucket_regions[bucket] = actual
+    return actual
+
+
 async def upload_to_tos(
     file_data: bytes,
     file_name: str,
@@ -55,6 +104,8 @@ async def upload_to_tos(
         包含上传结果的字典
     """
     try:
+        region = await bucket_region(bucket, region, access_key_id, secret_access_key)
+
         # 生成文件的唯一路径（使用时间戳和文件名）
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_hash = hashlib.md5(file_data[:1024]).hexdigest()[:8]
@@ -99,13 +150,72 @@ async def upload_to_tos(
         }
 
 
+async def upload_file_path_to_tos(
+    file_path: str,
+    object_key: str,
+    content_type: str,
+    bucket: str,
+    region: str,
+    access_key_id: str,
+    secret_access_key: str
+) -> dict:
+    """
+    把本地文件流式上传到TOS（不整体读入内存）
+
+    Args:
+        file_path: 本地文件路径
+        object_key: TOS对象键
+        content_type: 文件内容类型
+        bucket: TOS Bucket名称
+        region: TOS区域
+        access_key_id: 访问密钥ID
+        secret_access_key: 访问密钥密钥
+
+    Returns:
+        包含上传结果的字典
+    """
+    def _put():
+        auth = tos.auth.Auth(access_key_id, secret_access_key, region)
+        client = tos.TosClient(
+            auth=auth,
+            endpoint=f"https://tos-{region}.volces.com"
+        )
+        with open(file_path, 'rb') as f:
+            return client.put_object(
+                Bucket=bucket,
+                Key=object_key,
+                Body=f,
+                ContentType=content_type
+            )
+
+    try:
+        region = await bucket_region(bucket, region, access_key_id, secret_access_key)
+        # TOS SDK 是同步的，放到线程中执行避免阻塞事件循环
+        response = await asyncio.to_thread(_put)
+        if response:
+            return {
+                'success': True,
+                'url': f"https://{bucket}.tos-{region}.volces.com/{object_key}"
+            }
+        return {
+            'success': False,
+            'error': "上传失败"
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f"上传异常: {str(e)}"
+        }
+
+
 @router.post("/api/tos/upload", response_model=TOSUploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
     bucket: str = Form(...),
     region: str = Form(...),
     access_key_id: str = Form(...),
-    secret_access_key: str = Form(...)
+    secret_access_key: str = Form(...),
+    req_key: Optional[str] = Form(None)
 ):
     """
     上传文件到TOS
@@ -116,6 +226,7 @@ async def upload_file(
     - region: TOS区域 (如: cn-beijing)
     - access_key_id: 访问密钥ID
     - secret_access_key: 访问密钥密钥
+    - req_key: 可选，视频将用于的视觉服务 req_key，提供时先按该接口的规格规范化再上传
     
     返回:
     - success: 是否成功
@@ -130,6 +241,23 @@ async def upload_file(
         print(f"  - Region: {region}")
         print(f"  - Access Key ID: {access_key_id[:10]}...{access_key_id[-4:] if len(access_key_id) > 14 else ''}")
         print(f"  - Secret Key: {'*' * 20}")
+        
+        if req_key and (file.content_type or '').startswith('video/'):
+            # 视频先写入 Blob 存储并规范化，再从磁盘流式上传
+            blob = await video_transcode.normalize_blob(await save_upload_to_blob(file), req_key)
+            result = await upload_file_path_to_tos(
+                file_path=blob['path'],
+                object_key=video_transcode.object_key(blob),
+                content_type=blob['content_type'],
+                bucket=bucket,
+                region=region,
+                access_key_id=access_key_id,
+                secret_access_key=secret_access_key
+            )
+            if not result['success']:
+                raise HTTPException(status_code=500, detail=result['error'])
+            return TOSUploadResponse(success=True, url=result['url'])
+        
         # 读取文件数据
         file_data = await file.read()
         
@@ -160,3 +288,346 @@ async def upload_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
+
+
+# ==================== 断点续传上传 ====================
+#
+# 1. POST   /api/tos/uploads                      创建上传会话，返回分片大小和分片数
+# 2. PUT    /api/tos/uploads/{id}/parts/{n}       上传分片，请求体为分片原始字节，可并行上传
+# 3. GET    /api/tos/uploads/{id}                 查询已上传的分片，断线后只需补传缺失的分片
+# 4. POST   /api/tos/uploads/{id}/complete        合并分片
+# 5. DELETE /api/tos/uploads/{id}                 放弃上传
+#
+# 分片状态保存在 SQLite 中，服务重启后仍可继续上传；每个分片需携带 X-Part-SHA256 校验和
+
+# TOS 分片上传的分片大小下限（最后一片除外）与分片数上限
+_MIN_PART_SIZE = 5 * 1024 * 1024
+_MAX_PARTS = 10000
+
+
+class ResumableUploadInitRequest(BaseModel):
+    """创建断点续传上传会话请求"""
+    filename: str
+    size: int = Field(..., gt=0, description="文件总字节数")
+    content_type: Optional[str] = None
+    bucket: str
+    region: str
+    part_size: Optional[int] = Field(None, description="期望的分片大小，不填使用服务端默认值")
+
+
+class ResumableUploadPart(BaseModel):
+    """已上传的分片"""
+    part_number: int
+    size: int
+    sha256: str
+
+
+class ResumableUploadResponse(BaseModel):
+    """断点续传上传会话"""
+    upload_id: str
+    object_key: str
+    size: int
+    part_size: int
+    part_count: int
+    status: str
+    parts: List[ResumableUploadPart] = []
+    url: Optional[str] = None
+
+
+def _tos_client_v2(access_key_id: str, secret_access_key: str, region: str) -> tos.TosClientV2:
+    return tos.TosClientV2(access_key_id, secret_access_key, f"tos-{region}.volces.com", region)
+
+
+def _part_size_for(size: int, requested: Optional[int]) -> int:
+    """确定分片大小：不小于 TOS 下限，且分片数不超过上限"""
+    part_size = requested or settings.resumable_part_size
+    part_size = max(_MIN_PART_SIZE, min(part_size, settings.resumable_part_max_bytes))
+    return max(part_size, math.ceil(size / _MAX_PARTS))
+
+
+def _expected_part_size(session: UploadSession, part_number: int) -> int:
+    if part_number < session.part_count:
+        return session.part_size
+    return session.size - session.part_size * (session.part_count - 1)
+
+
+async def _get_owned_session(upload_id: str, access_key_id: str, secret_access_key: str) -> UploadSession:
+    owner = access_key_fingerprint(access_key_id, secret_access_key)
+    async with async_session_maker() as db:
+        session = await db.get(UploadSession, upload_id)
+    if session is None or session.owner != owner:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return session
+
+
+async def _session_response(session: UploadSession) -> ResumableUploadResponse:
+    async with async_session_maker() as db:
+        parts = (await db.execute(
+            select(UploadPart).where(UploadPart.session_id == session.id).order_by(UploadPart.part_number)
+        )).scalars().all()
+    return ResumableUploadResponse(
+        upload_id=session.id,
+        object_key=session.object_key,
+        size=session.size,
+        part_size=session.part_size,
+        part_count=session.part_count,
+        status=session.status,
+        parts=[ResumableUploadPart(part_number=p.part_number, size=p.size, sha256=p.sha256) for p in parts],
+        url=session.url
+    )
+
+
+@router.post("/api/tos/uploads", response_model=ResumableUploadResponse)
+async def create_resumable_upload(
+    request: ResumableUploadInitRequest,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """
+    创建断点续传上传会话
+
+    需要在请求头中提供：
+    - X-Access-Key-Id: 访问密钥ID
+    - X-Secret-Access-Key: 访问密钥密钥
+    """
+    if request.size > settings.resumable_upload_max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"文件大小超过{settings.resumable_upload_max_bytes // (1024 * 1024)}MB限制"
+        )
+
+    upload_id = uuid.uuid4().hex
+    part_size = _part_size_for(request.size, request.part_size)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    object_key = f"uploads/{timestamp}_{upload_id[:8]}{os.path.splitext(request.filename)[1]}"
+    content_type = request.content_type or 'application/octet-stream'
+    region = await bucket_region(request.bucket, request.region, x_access_key_id, x_secret_access_key)
+
+    def _create():
+        client = _tos_client_v2(x_access_key_id, x_secret_access_key, region)
+        return client.create_multipart_upload(request.bucket, object_key, content_type=content_type)
+
+    try:
+        output = await asyncio.to_thread(_create)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"创建分片上传失败: {str(e)}")
+
+    session = UploadSession(
+        id=upload_id,
+        owner=key_fingerprint(x_access_key_id, x_secret_access_key),
+        bucket=request.bucket,
+        region=region,
+        object_key=object_key,
+        tos_upload_id=output.upload_id,
+        filename=request.filename,
+        content_type=content_type,
+        size=request.size,
+        part_size=part_size,
+        part_count=math.ceil(request.size / part_size),
+        status='uploading'
+    )
+    async with async_session_maker() as db:
+        db.add(session)
+        await db.commit()
+
+    print(f"📤 创建断点续传上传: {request.filename} ({request.size} bytes, {session.part_count} 片) -> {object_key}")
+    return await _session_response(session)
+
+
+@router.get("/api/tos/uploads/{upload_id}", response_model=ResumableUploadResponse)
+async def get_resumable_upload(
+    upload_id: str,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """查询上传会话及已上传的分片，客户端据此补传缺失的分片"""
+    return await _session_response(await _get_owned_session(upload_id, x_access_key_id, x_secret_access_key))
+
+
+@router.put("/api/tos/uploads/{upload_id}/parts/{part_number}", response_model=ResumableUploadPart)
+async def upload_resumable_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    x_part_sha256: str = Header(..., alias="X-Part-SHA256"),
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """
+    上传一个分片
+
+    请求体为分片的原始字节，X-Part-SHA256 为分片内容的 SHA256（十六进制）。
+    校验和不一致时返回 400，客户端应重传该分片；同一分片重复上传以最后一次为准。
+    """
+    session = await _get_owned_session(upload_id, x_access_key_id, x_secret_access_key)
+    if session.status != 'uploading':
+        raise HTTPException(status_code=409, detail=f"上传会话状态为 {session.status}，无法继续上传")
+    if not 1 <= part_number <= session.part_count:
+        raise HTTPException(status_code=400, detail=f"分片序号应在 1-{session.part_count} 之间")
+
+    expected_size = _expected_part_size(session, part_number)
+    # 边接收边计算校验和，不在事件循环中一次性哈希整个分片；TOS SDK 只接受 bytes，接收完后拼接一次
+    chunks = []
+    received = 0
+    sha256_hasher = hashlib.sha256()
+    md5_hasher = hashlib.md5()
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > expected_size:
+            raise HTTPException(status_code=400, detail=f"分片 {part_number} 超过预期大小 {expected_size} 字节")
+        sha256_hasher.update(chunk)
+        md5_hasher.update(chunk)
+        chunks.append(chunk)
+    if received != expected_size:
+        raise HTTPException(status_code=400, detail=f"分片 {part_number} 大小应为 {expected_size} 字节，实际 {received} 字节")
+
+    sha256 = sha256_hasher.hexdigest()
+    if sha256 != x_part_sha256.lower():
+        raise HTTPException(status_code=400, detail=f"分片 {part_number} 校验和不一致")
+    data = b''.join(chunks)
+
+    # 同时携带 Content-MD5，由 TOS 校验转存过程中的完整性
+    content_md5 = base64.b64encode(md5_hasher.digest()).decode('ascii')
+
+    def _upload():
+        client = _tos_client_v2(x_access_key_id, x_secret_access_key, session.region)
+        return client.upload_part(
+            session.bucket, session.object_key, session.tos_upload_id, part_number,
+            content_md5=content_md5, content=data
+        )
+
+    try:
+        output = await asyncio.to_thread(_upload)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"分片 {part_number} 上传失败: {str(e)}")
+
+    async with async_session_maker() as db:
+        await db.execute(
+            insert(UploadPart)
+            .values(session_id=upload_id, part_number=part_number, size=len(data), sha256=sha256, etag=output.etag)
+            .on_conflict_do_update(
+                index_elements=['session_id', 'part_number'],
+                set_={'size': len(data), 'sha256': sha256, 'etag': output.etag}
+            )
+        )
+        await db.commit()
+
+    return ResumableUploadPart(part_number=part_number, size=len(data), sha256=sha256)
+
+
+@router.post("/api/tos/uploads/{upload_id}/complete", response_model=ResumableUploadResponse)
+async def complete_resumable_upload(
+    upload_id: str,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """
+    合并全部分片，完成上传
+
+    合并失败时会话回到 uploading，可以重试；合并请求中断后停留在 completing 状态的会话
+    超过 resumable_complete_timeout 秒后也可以重试
+    """
+    session = await _get_owned_session(upload_id, x_access_key_id, x_secret_access_key)
+    if session.status == 'completed':
+        return await _session_response(session)
+
+    async with async_session_maker() as db:
+        parts = (await db.execute(
+            select(UploadPart).where(UploadPart.session_id == upload_id).order_by(UploadPart.part_number)
+        )).scalars().all()
+        uploaded = {part.part_number for part in parts}
+        missing = [n for n in range(1, session.part_count + 1) if n not in uploaded]
+        if missing:
+            raise HTTPException(
+                status_code=409,
+                detail=f"还有 {len(missing)} 个分片未上传: {missing[:20]}"
+            )
+
+        # 条件更新，避免重复合并
+        stale = func.datetime('now', f"-{settings.resumable_complete_timeout} seconds")
+        claimed = await db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == upload_id,
+                or_(
+                    UploadSession.status == 'uploading',
+                    and_(UploadSession.status == 'completing', UploadSession.updated_at < stale)
+                )
+            )
+            .values(status='completing')
+        )
+        await db.commit()
+    if not claimed.rowcount:
+        raise HTTPException(status_code=409, detail="上传会话正在合并或已结束")
+
+    def _complete():
+        client = _tos_client_v2(x_access_key_id, x_secret_access_key, session.region)
+        return client.complete_multipart_upload(
+            session.bucket, session.object_key, session.tos_upload_id,
+            parts=[UploadedPart(part.part_number, part.etag) for part in parts]
+        )
+
+    def _object_uploaded() -> bool:
+        """上次合并可能已在 TOS 完成但未记录（进程退出），对象已存在且大小一致时视为完成"""
+        client = _tos_client_v2(x_access_key_id, x_secret_access_key, session.region)
+        try:
+            return client.head_object(session.bucket, session.object_key).content_length == session.size
+        except Exception:
+            return False
+
+    completed = False
+    try:
+        try:
+            await asyncio.to_thread(_complete)
+        except Exception as e:
+            if not await asyncio.to_thread(_object_uploaded):
+                raise HTTPException(status_code=502, detail=f"合并分片失败: {str(e)}")
+        completed = True
+    finally:
+        if not completed:
+            # 合并失败或请求被取消，回到 uploading 允许重试
+            async with async_session_maker() as db:
+                await db.execute(
+                    update(UploadSession)
+                    .where(UploadSession.id == upload_id, UploadSession.status == 'completing')
+                    .values(status='uploading')
+                )
+                await db.commit()
+
+    url = f"https://{session.bucket}.tos-{session.region}.volces.com/{session.object_key}"
+    async with async_session_maker() as db:
+        await db.execute(
+            update(UploadSession).where(UploadSession.id == upload_id).values(status='completed', url=url)
+        )
+        await db.commit()
+    session.status, session.url = 'completed', url
+
+    print(f"✅ 断点续传上传完成: {session.filename} -> {url}")
+    return await _session_response(session)
+
+
+@router.delete("/api/tos/uploads/{upload_id}")
+async def abort_resumable_upload(
+    upload_id: str,
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+):
+    """放弃上传，释放 TOS 中已上传的分片"""
+    session = await _get_owned_session(upload_id, x_access_key_id, x_secret_access_key)
+    if session.status == 'completed':
+        raise HTTPException(status_code=409, detail="上传已完成，无法取消")
+
+    def _abort():
+        client = _tos_client_v2(x_access_key_id, x_secret_access_key, session.region)
+        client.abort_multipart_upload(session.bucket, session.object_key, session.tos_upload_id)
+
+    try:
+        await asyncio.to_thread(_abort)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"取消分片上传失败: {str(e)}")
+
+    async with async_session_maker() as db:
+        await db.execute(update(UploadSession).where(UploadSession.id == upload_id).values(status='aborted'))
+        await db.execute(delete(UploadPart).where(UploadPart.session_id == upload_id))
+        await db.commit()
+    return {"success": True}
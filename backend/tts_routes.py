@@ -0,0 +1,307 @@
+"""
+语音合成路由
+基于大模型语音合成 V3 HTTP 单向流式接口，音频分片到达即转发给客户端；
+合成结果按内容寻址缓存到本地磁盘，相同台词再次合成时直接从磁盘返回
+"""
+import os
+import json
+import asyncio
+import hashlib
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, Optional, List, AsyncIterator
+from config import settings
+from disk_cache import DiskCache
+from file_responses import ranged_file_response
+from volcano_api_service import VolcanoAPIService
+
+router = APIRouter()
+api_service = VolcanoAPIService()
+
+tts_cache = DiskCache(
+    os.path.join(settings.cache_dir, 'tts'),
+    max_bytes=settings.tts_cache_max_bytes
+)
+
+AUDIO_CONTENT_TYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'pcm': 'audio/pcm',
+    'ogg_opus': 'audio/ogg'
+}
+
+# 正在合成的音频，相同参数的并发请求共享同一次合成
+_inflight: Dict[str, "_Synthesis"] = {}
+# 后台合成任务引用，防止被垃圾回收
+_synthesis_tasks = set()
+
+
+class TTSAppConfig(BaseModel):
+    """应用凭证"""
+    appid: str
+    token: str
+    cluster: Optional[str] = None
+
+
+class TTSUserConfig(BaseModel):
+    """用户信息"""
+    uid: Optional[str] = None
+
+
+class TTSAudioConfig(BaseModel):
+    """音频参数"""
+    voice_type: str
+    encoding: str = "mp3"
+    speed_ratio: float = Field(1.0, ge=0.5, le=2.0)
+    rate: int = 24000
+    loudness_ratio: float = Field(1.0, ge=0.5, le=2.0)
+    emotion: Optional[str] = None
+    enable_emotion: Optional[bool] = None
+    emotion_scale: Optional[int] = Field(None, ge=1, le=5)
+    explicit_language: Optional[str] = None
+
+
+class TTSRequestConfig(BaseModel):
+    """合成请求参数"""
+    text: str = Field(..., min_length=1)
+    reqid: Optional[str] = None
+    operation: Optional[str] = None
+    model: Optional[str] = None
+
+
+class TTSSynthesizeRequest(BaseModel):
+    """语音合成请求（沿用 V1 的 app/user/audio/request 结构）"""
+    app: TTSAppConfig
+    user: Optional[TTSUserConfig] = None
+    audio: TTSAudioConfig
+    request: TTSRequestConfig
+    resource_id: Optional[str] = Field(None, description="V3 资源ID，默认取 settings.tts_resource_id")
+    stream: Optional[bool] = Field(False, description="为 true 时直接返回音频流，否则返回音频地址")
+
+
+class _Synthesis:
+    """进行中的合成，已到达的音频分片可被多个下游同时读取"""
+
+    def __init__(self, content_type: str):
+        self.content_type = content_type
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self._changed = asyncio.Condition()
+
+    async def append(self, chunk: bytes):
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[str] = None):
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def wait_first_chunk(self):
+        """等待第一个音频分片到达或合成结束"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.chunks or self.done)
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """从头依次产出音频分片，直到合成结束"""
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                done, error = self.done, self.error
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if done and index >= len(self.chunks):
+                if error:
+                    raise RuntimeError(error)
+                return
+
+
+def _cache_key(request: TTSSynthesizeRequest) -> str:
+    """
+    计算音频缓存键
+
+    除音色、文本、语速、格式外，采样率、音量、情感、语种、模型同样影响输出，一并计入。
+    """
+    audio = request.audio
+    material = json.dumps({
+        'voice': audio.voice_type,
+        'text': request.request.text,
+        'speed': audio.speed_ratio,
+        'format': audio.encoding,
+        'rate': audio.rate,
+        'loudness': audio.loudness_ratio,
+        'emotion': audio.emotion if audio.enable_emotion is not False else None,
+        'emotion_scale': audio.emotion_scale,
+        'language': audio.explicit_language,
+        'model': request.request.model,
+        'resource_id': request.resource_id or settings.tts_resource_id
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _ratio_to_rate(ratio: float) -> int:
+    """把 V1 的倍率（0.5~2.0）换算为 V3 的取值（-50~100）"""
+    return max(-50, min(100, round((ratio - 1.0) * 100)))
+
+
+def _build_payload(request: TTSSynthesizeRequest) -> Dict[str, Any]:
+    """把 V1 结构的请求转换为 V3 请求体"""
+    audio = request.audio
+    audio_params = {
+        'format': audio.encoding,
+        'sample_rate': audio.rate,
+        'speech_rate': _ratio_to_rate(audio.speed_ratio),
+        'loudness_rate': _ratio_to_rate(audio.loudness_ratio)
+    }
+    if audio.emotion and audio.enable_emotion is not False:
+        audio_params['emotion'] = audio.emotion
+        if audio.emotion_scale:
+            audio_params['emotion_scale'] = audio.emotion_scale
+
+    req_params = {
+        'text': request.request.text,
+        'speaker': audio.voice_type,
+        'audio_params': audio_params
+    }
+    if request.request.model:
+        req_params['model'] = request.request.model
+    if audio.explicit_language:
+        req_params['additions'] = json.dumps({'explicit_language': audio.explicit_language})
+
+    return {
+        'user': {'uid': (request.user.uid if request.user else None) or 'volcano-ai-tools'},
+        'req_params': req_params
+    }
+
+
+async def _run_synthesis(key: str, synthesis: _Synthesis, request: TTSSynthesizeRequest):
+    error = None
+    try:
+        result = await api_service.stream_speech(
+            request.app.appid,
+            request.app.token,
+            request.resource_id or settings.tts_resource_id,
+            _build_payload(request)
+        )
+        if not result['success']:
+            error = result['error']['message']
+        else:
+            async for chunk in result['stream']:
+                await synthesis.append(chunk)
+            if not synthesis.chunks:
+                error = "未返回音频数据"
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+
+    try:
+        if error is None:
+            entry = await asyncio.to_thread(
+                tts_cache.put_bytes,
+                key,
+                b''.join(synthesis.chunks),
+                {'content_type': synthesis.content_type, 'voice': request.audio.voice_type}
+            )
+            print(f"🔊 语音已缓存: {key[:12]}... ({entry['size']} bytes)")
+        else:
+            print(f"❌ 语音合成失败: {error}")
+    finally:
+        _inflight.pop(key, None)
+        await synthesis.finish(error)
+
+
+def _start_synthesis(key: str, request: TTSSynthesizeRequest) -> _Synthesis:
+    """开始合成；相同参数正在合成时复用进行中的合成"""
+    synthesis = _inflight.get(key)
+    if synthesis is None:
+        synthesis = _Synthesis(AUDIO_CONTENT_TYPES.get(request.audio.encoding, 'application/octet-stream'))
+        _inflight[key] = synthesis
+        # 合成在后台进行，客户端中途断开也会继续写入缓存
+        task = asyncio.create_task(_run_synthesis(key, synthesis, request))
+        _synthesis_tasks.add(task)
+        task.add_done_callback(_synthesis_tasks.discard)
+    return synthesis
+
+
+def _stream_response(synthesis: _Synthesis) -> StreamingResponse:
+    return StreamingResponse(
+        synthesis.iter_chunks(),
+        media_type=synthesis.content_type,
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@router.post("/api/tts/synthesize")
+async def synthesize_speech(request: TTSSynthesizeRequest, http_request: Request):
+    """
+    语音合成
+
+    - stream=false（默认）: 第一个音频分片到达后即返回 {success, audioUrl}，
+      audioUrl 在合成过程中即可边下边播
+    - stream=true: 直接返回音频流
+
+    命中缓存时不再请求上游
+    """
+    key = _cache_key(request)
+    entry = tts_cache.get(key)
+
+    if request.stream:
+        if entry is not None:
+            return ranged_file_response(http_request, entry['path'], entry['meta']['content_type'])
+        synthesis = _start_synthesis(key, request)
+        await synthesis.wait_first_chunk()
+        if synthesis.error and not synthesis.chunks:
+            raise HTTPException(status_code=502, detail=synthesis.error)
+        return _stream_response(synthesis)
+
+    if entry is None:
+        synthesis = _start_synthesis(key, request)
+        await synthesis.wait_first_chunk()
+        if synthesis.error and not synthesis.chunks:
+            return {'success': False, 'error': synthesis.error}
+
+    return {
+        'success': True,
+        'audioUrl': str(http_request.url_for('get_tts_audio', key=key)),
+        'cached': entry is not None
+    }
+
+
+@router.get("/api/tts/audio/{key}")
+async def get_tts_audio(key: str, request: Request):
+    """
+    获取合成的音频
+
+    已缓存时支持 Range；仍在合成时按分片到达的顺序流式返回
+    """
+    try:
+        entry = tts_cache.get(key)
+    except ValueError:
+        entry = None
+    if entry is not None:
+        return ranged_file_response(
+            request,
+            entry['path'],
+            entry['meta']['content_type'],
+            headers={'Cache-Control': 'public, max-age=31536000, immutable'}
+        )
+
+    synthesis = _inflight.get(key)
+    if synthesis is None:
+        raise HTTPException(status_code=404, detail="音频不存在")
+    return _stream_response(synthesis)
+
+
+@router.get("/api/tts/stats")
+async def get_tts_stats():
+    """语音缓存统计"""
+    return {
+        **tts_cache.stats(),
+        'synthesizing': len(_inflight)
+    }
@@ -0,0 +1,231 @@
+"""
+上游调用调度器
+限制同时进行的上游调用数，并按优先级和用户公平地分配调用名额：
+
+- interactive（默认）: 用户正在等待的交互请求，排队时总是先于低优先级请求获得名额，
+  并独享一部分预留名额，不会被长时间运行的批量调用占满
+- batch: 后台队列提交等批量请求
+- background: 任务状态巡检等后台请求
+
+batch 与 background 之间按权重公平分配；同一优先级内按用户轮转，
+单个用户的大批量请求不会挤占其他用户的名额
+"""
+import time
+import asyncio
+import hashlib
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, Optional, Deque
+from config import settings
+
+PRIORITY_CLASSES = ('interactive', 'batch', 'background')
+
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar('upstream_priority', default='interactive')
+
+
+@contextmanager
+def upstream_priority(priority: str):
+    """在当前上下文中以指定优先级发起上游调用"""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"未知的优先级: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def set_upstream_priority(priority: str):
+    """设置当前上下文的上游调用优先级（用于请求级别的中间件）"""
+    if priority in PRIORITY_CLASSES:
+        _current_priority.set(priority)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+def _percentile(values, ratio: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+class _ClassQueue:
+    """单个优先级的等待队列，同一优先级内按用户轮转"""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        # 虚拟时间，每获得一个名额增加 1/weight，取最小者实现按权重分配
+        self.vtime = 0.0
+        self.users: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.waiting = 0
+        self.running = 0
+        self.granted = 0
+        self.waits: Deque[float] = deque(maxlen=1000)
+
+    def push(self, user: str, waiter: asyncio.Future):
+        self.users.setdefault(user, deque()).append(waiter)
+        self.waiting += 1
+
+    def remove(self, user: str, waiter: asyncio.Future):
+        waiters = self.users.get(user)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.waiting -= 1
+            if not waiters:
+                del self.users[user]
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """取出下一个等待者：轮到的用户取其最早的请求，之后该用户排到队尾"""
+        while self.users:
+            user, waiters = next(iter(self.users.items()))
+            waiter = waiters.popleft()
+            self.waiting -= 1
+            if waiters:
+                self.users.move_to_end(user)
+            else:
+                del self.users[user]
+            if not waiter.done():
+                return waiter
+        return None
+
+
+class UpstreamScheduler:
+    """上游调用名额调度"""
+
+    def __init__(self, capacity: int, interactive_reserved: int, weights: Dict[str, float]):
+        """
+        Args:
+            capacity: 同时进行的上游调用上限
+            interactive_reserved: 只供 interactive 使用的名额数
+            weights: batch / background 的权重
+        """
+        self.capacity = capacity
+        self.interactive_reserved = min(interactive_reserved, capacity - 1)
+        self._queues = {
+            'interactive': _ClassQueue(1.0),
+            'batch': _ClassQueue(weights.get('batch', 3.0)),
+            'background': _ClassQueue(weights.get('background', 1.0)),
+        }
+        self._running = 0
+
+    def _can_start(self, priority: str) -> bool:
+        if self._running >= self.capacity:
+            return False
+        if priority == 'interactive':
+            return True
+        non_interactive = self._running - self._queues['interactive'].running
+        return non_interactive < self.capacity - self.interactive_reserved
+
+    def _grant(self, priority: str):
+        queue = self._queues[priority]
+        self._running += 1
+        queue.running += 1
+        queue.granted += 1
+        queue.vtime += 1.0 / queue.weight
+
+    def _next_priority(self) -> Optional[str]:
+        """选出下一个获得名额的优先级：interactive 优先，其余按虚拟时间最小者"""
+        interactive = self._queues['interactive']
+        if interactive.waiting and self._can_start('interactive'):
+            return 'interactive'
+        candidates = [
+            name for name in ('batch', 'background')
+            if self._queues[name].waiting and self._can_start(name)
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda name: self._queues[name].vtime)
+
+    def _dispatch(self):
+        while True:
+            priority = self._next_priority()
+            if priority is None:
+                return
+            waiter = self._queues[priority].pop()
+            if waiter is None:
+                continue
+            self._grant(priority)
+            waiter.set_result(None)
+
+    def _release(self, priority: str):
+        self._running -= 1
+        self._queues[priority].running -= 1
+        self._dispatch()
+
+    def _activate(self, priority: str):
+        """队列由空变为非空时对齐虚拟时间，空闲期间不累积额度"""
+        queue = self._queues[priority]
+        if queue.waiting == 0 and priority != 'interactive':
+            active = [q.vtime for name, q in self._queues.items()
+                      if name != 'interactive' and name != priority and q.waiting]
+            if active:
+                queue.vtime = max(queue.vtime, min(active))
+
+    @asynccontextmanager
+    async def slot(self, user_key: Optional[str] = None):
+        """
+        获取一个上游调用名额
+
+        Args:
+            user_key: 调用方凭证，用于同一优先级内的按用户轮转
+        """
+        priority = current_priority()
+        queue = self._queues[priority]
+        user = hashlib.sha256((user_key or '').encode('utf-8')).hexdigest()[:16]
+        started = time.monotonic()
+
+        # 同优先级已有排队请求时直接排队，保证先到先得和用户轮转
+        if queue.waiting == 0 and self._can_start(priority):
+            self._grant(priority)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._activate(priority)
+            queue.push(user, waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 已获得名额但调用方已取消，归还名额
+                    self._release(priority)
+                else:
+                    queue.remove(user, waiter)
+                raise
+
+        queue.waits.append(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def stats(self) -> Dict[str, Any]:
+        """各优先级的排队、运行数量与等待耗时"""
+        classes = {}
+        for name, queue in self._queues.items():
+            waits = list(queue.waits)
+            p50 = _percentile(waits, 0.5)
+            p95 = _percentile(waits, 0.95)
+            classes[name] = {
+                'waiting': queue.waiting,
+                'running': queue.running,
+                'granted': queue.granted,
+                'waiting_users': len(queue.users),
+                'wait_p50_ms': None if p50 is None else round(p50 * 1000, 1),
+                'wait_p95_ms': None if p95 is None else round(p95 * 1000, 1)
+            }
+        return {
+            'capacity': self.capacity,
+            'interactive_reserved': self.interactive_reserved,
+            'running': self._running,
+            'classes': classes
+        }
+
+
+upstream_scheduler = UpstreamScheduler(
+    settings.upstream_concurrency,
+    settings.upstream_interactive_reserved,
+    settings.upstream_class_weights
+)
@@ -0,0 +1,415 @@
+"""
+本地向量索引
+基于 NumPy 内存映射文件的 IVF（倒排文件）近似最近邻索引，向量按余弦相似度检索。
+数据量较小时直接暴力检索，超过阈值后自动训练聚类中心并按 nprobe 个倒排桶检索。
+
+写入和删除只追加记录，被覆盖或删除的行留在文件中；打开索引时失效行占比超过 COMPACT_DEAD_RATIO
+会自动压缩（只保留有效行重写数据文件），也可以调用 compact() 手动压缩。
+压缩时在新的代目录（gen-<n>）中写入全部数据文件，再原子替换 index.json 切换到新一代；
+中途崩溃时 index.json 仍指向旧一代，打开索引时清理未完成的代目录。
+"""
+import os
+import json
+import shutil
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+
+# 达到该数据量后才训练 IVF 聚类中心，之前暴力检索已足够快
+IVF_MIN_ROWS = 10000
+# 数据量增长到上次训练时的倍数后重新训练
+RETRAIN_GROWTH = 2.0
+# 训练聚类中心时最多采样的数据量（每个中心）
+TRAIN_SAMPLES_PER_LIST = 256
+# 打开索引时失效行（被覆盖或删除）占比超过该值则压缩
+COMPACT_DEAD_RATIO = 0.5
+# 行数少于该值时不自动压缩
+COMPACT_MIN_ROWS = 1024
+INITIAL_CAPACITY = 1024
+_DATA_FILES = ('records.jsonl', 'vectors.f32', 'assign.i32', 'centroids.npy')
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """球面 k-means，返回归一化后的聚类中心"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # 空桶重新随机选点，避免中心退化
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    """单个数据集的本地向量索引"""
+
+    def __init__(self, root: str, dim: int):
+        """
+        打开（或创建）位于 root 目录下的索引
+
+        Args:
+            root: 索引数据目录
+            dim: 向量维度
+        """
+        self.root = root
+        self.dim = dim
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+        self._meta_path = os.path.join(root, 'index.json')
+        meta = {}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        self._capacity = meta.get('capacity', INITIAL_CAPACITY)
+        self._trained_rows = meta.get('trained_rows', 0)
+        self._use_generation(meta.get('generation', 0))
+        self._remove_stale_generations()
+
+        self._vectors = self._open_memmap(self._vectors_path, np.float32, (self._capacity, dim))
+        self._assign = self._open_memmap(self._assign_path, np.int32, (self._capacity,), fill=-1)
+        self._centroids = np.load(self._centroids_path) if os.path.exists(self._centroids_path) else None
+
+        self._ids: List[Optional[str]] = []
+        self._fields: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._lists: Optional[List[np.ndarray]] = None
+        self._load_records()
+        if len(self._ids) >= COMPACT_MIN_ROWS and self.dead_ratio > COMPACT_DEAD_RATIO:
+            self.compact()
+
+    def _generation_dir(self, generation: int) -> str:
+        """第 0 代的数据文件直接位于 root 目录"""
+        return self.root if generation == 0 else os.path.join(self.root, f'gen-{generation}')
+
+    def _use_generation(self, generation: int):
+        self._generation = generation
+        data_dir = self._generation_dir(generation)
+        self._records_path = os.path.join(data_dir, 'records.jsonl')
+        self._vectors_path = os.path.join(data_dir, 'vectors.f32')
+        self._assign_path = os.path.join(data_dir, 'assign.i32')
+        self._centroids_path = os.path.join(data_dir, 'centroids.npy')
+
+    def _remove_generation(self, generation: int):
+        if generation == 0:
+            for name in _DATA_FILES:
+                path = os.path.join(self.root, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            shutil.rmtree(self._generation_dir(generation), ignore_errors=True)
+
+    def _remove_stale_generations(self):
+        """清理未完成的压缩留下的代目录，以及切换后未删除的旧一代"""
+        for name in os.listdir(self.root):
+            if name.startswith('gen-') and name != f'gen-{self._generation}':
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        if self._generation != 0:
+            self._remove_generation(0)
+
+    def _open_memmap(self, path: str, dtype, shape: Tuple[int, ...], fill=0) -> np.memmap:
+        if not os.path.exists(path):
+            array = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+            array[:] = fill
+            array.flush()
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _load_records(self):
+        if not os.path.exists(self._records_path):
+            return
+        with open(self._records_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                row = record['row']
+                while len(self._ids) <= row:
+                    self._ids.append(None)
+                    self._fields.append(None)
+                if record.get('deleted'):
+                    self._drop_row(row)
+                    continue
+                old_row = self._rows.get(record['id'])
+                if old_row is not None:
+                    self._drop_row(old_row)
+                self._ids[row] = record['id']
+                self._fields[row] = record.get('fields', {})
+                self._rows[record['id']] = row
+
+    def _drop_row(self, row: int):
+        record_id = self._ids[row]
+        if record_id is not None and self._rows.get(record_id) == row:
+            del self._rows[record_id]
+        self._ids[row] = None
+        self._fields[row] = None
+
+    def _save_meta(self):
+        """原子替换 index.json，压缩时以此切换数据文件的代"""
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dim': self.dim,
+                'capacity': self._capacity,
+                'trained_rows': self._trained_rows,
+                'generation': self._generation
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._meta_path)
+
+    def _grow(self, needed: int):
+        """容量不足时按倍数扩容内存映射文件"""
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+
+        for path, dtype, shape, fill, attr in (
+            (self._vectors_path, np.float32, (capacity, self.dim), 0, '_vectors'),
+            (self._assign_path, np.int32, (capacity,), -1, '_assign'),
+        ):
+            old = getattr(self, attr)
+            tmp_path = path + '.tmp'
+            new = np.memmap(tmp_path, dtype=dtype, mode='w+', shape=shape)
+            new[:] = fill
+            new[:len(old)] = old
+            new.flush()
+            del new
+            old.flush()
+            setattr(self, attr, None)
+            del old
+            os.replace(tmp_path, path)
+            setattr(self, attr, np.memmap(path, dtype=dtype, mode='r+', shape=shape))
+
+        self._capacity = capacity
+        self._save_meta()
+
+    @property
+    def count(self) -> int:
+        """有效数据条数"""
+        return len(self._rows)
+
+    @property
+    def dead_ratio(self) -> float:
+        """失效行占数据文件行数的比例"""
+        return 1 - self.count / len(self._ids) if self._ids else 0.0
+
+    def compact(self):
+        """只保留有效行，在新的代目录中重写向量、倒排分配和记录文件后切换"""
+        with self._lock:
+            rows = np.sort(np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows)))
+            before = len(self._ids)
+            capacity = INITIAL_CAPACITY
+            while capacity < len(rows):
+                capacity *= 2
+
+            generation = self._generation + 1
+            data_dir = self._generation_dir(generation)
+            shutil.rmtree(data_dir, ignore_errors=True)
+            os.makedirs(data_dir)
+
+            for name, dtype, shape, fill, attr in (
+                ('vectors.f32', np.float32, (capacity, self.dim), 0, '_vectors'),
+                ('assign.i32', np.int32, (capacity,), -1, '_assign'),
+            ):
+                old = getattr(self, attr)
+                new = np.memmap(os.path.join(data_dir, name), dtype=dtype, mode='w+', shape=shape)
+                new[:] = fill
+                for begin in range(0, len(rows), 65536):
+                    chunk = rows[begin:begin + 65536]
+                    new[begin:begin + len(chunk)] = old[chunk]
+                new.flush()
+                del new
+
+            ids = [self._ids[row] for row in rows]
+            fields = [self._fields[row] for row in rows]
+            with open(os.path.join(data_dir, 'records.jsonl'), 'w', encoding='utf-8') as f:
+                for row, (record_id, record_fields) in enumerate(zip(ids, fields)):
+                    f.write(json.dumps({'row': row, 'id': record_id, 'fields': record_fields}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if self._centroids is not None:
+                np.save(os.path.join(data_dir, 'centroids.npy'), self._centroids)
+
+            # 新一代的数据文件全部写完后才切换
+            old_generation = self._generation
+            self._vectors = None
+            self._assign = None
+            self._use_generation(generation)
+            self._capacity = capacity
+            self._save_meta()
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+            self._assign = np.memmap(self._assign_path, dtype=np.int32, mode='r+', shape=(capacity,))
+            self._remove_generation(old_generation)
+
+            self._ids = ids
+            self._fields = fields
+            self._rows = {record_id: row for row, record_id in enumerate(ids)}
+            self._lists = None
+            print(f"🗜️ 向量索引压缩完成: {self.root}, rows={before} -> {len(ids)}")
+
+    def upsert(self, items: List[Tuple[str, np.ndarray, Dict[str, Any]]]):
+        """
+        写入或更新数据
+
+        Args:
+            items: (主键, 向量, 字段) 列表；主键已存在时覆盖旧数据
+        """
+        if not items:
+            return
+        with self._lock:
+            vectors = _normalize(np.asarray([vector for _, vector, _ in items], dtype=np.float32))
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不匹配: 期望 {self.dim}, 实际 {vectors.shape[1]}")
+
+            start = len(self._ids)
+            self._grow(start + len(items))
+            self._vectors[start:start + len(items)] = vectors
+            self._vectors.flush()
+
+            with open(self._records_path, 'a', encoding='utf-8') as f:
+                for offset, (record_id, _, fields) in enumerate(items):
+                    row = start + offset
+                    old_row = self._rows.get(record_id)
+                    if old_row is not None:
+                        self._drop_row(old_row)
+                    self._ids.append(record_id)
+                    self._fields.append(fields)
+                    self._rows[record_id] = row
+                    f.write(json.dumps({'row': row, 'id': record_id, 'fields': fields}, ensure_ascii=False) + '\n')
+
+            if self._centroids is not None:
+                self._assign[start:start + len(items)] = np.argmax(vectors @ self._centroids.T, axis=1)
+                self._assign.flush()
+                self._lists = None
+
+            if self.count >= IVF_MIN_ROWS and self.count >= self._trained_rows * RETRAIN_GROWTH:
+                self.train()
+
+    def delete(self, ids: List[str]):
+        """按主键删除数据"""
+        with self._lock:
+            with open(self._records_path, 'a', encoding='utf-8') as f:
+                for record_id in ids:
+                    row = self._rows.get(record_id)
+                    if row is None:
+                        continue
+                    self._drop_row(row)
+                    f.write(json.dumps({'row': row, 'deleted': True}) + '\n')
+            self._lists = None
+
+    def train(self):
+        """训练 IVF 聚类中心并重新分配所有数据"""
+        with self._lock:
+            alive = np.fromiter(self._rows.values(), dtype=np.int64)
+            if len(alive) == 0:
+                return
+            nlist = int(min(4096, max(16, np.sqrt(len(alive)) * 2)))
+            nlist = min(nlist, len(alive))
+
+            rng = np.random.default_rng(0)
+            sample_size = min(len(alive), nlist * TRAIN_SAMPLES_PER_LIST)
+            sample_rows = np.sort(rng.choice(alive, sample_size, replace=False))
+            centroids = _kmeans(np.asarray(self._vectors[sample_rows]), nlist)
+
+            total = len(self._ids)
+            for begin in range(0, total, 65536):
+                end = min(begin + 65536, total)
+                self._assign[begin:end] = np.argmax(np.asarray(self._vectors[begin:end]) @ centroids.T, axis=1)
+            self._assign.flush()
+
+            np.save(self._centroids_path, centroids)
+            self._centroids = centroids
+            self._trained_rows = len(alive)
+            self._lists = None
+            self._save_meta()
+            print(f"🧭 向量索引训练完成: {self.root}, rows={len(alive)}, nlist={nlist}")
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            total = len(self._ids)
+            alive_mask = np.zeros(total, dtype=bool)
+            alive_mask[np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))] = True
+            assign = np.asarray(self._assign[:total])
+            order = np.argsort(assign, kind='stable')
+            order = order[alive_mask[order]]
+            bounds = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    def search(self, query: np.ndarray, limit: int = 10, nprobe: Optional[int] = None,
+               field_filter: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """
+        近似最近邻检索
+
+        Args:
+            query: 查询向量
+            limit: 返回条数
+            nprobe: 检索的倒排桶数量，默认取聚类中心数的 1/8
+            field_filter: 按字段过滤的函数
+
+        Returns:
+            [{'id', 'score', 'fields'}]，按相似度从高到低排序
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        if query.shape[0] != self.dim:
+            raise ValueError(f"向量维度不匹配: 期望 {self.dim}, 实际 {query.shape[0]}")
+
+        with self._lock:
+            if not self._rows:
+                return []
+
+            if self._centroids is None:
+                candidates = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+            else:
+                lists = self._inverted_lists()
+                nprobe = nprobe or max(1, len(self._centroids) // 8)
+                probe = np.argsort(-(self._centroids @ query))[:nprobe]
+                candidates = np.concatenate([lists[i] for i in probe])
+
+            if field_filter is not None:
+                candidates = np.asarray([row for row in candidates if field_filter(self._fields[row])], dtype=np.int64)
+            if len(candidates) == 0:
+                return []
+
+            candidates = np.sort(candidates)
+            scores = np.asarray(self._vectors[candidates]) @ query
+            k = min(limit, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                {
+                    'id': self._ids[candidates[i]],
+                    'score': float(scores[i]),
+                    'fields': self._fields[candidates[i]]
+                }
+                for i in top
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计信息"""
+        with self._lock:
+            return {
+                'count': self.count,
+                'dim': self.dim,
+                'capacity': self._capacity,
+                'rows': len(self._ids),
+                'dead_ratio': round(self.dead_ratio, 4),
+                'nlist': 0 if self._centroids is None else len(self._centroids),
+                'trained_rows': self._trained_rows
+            }
@@ -0,0 +1,99 @@
+"""
+视频规范化路由
+上传驱动视频并按目标接口规格转码，转码过程中以 NDJSON 流返回进度
+"""
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Header, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from config import settings
+from blob_routes import save_upload_to_blob, blob_url
+from tos_routes import upload_file_path_to_tos
+import video_transcode
+
+router = APIRouter(tags=["视频规范化"])
+
+# 进度事件的推送间隔（秒）
+_PROGRESS_INTERVAL = 0.5
+
+
+def _event(**fields) -> bytes:
+    return (json.dumps(fields, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+@router.post("/api/videos/normalize")
+async def normalize_video(
+    file: UploadFile = File(...),
+    req_key: Optional[str] = Form(None),
+    tos_bucket: Optional[str] = Form(None),
+    tos_region: Optional[str] = Form(None),
+    x_access_key_id: Optional[str] = Header(None, alias="X-Access-Key-Id"),
+    x_secret_access_key: Optional[str] = Header(None, alias="X-Secret-Access-Key")
+):
+    """
+    上传并规范化驱动视频
+
+    按 req_key 对应接口的规格截取、缩放并重新编码，已满足规格的视频不转码。
+    提供 tos_bucket/tos_region 及访问密钥时结果上传到 TOS，否则由本服务 /api/blobs 提供访问。
+
+    返回 application/x-ndjson 流，每行一个事件：
+    - {"event": "progress", "status": "transcoding", "progress": 0.42}
+    - {"event": "done", "url": "...", "digest": "...", "size": 123, "transcoded": true}
+    - {"event": "error", "message": "..."}
+    """
+    if tos_bucket and tos_region and not (x_access_key_id and x_secret_access_key):
+        raise HTTPException(status_code=401, detail="上传到 TOS 需要提供 X-Access-Key-Id 和 X-Secret-Access-Key")
+    if not (tos_bucket and tos_region) and not settings.public_base_url:
+        raise HTTPException(status_code=400, detail="未配置 public_base_url，需要指定 tos_bucket 和 tos_region")
+
+    source = await save_upload_to_blob(file)
+    if not source['content_type'].startswith('video/'):
+        raise HTTPException(status_code=400, detail="仅支持视频文件")
+    key = video_transcode.output_key(source['digest'], req_key)
+
+    async def _events():
+        task = asyncio.ensure_future(video_transcode.normalize_blob(source, req_key))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=_PROGRESS_INTERVAL)
+                if done:
+                    break
+                status = video_transcode.transcode_status(key) or {}
+                yield _event(event='progress', key=key, status=status.get('status'),
+                             progress=status.get('progress', 0.0))
+            result = task.result()
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        url = blob_url(result['digest'])
+        if tos_bucket and tos_region:
+            yield _event(event='progress', key=key, status='uploading', progress=1.0)
+            staged = await upload_file_path_to_tos(
+                file_path=result['path'],
+                object_key=video_transcode.object_key(result),
+                content_type=result['content_type'],
+                bucket=tos_bucket,
+                region=tos_region,
+                access_key_id=x_access_key_id,
+                secret_access_key=x_secret_access_key
+            )
+            if not staged['success']:
+                yield _event(event='error', key=key, message=staged['error'])
+                return
+            url = staged['url']
+
+        yield _event(event='done', key=key, url=url, digest=result['digest'], size=result['size'],
+                     transcoded=result['transcoded'])
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
+
+
+@router.get("/api/videos/normalize/{key}")
+async def get_normalize_status(key: str):
+    """查询视频规范化进度"""
+    status = video_transcode.transcode_status(key)
+    if status is None:
+        raise HTTPException(status_code=404, detail="转码任务不存在")
+    return {k: v for k, v in status.items() if k != 'path'}
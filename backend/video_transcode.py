@@ -0,0 +1,345 @@
+"""
+驱动视频规范化
+动作模仿、视频指令编辑等接口对输入视频有分辨率、帧率、时长和码率要求，
+用户上传的 4K / 高码率 / 超长视频在上传 TOS 前先用 ffmpeg 截取、缩放并重新编码到接口所需规格，
+上传和上游处理耗时都随之下降。
+
+- 转码在 ffmpeg 子进程中执行，同时进行的转码数受 settings.video_transcode_concurrency 限制
+- 结果按（源视频内容哈希, 规格）缓存，转码后的文件存入 Blob 存储
+- 已满足规格的视频直接使用原文件；未安装 ffmpeg 时跳过规范化
+"""
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+from fractions import Fraction
+from typing import Dict, Any, Optional, List
+from config import settings
+from disk_cache import DiskCache
+from blob_routes import blob_cache
+
+# 各接口的输入视频规格，按 req_key 前缀匹配
+VIDEO_PROFILES: Dict[str, Dict[str, Any]] = {
+    # 视频指令编辑：≤1080P、≤30fps、建议≤10秒、文件≤15MB
+    'videoedit': {
+        'prefixes': ('dm_seedance_videoedit',),
+        'max_short_side': 1080,
+        'max_fps': 30,
+        'max_duration': 10,
+        'max_bitrate': 8_000_000
+    },
+    # 动作模仿：建议5-30秒、码率≤5Mbps
+    'motion_imitation': {
+        'prefixes': ('realman_avatar_imitator', 'jimeng_dream_actor', 'jimeng_imitator'),
+        'max_short_side': 1080,
+        'max_fps': 30,
+        'max_duration': 30,
+        'max_bitrate': 5_000_000
+    },
+}
+DEFAULT_PROFILE: Dict[str, Any] = {
+    'max_short_side': 1080,
+    'max_fps': 30,
+    'max_duration': None,
+    'max_bitrate': 8_000_000
+}
+# 规格或编码参数变化时递增，使旧的转码结果失效
+_PROFILE_VERSION = 1
+# 判断是否超出规格时的容差
+_FPS_TOLERANCE = 0.5
+_DURATION_TOLERANCE = 0.1
+_BITRATE_TOLERANCE = 1.1
+# 记录的转码状态数上限
+_MAX_STATUS = 1000
+
+# 源视频 + 规格 -> 转码结果摘要
+_mapping_cache = DiskCache(
+    os.path.join(settings.cache_dir, 'videos'),
+    max_bytes=64 * 1024 * 1024
+)
+_semaphore = asyncio.Semaphore(settings.video_transcode_concurrency)
+_inflight: Dict[str, asyncio.Task] = {}
+# 转码状态: 缓存键 -> {'status', 'progress', ...}
+_status: Dict[str, Dict[str, Any]] = {}
+
+
+def available() -> bool:
+    """是否安装了 ffmpeg / ffprobe"""
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+
+def profile_for(req_key: Optional[str]) -> Dict[str, Any]:
+    """获取 req_key 对应的视频规格"""
+    for name, profile in VIDEO_PROFILES.items():
+        if req_key and req_key.startswith(profile['prefixes']):
+            return {'name': name, **profile}
+    return {'name': 'default', **DEFAULT_PROFILE}
+
+
+def output_key(source_digest: str, req_key: Optional[str]) -> str:
+    """转码结果的缓存键"""
+    profile = profile_for(req_key)
+    spec = {k: v for k, v in profile.items() if k != 'prefixes'}
+    material = json.dumps([source_digest, spec, _PROFILE_VERSION], sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def object_key(result: Dict[str, Any]) -> str:
+    """规范化结果在 TOS 中的对象键"""
+    if result.get('transcoded'):
+        return f"uploads/videos/{result['digest']}.mp4"
+    return f"uploads/blobs/{result['digest']}"
+
+
+def transcode_status(key: str) -> Optional[Dict[str, Any]]:
+    """查询转码状态"""
+    return _status.get(key)
+
+
+async def probe(path: str) -> Optional[Dict[str, Any]]:
+    """
+    读取视频信息
+
+    Returns:
+        包含 width、height（按旋转后的显示方向）、fps、duration、bitrate、codec、container 的字典；
+        不是视频或无法解析时返回 None
+    """
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    try:
+        info = json.loads(stdout)
+    except ValueError:
+        return None
+
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+    if video is None:
+        return None
+    fmt = info.get('format', {})
+
+    width, height = int(video.get('width') or 0), int(video.get('height') or 0)
+    rotation = int(video.get('tags', {}).get('rotate', 0) or 0)
+    for side_data in video.get('side_data_list', []):
+        rotation = int(side_data.get('rotation', rotation) or 0)
+    if abs(rotation) % 180 == 90:
+        width, height = height, width
+
+    try:
+        fps = float(Fraction(video.get('avg_frame_rate') or '0/1'))
+    except (ValueError, ZeroDivisionError):
+        fps = 0.0
+
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'duration': float(fmt.get('duration') or video.get('duration') or 0),
+        'bitrate': int(fmt.get('bit_rate') or 0),
+        'codec': video.get('codec_name'),
+        'container': fmt.get('format_name', ''),
+        'has_audio': any(s.get('codec_type') == 'audio' for s in info.get('streams', []))
+    }
+
+
+def _violations(info: Dict[str, Any], profile: Dict[str, Any]) -> List[str]:
+    """视频超出规格的项"""
+    reasons = []
+    if 'mp4' not in info['container'].split(','):
+        reasons.append('container')
+    if info['codec'] != 'h264':
+        reasons.append('codec')
+    if min(info['width'], info['height']) > profile['max_short_side']:
+        reasons.append('resolution')
+    if info['fps'] > profile['max_fps'] + _FPS_TOLERANCE:
+        reasons.append('fps')
+    if profile['max_duration'] and info['duration'] > profile['max_duration'] + _DURATION_TOLERANCE:
+        reasons.append('duration')
+    if info['bitrate'] > profile['max_bitrate'] * _BITRATE_TOLERANCE:
+        reasons.append('bitrate')
+    return reasons
+
+
+def _target_size(info: Dict[str, Any], max_short_side: int):
+    """按短边上限等比缩放，宽高取偶数"""
+    width, height = info['width'], info['height']
+    scale = min(1.0, max_short_side / min(width, height))
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def _ffmpeg_args(source: str, target: str, info: Dict[str, Any], profile: Dict[str, Any]) -> List[str]:
+    width, height = _target_size(info, profile['max_short_side'])
+    filters = [f"scale={width}:{height}"]
+    if info['fps'] > profile['max_fps'] + _FPS_TOLERANCE:
+        filters.append(f"fps={profile['max_fps']}")
+
+    args = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1', '-i', source]
+    if profile['max_duration']:
+        args += ['-t', str(profile['max_duration'])]
+    args += [
+        '-vf', ','.join(filters),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+        '-maxrate', str(profile['max_bitrate']), '-bufsize', str(profile['max_bitrate'] * 2),
+        '-pix_fmt', 'yuv420p',
+        '-map_metadata', '-1',
+        '-movflags', '+faststart'
+    ]
+    args += ['-c:a', 'aac', '-b:a', '128k'] if info['has_audio'] else ['-an']
+    args += ['-f', 'mp4', target]
+    return args
+
+
+async def _run_ffmpeg(args: List[str], duration: float, status: Dict[str, Any]):
+    """执行 ffmpeg，根据 -progress 输出更新进度"""
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+
+    async def _read_progress():
+        async for line in process.stdout:
+            key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+            if key == 'out_time_us' and value.isdigit() and duration > 0:
+                status['progress'] = round(min(0.99, int(value) / 1e6 / duration), 3)
+
+    try:
+        await asyncio.wait_for(_read_progress(), settings.video_transcode_timeout)
+        await process.wait()
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+    finally:
+        stderr = await stderr_task
+
+    if process.returncode != 0:
+        message = stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(f"ffmpeg 退出码 {process.returncode}: {message[-1] if message else ''}")
+
+
+def _hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _cached_output(key: str) -> Optional[Dict[str, Any]]:
+    entry = _mapping_cache.get(key)
+    if entry is None:
+        return None
+    with open(entry['path'], 'rb') as f:
+        output = json.loads(f.read())
+    # 转码结果可能已被 Blob 存储淘汰
+    blob = blob_cache.get(output['digest'])
+    if blob is None:
+        return None
+    return {**output, 'path': blob['path']}
+
+
+def _remember_status(key: str, status: Dict[str, Any]):
+    _status.pop(key, None)
+    _status[key] = status
+    while len(_status) > _MAX_STATUS:
+        _status.pop(next(iter(_status)))
+
+
+async def _normalize(key: str, source: Dict[str, Any], profile: Dict[str, Any],
+                     status: Dict[str, Any]) -> Dict[str, Any]:
+    info = await probe(source['path'])
+    if info is None:
+        raise RuntimeError("无法解析视频文件")
+
+    reasons = _violations(info, profile)
+    status['reasons'] = reasons
+    if not reasons:
+        output = {'digest': source['digest'], 'size': source['size'], 'transcoded': False}
+    else:
+        status['status'] = 'queued'
+        async with _semaphore:
+            status['status'] = 'transcoding'
+            started = time.monotonic()
+            target = blob_cache.new_temp_path()
+            try:
+                duration = min(info['duration'], profile['max_duration'] or info['duration'])
+                await _run_ffmpeg(_ffmpeg_args(source['path'], target, info, profile), duration, status)
+                digest = await asyncio.to_thread(_hash_file, target)
+                size = os.path.getsize(target)
+                if blob_cache.contains(digest):
+                    os.remove(target)
+                else:
+                    await asyncio.to_thread(
+                        blob_cache.put_file, digest, target,
+                        {'content_type': 'video/mp4', 'filename': f"{digest[:16]}.mp4"}
+                    )
+            finally:
+                if os.path.exists(target):
+                    os.remove(target)
+        print(f"🎞️ 视频已规范化 ({profile['name']}, {','.join(reasons)}): "
+              f"{source['size']} -> {size} bytes, 耗时 {time.monotonic() - started:.1f}s")
+        output = {'digest': digest, 'size': size, 'transcoded': True}
+
+    await asyncio.to_thread(
+        _mapping_cache.put_bytes, key, json.dumps(output).encode('utf-8'), {'content_type': 'application/json'}
+    )
+    return output
+
+
+async def normalize_blob(source: Dict[str, Any], req_key: Optional[str]) -> Dict[str, Any]:
+    """
+    把 Blob 存储中的视频规范化到 req_key 对应接口的规格
+
+    Args:
+        source: save_upload_to_blob 的返回值（digest、size、path）
+        req_key: 视觉服务 req_key，决定目标规格
+
+    Returns:
+        包含 digest、size、path、content_type、transcoded 的字典，digest / path 指向 Blob 存储中的结果文件；
+        未安装 ffmpeg 或视频无法解析时返回源文件
+    """
+    passthrough = {**source, 'transcoded': False}
+    if not settings.video_transcode_enabled or not available():
+        return passthrough
+
+    key = output_key(source['digest'], req_key)
+    cached = await asyncio.to_thread(_cached_output, key)
+    if cached is not None:
+        _remember_status(key, {'status': 'done', 'progress': 1.0, **cached})
+        return {**cached, 'content_type': 'video/mp4' if cached['transcoded'] else source['content_type']}
+
+    task = _inflight.get(key)
+    if task is None:
+        profile = profile_for(req_key)
+        status = {'status': 'probing', 'progress': 0.0, 'profile': profile['name']}
+        _remember_status(key, status)
+        task = asyncio.ensure_future(_normalize(key, source, profile, status))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    status = _status.get(key, {})
+    try:
+        # 多个请求等待同一转码时，单个请求断开不影响其他等待方
+        output = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        status.update({'status': 'failed', 'error': str(e)})
+        print(f"⚠️ 视频规范化失败，使用原文件: {type(e).__name__}: {str(e)}")
+        return passthrough
+
+    status.update({'status': 'done', 'progress': 1.0, **output})
+    blob = blob_cache.get(output['digest'])
+    return {
+        **output,
+        'path': blob['path'] if blob else source['path'],
+        'content_type': 'video/mp4' if output['transcoded'] else source['content_type']
+    }
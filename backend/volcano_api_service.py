@@ -4,17 +4,156 @@
 """
 import httpx
 import json
-from typing import Dict, Any, Optional
+import asyncio
+import base64
+import functools
+import inspect
+from typing import Dict, Any, Optional, AsyncIterator, Callable, Tuple
+from config import settings
 from signature_v4 import SignatureV4
+from upstream_scheduler import upstream_scheduler
+from circuit_breaker import circuit_breakers, CircuitOpenError, circuit_open_result, upstream_transport
+import deadline
+import credential_pool
+import payload_offload
+from endpoint_registry import endpoint_registry
+
+
+def _scheduled(user_of: Callable[[Dict[str, Any]], Optional[str]],
+               endpoint_of: Callable[[Dict[str, Any]], Tuple[str, str]]):
+    """
+    通过熔断器检查和上游调度器获取调用名额后再执行；凭证为凭证池令牌时从凭证池租用密钥
+
+    Args:
+        user_of: 从调用参数中取出调用方凭证，用于按用户公平分配名额
+        endpoint_of: 从调用参数中取出 (上游服务, 接口名)，用于选择端点和按主机、接口熔断
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            arguments = bound.arguments
+            user = user_of(arguments)
+            service, action = endpoint_of(arguments)
+            # 请求预算已耗尽或熔断中的调用在排队前直接失败，不占用调用名额和连接
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                print(f"⏱️ 请求已超过截止时间，放弃上游调用: {action}")
+                return deadline.deadline_exceeded_result()
+            # 任务查询发往提交任务的端点，其余调用选择延迟最低的健康端点
+            task_id = credential_pool.task_id_of(arguments)
+            endpoint = await endpoint_registry.resolve(service, task_id)
+            try:
+                call = circuit_breakers.begin(endpoint.url, action)
+            except CircuitOpenError as e:
+                return circuit_open_result(e)
+
+            async def invoke():
+                async with upstream_scheduler.slot(user):
+                    if left is not None:
+                        print(f"⏱️ 上游调用 {action}，剩余预算 {deadline.remaining():.1f}秒")
+                    return await func(*bound.args, **bound.kwargs)
+
+            async def scheduled_call():
+                # 使用凭证池时先租用密钥，再按替换后的凭证调用
+                if credential_pool.uses_pool(arguments):
+                    return await credential_pool.call_with_pool(arguments, invoke)
+                return await invoke()
+
+            with call, endpoint_registry.using(endpoint):
+                if left is None:
+                    result = await scheduled_call()
+                else:
+                    # 排队等待和上游调用合计不超过剩余预算
+                    try:
+                        result = await asyncio.wait_for(scheduled_call(), left)
+                    except asyncio.TimeoutError:
+                        print(f"⏱️ 请求已超过截止时间，取消上游调用: {action}")
+                        return deadline.deadline_exceeded_result()
+
+            # 连接错误、超时和 5xx 标记为可重试，供后台队列判断
+            if not result.get('success') and call.upstream_failed and isinstance(result.get('error'), dict):
+                result['error'].setdefault('retryable', True)
+            submitted = credential_pool.submitted_task_id(result) if task_id is None else None
+            if submitted:
+                await endpoint_registry.bind(endpoint, submitted)
+            return result
+        return wrapper
+    return decorator
+
+
+def _visual_endpoint(arguments: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    视觉服务按 Action 和 req_key 区分接口
+
+    两者都由客户端传入，不在 settings.circuit_visual_actions / circuit_visual_req_keys 中的取值归入 other，
+    熔断器数量不随请求增长
+    """
+    action = arguments['action']
+    if action not in settings.circuit_visual_actions:
+        action = 'other'
+    req_key = arguments['request_data'].get('req_key')
+    if not req_key:
+        return 'visual', action
+    if req_key not in settings.circuit_visual_req_keys:
+        req_key = 'other'
+    return 'visual', f"{action}:{req_key}"
 
 
 class VolcanoAPIService:
     """火山引擎API服务类"""
     
-    def __init__(self):
-        self.base_url = "https://ark.cn-beijing.volces.com"
-        self.visual_base_url = "https://visual.volcengineapi.com"
-    
+    # 各服务的端点由端点注册表按区域延迟选择，调用期间固定为本次选中的端点
+    @property
+    def base_url(self) -> str:
+        return endpoint_registry.current('ark').url
+
+    @property
+    def visual_base_url(self) -> str:
+        return endpoint_registry.current('visual').url
+
+    @property
+    def visual_region(self) -> str:
+        """视觉服务签名区域"""
+        return endpoint_registry.current('visual').region
+
+    @property
+    def vikingdb_base_url(self) -> str:
+        return endpoint_registry.current('vikingdb').url
+
+    @property
+    def vikingdb_region(self) -> str:
+        return endpoint_registry.current('vikingdb').region
+
+    @property
+    def tts_base_url(self) -> str:
+        return endpoint_registry.current('tts').url
+
+    def _image_headers(self, request_data: Dict[str, Any]) -> Dict[str, str]:
+        """构建图片生成请求头"""
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f"Bearer {request_data['apiKey']}"
+        }
+
+    def _image_payload(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """构建图片生成请求体"""
+        return {
+            'model': request_data.get('model'),
+            'prompt': request_data.get('prompt'),
+            'size': request_data.get('size'),
+            'sequential_image_generation': request_data.get('sequential_image_generation'),
+            'stream': request_data.get('stream'),
+            'response_format': request_data.get('response_format'),
+            'watermark': request_data.get('watermark'),
+            'guidance_scale': request_data.get('guidance_scale'),
+            'seed': request_data.get('seed'),
+            'sequential_image_generation_options': request_data.get('sequential_image_generation_options')
+        }
+
+    @_scheduled(lambda a: a['request_data'].get('apiKey'), lambda a: ('ark', 'images.generate'))
     async def generate_images(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         生成图片 (Seedream 4.0)
@@ -31,26 +170,12 @@ class VolcanoAPIService:
             API响应数据
         """
         try:
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 response = await client.post(
                     f"{self.base_url}/api/v3/images/generations",
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Authorization': f"Bearer {request_data['apiKey']}"
-                    },
-                    json={
-                        'model': request_data.get('model'),
-                        'prompt': request_data.get('prompt'),
-                        'size': request_data.get('size'),
-                        'sequential_image_generation': request_data.get('sequential_image_generation'),
-                        'stream': request_data.get('stream'),
-                        'response_format': request_data.get('response_format'),
-                        'watermark': request_data.get('watermark'),
-                        'guidance_scale': request_data.get('guidance_scale'),
-                        'seed': request_data.get('seed'),
-                        'sequential_image_generation_options': request_data.get('sequential_image_generation_options')
-                    },
-                    timeout=60.0
+                    headers=self._image_headers(request_data),
+                    json=self._image_payload(request_data),
+                    timeout=deadline.timeout(60.0)
                 )
                 
                 if response.status_code != 200:
@@ -64,7 +189,8 @@ class VolcanoAPIService:
                 
                 return {
                     'success': True,
-                    'data': response.json()
+                    # response_format 为 b64_json 时结果中带有 base64 图片
+                    'data': await payload_offload.loads(response.content)
                 }
                 
         except Exception as e:
@@ -75,7 +201,103 @@ class VolcanoAPIService:
                     'code': 'API_ERROR'
                 }
             }
-    
+
+    @_scheduled(lambda a: a['request_data'].get('apiKey'), lambda a: ('ark', 'images.generate'))
+    async def stream_images(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        流式生成图片 (Seedream 4.0, stream=true)
+
+        先建立上游连接并检查状态码，成功后返回一个逐事件转发 SSE 数据的异步迭代器。
+        组图场景下上游每生成一张图片就会推送一个 image_generation.partial_succeeded
+        事件，这里按原样转发，前端无需等待整组图片生成结束。
+        上游调度名额只在建立连接期间占用。
+
+        Args:
+            request_data: 同 generate_images
+
+        Returns:
+            成功时包含 stream 字段（SSE 字节块迭代器），失败时包含 error 字段
+        """
+        payload = self._image_payload(request_data)
+        payload['stream'] = True
+
+        # 流式模式下 read 超时作用于相邻两个数据块之间，而不是整个请求
+        client = httpx.AsyncClient(timeout=deadline.timeout(60.0), transport=upstream_transport())
+        try:
+            upstream_request = client.build_request(
+                'POST',
+                f"{self.base_url}/api/v3/images/generations",
+                headers={**self._image_headers(request_data), 'Accept': 'text/event-stream'},
+                json=payload
+            )
+            response = await client.send(upstream_request, stream=True)
+        except Exception as e:
+            await client.aclose()
+            return {
+                'success': False,
+                'error': {
+                    'message': str(e),
+                    'code': 'API_ERROR'
+                }
+            }
+
+        if response.status_code != 200:
+            error_text = (await response.aread()).decode('utf-8', errors='replace')
+            await response.aclose()
+            await client.aclose()
+            return {
+                'success': False,
+                'error': {
+                    'message': f'HTTP {response.status_code}: {error_text}',
+                    'code': 'API_ERROR'
+                }
+            }
+
+        return {
+            'success': True,
+            'stream': self._relay_sse_events(client, response)
+        }
+
+    async def _relay_sse_events(self, client: httpx.AsyncClient,
+                                response: httpx.Response) -> AsyncIterator[bytes]:
+        """
+        逐事件转发上游 SSE 数据
+
+        每次只在下游把上一个事件写出后才读取下一行，下游消费变慢时上游读取也随之暂停，
+        不会在内存中堆积数据。
+        """
+        event_lines = []
+        image_count = 0
+        try:
+            async for line in response.aiter_lines():
+                if line:
+                    event_lines.append(line)
+                    continue
+                if not event_lines:
+                    continue
+
+                for event_line in event_lines:
+                    if event_line.startswith('data:') and 'partial_succeeded' in event_line:
+                        image_count += 1
+                        print(f"🖼️ 流式图片 #{image_count} 已转发")
+
+                yield ('\n'.join(event_lines) + '\n\n').encode('utf-8')
+                event_lines = []
+
+            if event_lines:
+                yield ('\n'.join(event_lines) + '\n\n').encode('utf-8')
+        except Exception as e:
+            print(f"❌ 流式图片生成中断: {type(e).__name__}: {str(e)}")
+            error_event = json.dumps({
+                'type': 'error',
+                'error': {'message': str(e), 'code': 'STREAM_ERROR'}
+            }, ensure_ascii=False)
+            yield f"event: error\ndata: {error_event}\n\n".encode('utf-8')
+        finally:
+            await response.aclose()
+            await client.aclose()
+
+    @_scheduled(lambda a: a['request_data'].get('apiKey'), lambda a: ('ark', 'video_tasks.create'))
     async def create_video_task(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         创建视频生成任务
@@ -90,7 +312,7 @@ class VolcanoAPIService:
             print(f"🚀 开始创建视频任务: model={request_data.get('model')}")
             print(f"📋 任务内容: {request_data.get('content')}")
             
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 response = await client.post(
                     f"{self.base_url}/api/v3/contents/generations/tasks",
                     headers={
@@ -103,7 +325,7 @@ class VolcanoAPIService:
                         'callback_url': request_data.get('callback_url'),
                         'return_last_frame': request_data.get('return_last_frame')
                     },
-                    timeout=60.0
+                    timeout=deadline.timeout(60.0)
                 )
                 
                 print(f"📡 API响应状态: {response.status_code}")
@@ -140,6 +362,7 @@ class VolcanoAPIService:
                 }
             }
     
+    @_scheduled(lambda a: a['api_key'], lambda a: ('ark', 'video_tasks.get'))
     async def get_video_task(self, task_id: str, api_key: str) -> Dict[str, Any]:
         """
         查询视频任务状态
@@ -152,14 +375,14 @@ class VolcanoAPIService:
             任务状态信息
         """
         try:
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 response = await client.get(
                     f"{self.base_url}/api/v3/contents/generations/tasks/{task_id}",
                     headers={
                         'Content-Type': 'application/json',
                         'Authorization': f"Bearer {api_key}"
                     },
-                    timeout=30.0
+                    timeout=deadline.timeout(30.0)
                 )
                 
                 if response.status_code != 200:
@@ -185,6 +408,7 @@ class VolcanoAPIService:
                 }
             }
     
+    @_scheduled(lambda a: a['api_key'], lambda a: ('ark', 'video_tasks.list'))
     async def get_video_tasks(self, query_params: Dict[str, Any], api_key: str) -> Dict[str, Any]:
         """
         批量查询视频任务
@@ -197,7 +421,7 @@ class VolcanoAPIService:
             任务列表
         """
         try:
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 response = await client.get(
                     f"{self.base_url}/api/v3/contents/generations/tasks",
                     headers={
@@ -205,7 +429,7 @@ class VolcanoAPIService:
                         'Authorization': f"Bearer {api_key}"
                     },
                     params=query_params,
-                    timeout=30.0
+                    timeout=deadline.timeout(30.0)
                 )
                 
                 if response.status_code != 200:
@@ -231,6 +455,7 @@ class VolcanoAPIService:
                 }
             }
     
+    @_scheduled(lambda a: a['api_key'], lambda a: ('ark', 'video_tasks.delete'))
     async def delete_video_task(self, task_id: str, api_key: str) -> Dict[str, Any]:
         """
         删除视频任务
@@ -243,14 +468,14 @@ class VolcanoAPIService:
             删除结果
         """
         try:
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 response = await client.delete(
                     f"{self.base_url}/api/v3/contents/generations/tasks/{task_id}",
                     headers={
                         'Content-Type': 'application/json',
                         'Authorization': f"Bearer {api_key}"
                     },
-                    timeout=30.0
+                    timeout=deadline.timeout(30.0)
                 )
                 
                 if response.status_code != 200:
@@ -276,6 +501,7 @@ class VolcanoAPIService:
                 }
             }
     
+    @_scheduled(lambda a: a['access_key_id'], _visual_endpoint)
     async def submit_visual_task(self, action: str, version: str, request_data: Dict[str, Any], 
                                  access_key_id: str, secret_access_key: str) -> Dict[str, Any]:
         """
@@ -296,31 +522,34 @@ class VolcanoAPIService:
             clean_data = {k: v for k, v in request_data.items() if v is not None}
             
             url = f"{self.visual_base_url}/?Action={action}&Version={version}"
-            body = json.dumps(clean_data)
+            # 只编码一次：签名直接哈希这份 bytes，httpx 也原样发送它
+            # 带 base64 图片的请求体可达数 MB，序列化和哈希不在事件循环中进行
+            body = await payload_offload.dumps(clean_data)
             
             # 生成签名
-            signer = SignatureV4(access_key_id, secret_access_key, service='cv', region='cn-north-1')
-            headers = signer.sign('POST', url, {'Content-Type': 'application/json'}, body)
+            signer = SignatureV4(access_key_id, secret_access_key, service='cv', region=self.visual_region)
+            headers = signer.sign('POST', url, {'Content-Type': 'application/json'}, body,
+                                  payload_hash=await payload_offload.sha256_hex(body))
             
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 response = await client.post(
                     url,
                     headers=headers,
                     content=body,
-                    timeout=60.0
+                    timeout=deadline.timeout(60.0)
                 )
                 
                 if response.status_code != 200:
                     return {
                         'success': False,
                         'error': {
-                            'message': f'HTTP {response.status_code}: {response.text}',
+                            'message': f'HTTP {response.status_code}: {payload_offload.preview(response.content)}',
                             'code': 'VISUAL_API_ERROR'
                         }
                     }
                 
-                # 解析火山引擎API响应
-                api_response = response.json()
+                # 解析火山引擎API响应（同步 CVProcess 的结果中可能带有 base64 图片）
+                api_response = await payload_offload.loads(response.content)
                 
                 # 火山引擎返回格式: { code: 10000, message: "xxx", data: {...} }
                 if api_response.get('code') == 10000:
@@ -346,6 +575,7 @@ class VolcanoAPIService:
                 }
             }
     
+    @_scheduled(lambda a: a['access_key_id'], _visual_endpoint)
     async def query_visual_task(self, action: str, version: str, request_data: Dict[str, Any],
                                 access_key_id: str, secret_access_key: str) -> Dict[str, Any]:
         """
@@ -366,18 +596,19 @@ class VolcanoAPIService:
             
             # 构建请求 - 只包含非None的字段
             clean_data = {k: v for k, v in request_data.items() if v is not None}
-            print(f"📝 清理后的请求数据: {clean_data}")
+            print(f"📝 清理后的请求数据: {payload_offload.summarize(clean_data)}")
             
             url = f"{self.visual_base_url}/?Action={action}&Version={version}"
-            body = json.dumps(clean_data)
+            # 只编码一次：签名直接哈希这份 bytes，httpx 也原样发送它
+            body = await payload_offload.dumps(clean_data)
             print(f"🌐 请求URL: {url}")
             
             # 生成签名
             print(f"🔐 准备生成签名...")
-            # 对于视频编辑任务，使用cv服务类型，区域使用官方文档指定的cn-north-1
-            region = 'cn-north-1'  # 所有视觉任务统一使用cn-north-1区域以匹配官方文档要求
-            signer = SignatureV4(access_key_id, secret_access_key, service='cv', region=region)
-            headers = signer.sign('POST', url, {'Content-Type': 'application/json'}, body)
+            # 使用cv服务类型，签名区域取自所选端点（官方端点为cn-north-1）
+            signer = SignatureV4(access_key_id, secret_access_key, service='cv', region=self.visual_region)
+            headers = signer.sign('POST', url, {'Content-Type': 'application/json'}, body,
+                                  payload_hash=await payload_offload.sha256_hex(body))
             print(f"✅ 签名生成成功")
             
             # 打印签名信息但不包含敏感内容
@@ -387,20 +618,18 @@ class VolcanoAPIService:
             
             # 发送请求
             print(f"📤 发送API请求...")
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
                 try:
                     response = await client.post(
                         url,
                         headers=headers,
                         content=body,
-                        timeout=60.0  # 增加超时时间
+                        timeout=deadline.timeout(60.0)
                     )
                     print(f"📥 收到响应: HTTP {response.status_code}")
                     
-                    # 打印响应内容（限制长度以保护隐私）
-                    response_text = response.text
-                    if len(response_text) > 500:
-                        response_text = response_text[:500] + "... (truncated)"
+                    # 打印响应内容（限制长度以保护隐私；只解码开头部分，结果可能带有数 MB 的 base64）
+                    response_text = payload_offload.preview(response.content)
                     print(f"📊 响应内容: {response_text}")
                     
                     if response.status_code != 200:
@@ -415,7 +644,7 @@ class VolcanoAPIService:
                     
                     # 解析火山引擎API响应
                     try:
-                        api_response = response.json()
+                        api_response = await payload_offload.loads(response.content)
                         print(f"🔍 解析响应成功: code={api_response.get('code')}, message={api_response.get('message')}")
                     except json.JSONDecodeError as e:
                         print(f"❌ JSON解析错误: {str(e)}")
@@ -429,7 +658,9 @@ class VolcanoAPIService:
                     
                     # 火山引擎返回格式: { code: 10000, message: "xxx", data: {...} }
                     if api_response.get('code') == 10000:
-                        print(f"✅ 查询成功，返回数据: {api_response.get('data')}")
+                        data = api_response.get('data') or {}
+                        print(f"✅ 查询成功，任务状态: {data.get('status')}，"
+                              f"图片数: {len(data.get('binary_data_base64') or data.get('image_urls') or [])}")
                         return {
                             'success': True,
                             'data': api_response.get('data', {})
@@ -479,6 +710,158 @@ class VolcanoAPIService:
                 }
             }
     
+    @_scheduled(lambda a: a['access_key_id'], lambda a: ('vikingdb', 'embedding.multimodal'))
+    async def embed_multimodal(self, data: list, dense_model: Dict[str, Any],
+                               access_key_id: str, secret_access_key: str) -> Dict[str, Any]:
+        """
+        向量化计算 (VikingDB Embedding)
+
+        Args:
+            data: 待向量化的数据列表（每项包含 text / image / video），最多10条
+            dense_model: 稠密模型配置 {name, version, dim}
+            access_key_id: 访问密钥ID
+            secret_access_key: 访问密钥密钥
+
+        Returns:
+            成功时 data 为与输入顺序一致的稠密向量列表
+        """
+        try:
+            url = f"{self.vikingdb_base_url}/api/vikingdb/embedding"
+            body = json.dumps({'dense_model': dense_model, 'data': data}).encode('utf-8')
+
+            signer = SignatureV4(access_key_id, secret_access_key, service='vikingdb', region=self.vikingdb_region)
+            headers = signer.sign('POST', url, {'Content-Type': 'application/json'}, body)
+
+            async with httpx.AsyncClient(transport=upstream_transport()) as client:
+                response = await client.post(
+                    url,
+                    headers=headers,
+                    content=body,
+                    timeout=deadline.timeout(60.0)
+                )
+
+                if response.status_code != 200:
+                    return {
+                        'success': False,
+                        'error': {
+                            'message': f'HTTP {response.status_code}: {response.text}',
+                            'code': 'EMBEDDING_API_ERROR'
+                        }
+                    }
+
+                api_response = response.json()
+                # 向量库返回格式: { code: "Success" 或 0, message: "xxx", result: { data: [{dense: [...]}] } }
+                if api_response.get('code') not in ('Success', 0):
+                    return {
+                        'success': False,
+                        'error': {
+                            'message': api_response.get('message', 'Unknown error'),
+                            'code': str(api_response.get('code', 'UNKNOWN'))
+                        }
+                    }
+
+                return {
+                    'success': True,
+                    'data': [item.get('dense') for item in api_response.get('result', {}).get('data', [])]
+                }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': {
+                    'message': str(e),
+                    'code': 'EMBEDDING_API_ERROR'
+                }
+            }
+
+    @_scheduled(lambda a: a['app_id'], lambda a: ('tts', 'tts.unidirectional'))
+    async def stream_speech(self, app_id: str, access_key: str, resource_id: str,
+                            payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        流式语音合成 (大模型语音合成 V3 HTTP 单向流式)
+
+        先建立上游连接并检查状态码，成功后返回逐块产出音频数据的异步迭代器。
+        上游每行返回一个 JSON: {code: 0, data: base64音频} 为音频分片，
+        code 为 20000000 表示合成结束，其他 code 为错误。
+
+        Args:
+            app_id: 应用 AppID
+            access_key: Access Token
+            resource_id: 资源ID，如 seed-tts-1.0
+            payload: 请求体 {user, req_params}
+
+        Returns:
+            成功时包含 stream 字段（音频字节块迭代器），失败时包含 error 字段
+        """
+        headers = {
+            'X-Api-App-Id': app_id,
+            'X-Api-Access-Key': access_key,
+            'X-Api-Resource-Id': resource_id,
+            'Content-Type': 'application/json'
+        }
+
+        # read 超时作用于相邻两个数据块之间
+        client = httpx.AsyncClient(timeout=deadline.timeout(30.0), transport=upstream_transport())
+        try:
+            upstream_request = client.build_request(
+                'POST',
+                f"{self.tts_base_url}/api/v3/tts/unidirectional",
+                headers=headers,
+                json=payload
+            )
+            response = await client.send(upstream_request, stream=True)
+        except Exception as e:
+            await client.aclose()
+            return {
+                'success': False,
+                'error': {
+                    'message': str(e),
+                    'code': 'TTS_API_ERROR'
+                }
+            }
+
+        if response.status_code != 200:
+            error_text = (await response.aread()).decode('utf-8', errors='replace')
+            await response.aclose()
+            await client.aclose()
+            return {
+                'success': False,
+                'error': {
+                    'message': f'HTTP {response.status_code}: {error_text}',
+                    'code': 'TTS_API_ERROR'
+                }
+            }
+
+        return {
+            'success': True,
+            'stream': self._relay_speech_chunks(client, response)
+        }
+
+    async def _relay_speech_chunks(self, client: httpx.AsyncClient,
+                                   response: httpx.Response) -> AsyncIterator[bytes]:
+        """
+        逐块解码上游音频分片
+
+        Raises:
+            RuntimeError: 上游在合成过程中返回错误
+        """
+        try:
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line:
+                    continue
+                message = json.loads(line)
+                code = message.get('code', 0)
+                if code == 20000000:
+                    break
+                if code != 0:
+                    raise RuntimeError(f"{code}: {message.get('message', 'Unknown error')}")
+                if message.get('data'):
+                    yield base64.b64decode(message['data'])
+        finally:
+            await response.aclose()
+            await client.aclose()
+
     async def test_connection(self, api_key: str) -> Dict[str, Any]:
         """
         测试API连接
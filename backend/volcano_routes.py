@@ -2,15 +2,39 @@
 火山引擎 API 路由
 提供图片生成、视频生成、动作模仿、数字人等功能的HTTP接口
 """
-from fastapi import APIRouter, HTTPException, Header
-from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
+from fastapi import APIRouter, HTTPException, Header, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Dict, Any, Optional, List, Literal
+import json
+import binascii
 from volcano_api_service import VolcanoAPIService
+from blob_routes import save_upload_to_blob, save_base64_to_blob, blob_url, read_blob_base64
+from tos_routes import upload_file_path_to_tos
+from asset_routes import attach_proxy_urls
+from task_store import video_task_store, validate_callback_url
+from task_routes import key_fingerprint, record_task_submit
+from job_queue import job_queue
+from upstream_scheduler import upstream_scheduler
+from circuit_breaker import upstream_http_error
+from config import settings
+from http_cache import json_response
+import deadline
+import credential_pool
+import result_cache
+import image_preprocess
+import payload_offload
+import task_status
+import video_transcode
 
 router = APIRouter()
 api_service = VolcanoAPIService()
 
 
+# 异步提交类视觉服务接口，结果需要通过 CVSync2AsyncGetResult 查询
+ASYNC_SUBMIT_ACTIONS = ('CVSync2AsyncSubmitTask',)
+
+
 # 请求模型定义
 class ImageGenerationRequest(BaseModel):
     """图片生成请求"""
@@ -33,6 +57,11 @@ class VideoTaskRequest(BaseModel):
     callback_url: Optional[str] = None
     return_last_frame: Optional[bool] = False
 
+    @field_validator('callback_url')
+    @classmethod
+    def check_callback_url(cls, v):
+        return validate_callback_url(v) if v else v
+
 
 class VisualTaskRequest(BaseModel):
     """视觉服务任务请求"""
@@ -65,16 +94,163 @@ class VisualQueryRequest(BaseModel):
     task_id: str
 
 
+class TaskStatusRef(BaseModel):
+    """批量状态查询中的单个任务"""
+    provider: Literal['ark', 'visual']
+    task_id: str
+    # 视觉服务任务的查询参数
+    req_key: Optional[str] = None
+    action: str = "CVSync2AsyncGetResult"
+    version: str = "2022-08-31"
+
+
+class TaskStatusBatchRequest(BaseModel):
+    """批量任务状态查询请求"""
+    tasks: List[TaskStatusRef] = Field(..., min_length=1, max_length=settings.task_status_batch_max)
+
+
+async def _create_video_task(request: VideoTaskRequest, api_key: str) -> Dict[str, Any]:
+    """创建方舟视频任务，并登记到本地任务状态和任务历史"""
+    request_data = {
+        'apiKey': api_key,
+        **request.dict()
+    }
+
+    # 注入本服务的回调地址，用户提供的 callback_url 由本服务收到回调后转发
+    callback_nonce, callback_url = video_task_store.new_callback()
+    if callback_url:
+        request_data['callback_url'] = callback_url
+
+    result = await api_service.create_video_task(request_data)
+
+    if result['success'] and result['data'].get('id'):
+        await video_task_store.register(
+            result['data']['id'],
+            api_key,
+            callback_nonce,
+            request.callback_url if callback_nonce else None
+        )
+        await record_task_submit(
+            'ark', result['data']['id'], key_fingerprint(api_key),
+            request.model, None, request.dict(), 'queued'
+        )
+    return result
+
+
+async def _submit_visual_task(action: str, version: str, request_data: Dict[str, Any],
+                              access_key_id: str, secret_access_key: str,
+                              cache_control: Optional[str] = None) -> Dict[str, Any]:
+    """
+    提交视觉服务任务
+
+    - 指定 seed 的请求先查结果缓存：同步接口直接返回缓存结果，
+      异步提交返回 cache- 开头的任务ID，查询时直接返回缓存的最终结果
+    - binary_data_base64 图片在缓存未命中时先经过预处理（缩放、重新编码、蒙版压缩）
+    - 异步提交类接口返回 task_id 时记录到任务历史
+    """
+    owner = key_fingerprint(access_key_id, secret_access_key)
+    mode = result_cache.cache_mode(cache_control)
+    cache_key = None
+    if mode != 'bypass':
+        cache_key = await result_cache.request_key(f"visual:{action}:{version}", owner, request_data)
+    cached = await result_cache.lookup(cache_key, mode)
+    if cached is not None:
+        print(f"♻️ 命中结果缓存: action={action}, req_key={request_data.get('req_key')}")
+        if action in ASYNC_SUBMIT_ACTIONS:
+            return {'success': True, 'data': {'task_id': result_cache.cached_task_id(cache_key, owner)}, 'cached': True}
+        return {'success': True, 'data': cached, 'cached': True}
+
+    if request_data.get('binary_data_base64'):
+        request_data = {
+            **request_data,
+            'binary_data_base64': await image_preprocess.preprocess_base64_images(
+                request_data['binary_data_base64'], request_data.get('req_key')
+            )
+        }
+
+    result = await api_service.submit_visual_task(
+        action=action,
+        version=version,
+        request_data=request_data,
+        access_key_id=access_key_id,
+        secret_access_key=secret_access_key
+    )
+
+    data = result.get('data')
+    if result['success'] and isinstance(data, dict) and data.get('task_id'):
+        result_cache.track_task(data['task_id'], cache_key, mode)
+        await record_task_submit(
+            'visual', data['task_id'], owner,
+            request_data.get('req_key'), action, request_data, 'in_queue'
+        )
+    elif result['success'] and action not in ASYNC_SUBMIT_ACTIONS:
+        await result_cache.store(cache_key, mode, data)
+    return result
+
+
+async def _binary_results_as_urls(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把结果中的 binary_data_base64 解码写入 Blob 存储，替换为 binary_data_urls
+
+    返回新的字典，不修改缓存中的原始结果；内容无法解码时原样返回
+    """
+    values = data.get('binary_data_base64')
+    if not values:
+        return data
+    if not settings.public_base_url:
+        # 没有对外访问地址时无法生成可用的文件地址
+        return data
+    try:
+        blobs = [await save_base64_to_blob(value) for value in values]
+    except (binascii.Error, ValueError) as e:
+        print(f"⚠️ 结果图片解码失败，按 base64 返回: {e}")
+        return data
+    result = {k: v for k, v in data.items() if k != 'binary_data_base64'}
+    result['binary_data_urls'] = [blob['url'] for blob in blobs]
+    print(f"📦 结果图片已转存: {len(blobs)} 张, {sum(blob['size'] for blob in blobs)} bytes")
+    return result
+
+
+def _check_pool_credential(credential: str):
+    """后台执行时令牌可能已过期，凭证池令牌在入队时校验"""
+    if credential_pool.is_pool_credential(credential) and credential_pool.pool_user(credential) is None:
+        raise HTTPException(status_code=401, detail="凭证池访问令牌无效、已过期或无权使用凭证池")
+
+
+async def _run_video_create_job(payload: Dict[str, Any], credentials: Dict[str, Any]) -> Dict[str, Any]:
+    return await _create_video_task(VideoTaskRequest(**payload), credentials['api_key'])
+
+
+async def _run_visual_submit_job(payload: Dict[str, Any], credentials: Dict[str, Any]) -> Dict[str, Any]:
+    return await _submit_visual_task(
+        payload['action'],
+        payload['version'],
+        payload['request_data'],
+        credentials['access_key_id'],
+        credentials['secret_access_key'],
+        payload.get('cache_control')
+    )
+
+
+job_queue.register_handler('video_create', _run_video_create_job, ('api_key',))
+job_queue.register_handler('visual_submit', _run_visual_submit_job, ('access_key_id', 'secret_access_key'))
+
+
 # API路由
 @router.post("/api/volcano/images/generate")
 async def generate_images(
     request: ImageGenerationRequest,
-    authorization: str = Header(...)
+    response: Response,
+    authorization: str = Header(...),
+    cache_control: Optional[str] = Header(None)
 ):
     """
     生成图片 (Seedream 4.0)
     
     需要在请求头中提供 Authorization: Bearer <api_key>
+    stream=true 时以 text/event-stream 逐张转发上游生成事件
+    
+    指定 seed 的非流式请求会缓存结果，Cache-Control: no-cache 强制重新生成，no-store 不使用缓存
     """
     # 从 Authorization 头中提取 API Key
     if not authorization.startswith('Bearer '):
@@ -88,13 +264,39 @@ async def generate_images(
         **request.dict()
     }
     
+    if request.stream:
+        result = await api_service.stream_images(request_data)
+        
+        if not result['success']:
+            raise upstream_http_error(result['error'])
+        
+        return StreamingResponse(
+            result['stream'],
+            media_type="text/event-stream",
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # 关闭 nginx 缓冲，保证事件即时到达
+            }
+        )
+    
+    mode = result_cache.cache_mode(cache_control)
+    cache_key = None
+    if mode != 'bypass':
+        cache_key = await result_cache.request_key('images', key_fingerprint(api_key), request.dict())
+    cached = await result_cache.lookup(cache_key, mode)
+    if cached is not None:
+        response.headers['X-Result-Cache'] = 'HIT'
+        return attach_proxy_urls(cached, prefetch=True)
+    
     # 调用API服务
     result = await api_service.generate_images(request_data)
     
     if not result['success']:
-        raise HTTPException(status_code=500, detail=result['error'])
+        raise upstream_http_error(result['error'])
     
-    return result['data']
+    await result_cache.store(cache_key, mode, result['data'])
+    response.headers['X-Result-Cache'] = 'MISS' if cache_key else 'BYPASS'
+    return attach_proxy_urls(result['data'], prefetch=True)
 
 
 @router.post("/api/volcano/video/create")
@@ -116,18 +318,13 @@ async def create_video_task(
         
         api_key = authorization[7:]
         
-        request_data = {
-            'apiKey': api_key,
-            **request.dict()
-        }
-        
         print(f"🔑 API Key: {api_key[:10]}...{api_key[-4:] if len(api_key) > 14 else ''}")
         
-        result = await api_service.create_video_task(request_data)
+        result = await _create_video_task(request, api_key)
         
         if not result['success']:
             print(f"❌ 视频任务创建失败: {result.get('error')}")
-            raise HTTPException(status_code=500, detail=result['error'])
+            raise upstream_http_error(result['error'])
         
         print(f"✅ 视频任务创建成功")
         return result['data']
@@ -141,28 +338,64 @@ async def create_video_task(
 @router.get("/api/volcano/video/tasks/{task_id}")
 async def get_video_task(
     task_id: str,
+    request: Request,
+    wait: Optional[int] = Query(None, ge=0, le=60, description="长轮询等待秒数，状态变化或超时后返回"),
     authorization: str = Header(...)
 ):
     """
     查询单个视频任务状态
     
     需要在请求头中提供 Authorization: Bearer <api_key>
+    
+    优先返回本地状态（由上游回调或后台巡检更新），本地状态过期时才查询上游；
+    支持 If-None-Match 条件请求，状态未变化时返回 304
     """
     if not authorization.startswith('Bearer '):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
     api_key = authorization[7:]
+
+    state = video_task_store.track(task_id, api_key)
+    if wait and state.data is not None and not state.terminal:
+        # 为长轮询之后可能的上游查询预留时间
+        await video_task_store.wait_for_change(state, state.version, deadline.bounded(wait, reserve=10.0))
+    if state.data is not None and state.fresh:
+        return json_response(request, state.data)
     
     result = await api_service.get_video_task(task_id, api_key)
     
     if not result['success']:
-        raise HTTPException(status_code=500, detail=result['error'])
+        raise upstream_http_error(result['error'])
     
-    return result['data']
+    # 任务完成后会立即在后台预取结果视频，后续预览和拖动直接读本地缓存
+    await video_task_store.update(task_id, result['data'], api_key)
+    return json_response(request, result['data'])
+
+
+@router.post("/api/volcano/video/callback/{nonce}/{signature}")
+async def receive_video_callback(nonce: str, signature: str, request: Request):
+    """
+    接收方舟视频任务回调
+
+    回调地址由创建任务时注入，带有本服务签名，签名不符的请求直接拒绝
+    """
+    if not video_task_store.verify_callback(nonce, signature):
+        raise HTTPException(status_code=403, detail="Invalid callback signature")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid callback body")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid callback body")
+
+    await video_task_store.ingest_callback(nonce, data)
+    return {'success': True}
 
 
 @router.get("/api/volcano/video/tasks")
 async def get_video_tasks(
+    request: Request,
     page_num: Optional[int] = 1,
     page_size: Optional[int] = 20,
     status: Optional[str] = None,
@@ -195,9 +428,12 @@ async def get_video_tasks(
     result = await api_service.get_video_tasks(query_params, api_key)
     
     if not result['success']:
-        raise HTTPException(status_code=500, detail=result['error'])
+        raise upstream_http_error(result['error'])
     
-    return result['data']
+    for item in result['data'].get('items') or []:
+        attach_proxy_urls(item)
+    
+    return json_response(request, result['data'])
 
 
 @router.delete("/api/volcano/video/tasks/{task_id}")
@@ -218,7 +454,7 @@ async def delete_video_task(
     result = await api_service.delete_video_task(task_id, api_key)
     
     if not result['success']:
-        raise HTTPException(status_code=500, detail=result['error'])
+        raise upstream_http_error(result['error'])
     
     return result['data']
 
@@ -229,7 +465,8 @@ async def submit_visual_task(
     request: VisualTaskRequest,
     version: str = "2022-08-31",
     x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
-    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key"),
+    cache_control: Optional[str] = Header(None)
 ):
     """
     提交视觉服务任务（即梦系列、动作模仿、数字人等）
@@ -237,24 +474,27 @@ async def submit_visual_task(
     需要在请求头中提供：
     - X-Access-Key-Id: 访问密钥ID
     - X-Secret-Access-Key: 访问密钥密钥
+    
+    指定 seed 的请求会缓存结果，Cache-Control: no-cache 强制重新生成，no-store 不使用缓存
     """
     try:
         print(f"📥 收到视觉服务请求: action={action}, version={version}")
         print(f"🔑 Access Key ID: {x_access_key_id[:10]}...{x_access_key_id[-4:] if len(x_access_key_id) > 14 else ''}")
         print(f"🔑 Secret Key: {'*' * 20}")
-        print(f"📝 请求数据: {request.dict()}")
+        print(f"📝 请求数据: {payload_offload.summarize(request.dict())}")
         
-        result = await api_service.submit_visual_task(
-            action=action,
-            version=version,
-            request_data=request.dict(),
-            access_key_id=x_access_key_id,
-            secret_access_key=x_secret_access_key
+        result = await _submit_visual_task(
+            action,
+            version,
+            request.dict(),
+            x_access_key_id,
+            x_secret_access_key,
+            cache_control
         )
         
         if not result['success']:
             print(f"❌ 任务提交失败: {result.get('error')}")
-            raise HTTPException(status_code=500, detail=result['error'])
+            raise upstream_http_error(result['error'])
         
         print(f"✅ 任务提交成功")
         return result['data']
@@ -265,11 +505,162 @@ async def submit_visual_task(
         raise
 
 
+@router.post("/api/volcano/visual/{action}/upload")
+async def submit_visual_task_with_files(
+    action: str,
+    files: List[UploadFile] = File(...),
+    params: str = Form("{}"),
+    tos_bucket: Optional[str] = Form(None),
+    tos_region: Optional[str] = Form(None),
+    version: str = "2022-08-31",
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key"),
+    cache_control: Optional[str] = Header(None)
+):
+    """
+    以 multipart 方式提交视觉服务任务
+    
+    图片/视频以文件形式上传，无需在 JSON 中进行 base64 编码。文件分块写入本地 Blob 存储，
+    视频按 req_key 对应接口的规格规范化，提供 tos_bucket/tos_region 时再转存到 TOS，
+    最终以 image_urls / video_urls 传给上游。
+    
+    请求参数:
+    - files: 要上传的图片或视频文件（可多个，按顺序追加到 URL 列表）
+    - params: 其余任务参数的 JSON 字符串，字段同 JSON 版接口
+    - tos_bucket / tos_region: 可选，指定后文件暂存到 TOS，否则由本服务 /api/blobs 提供访问；
+      未配置 public_base_url 时图片改为以 binary_data_base64 提交，视频必须指定 TOS 存储桶
+    
+    需要在请求头中提供：
+    - X-Access-Key-Id: 访问密钥ID
+    - X-Secret-Access-Key: 访问密钥密钥
+    """
+    try:
+        request = VisualTaskRequest(**json.loads(params))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"params 参数格式错误: {str(e)}")
+    
+    print(f"📥 收到视觉服务文件上传请求: action={action}, version={version}, files={len(files)}")
+    
+    image_urls = list(request.image_urls or [])
+    video_urls = list(request.video_urls or [])
+    binary_data_base64 = []
+    
+    for upload in files:
+        blob = await save_upload_to_blob(upload)
+        if blob['content_type'].startswith('video/'):
+            # 视频先按接口规格截取、缩放并重新编码
+            blob = await video_transcode.normalize_blob(blob, request.req_key)
+        
+        if tos_bucket and tos_region:
+            staged = await upload_file_path_to_tos(
+                file_path=blob['path'],
+                object_key=video_transcode.object_key(blob),
+                content_type=blob['content_type'],
+                bucket=tos_bucket,
+                region=tos_region,
+                access_key_id=x_access_key_id,
+                secret_access_key=x_secret_access_key
+            )
+            if not staged['success']:
+                raise HTTPException(status_code=500, detail=staged['error'])
+            url = staged['url']
+        else:
+            url = blob_url(blob['digest'])
+        
+        if url is None:
+            if blob['content_type'].startswith('video/'):
+                raise HTTPException(status_code=400, detail="未配置 public_base_url，视频文件需要指定 tos_bucket 和 tos_region")
+            binary_data_base64.append(await read_blob_base64(blob))
+            print(f"📦 文件以 base64 提交: {upload.filename} ({blob['size']} bytes)")
+            continue
+        
+        print(f"📦 文件已暂存: {upload.filename} ({blob['size']} bytes) -> {url}")
+        
+        if blob['content_type'].startswith('video/'):
+            video_urls.append(url)
+        else:
+            image_urls.append(url)
+    
+    request_data = request.dict()
+    request_data['binary_data_base64'] = binary_data_base64 or None
+    request_data['image_urls'] = image_urls or None
+    request_data['video_urls'] = video_urls or None
+    
+    result = await _submit_visual_task(
+        action,
+        version,
+        request_data,
+        x_access_key_id,
+        x_secret_access_key,
+        cache_control
+    )
+    
+    if not result['success']:
+        print(f"❌ 任务提交失败: {result.get('error')}")
+        raise upstream_http_error(result['error'])
+    
+    print(f"✅ 任务提交成功")
+    return result['data']
+
+
+@router.post("/api/volcano/jobs/video/create", status_code=202)
+async def enqueue_video_task(
+    request: VideoTaskRequest,
+    authorization: str = Header(...)
+):
+    """
+    后台提交视频生成任务
+
+    请求先写入持久化队列并立即返回 job_id，由后台按速率上限提交到上游；
+    通过 GET /api/jobs/{job_id} 查询提交结果
+    """
+    if not authorization.startswith('Bearer '):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+
+    api_key = authorization[7:]
+    _check_pool_credential(api_key)
+    job_id = await job_queue.enqueue(
+        'video_create',
+        key_fingerprint(api_key),
+        request.dict(),
+        {'api_key': api_key}
+    )
+    return {'job_id': job_id, 'status': 'pending'}
+
+
+@router.post("/api/volcano/jobs/visual/{action}", status_code=202)
+async def enqueue_visual_task(
+    action: str,
+    request: VisualTaskRequest,
+    version: str = "2022-08-31",
+    x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
+    x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key"),
+    cache_control: Optional[str] = Header(None)
+):
+    """
+    后台提交视觉服务任务
+
+    请求先写入持久化队列并立即返回 job_id，由后台按速率上限提交到上游；
+    通过 GET /api/jobs/{job_id} 查询提交结果
+    """
+    _check_pool_credential(x_access_key_id)
+    job_id = await job_queue.enqueue(
+        'visual_submit',
+        key_fingerprint(x_access_key_id, x_secret_access_key),
+        {'action': action, 'version': version, 'request_data': request.dict(), 'cache_control': cache_control},
+        {'access_key_id': x_access_key_id, 'secret_access_key': x_secret_access_key}
+    )
+    return {'job_id': job_id, 'status': 'pending'}
+
+
 @router.post("/api/volcano/visual/{action}/query")
 async def query_visual_task(
     action: str,
     request: VisualQueryRequest,
     version: str = "2022-08-31",
+    binary: Literal['base64', 'url'] = Query(
+        'base64', description="结果图片的返回方式：base64 原样返回，url 转存后返回 binary_data_urls"
+    ),
     x_access_key_id: str = Header(..., alias="X-Access-Key-Id"),
     x_secret_access_key: str = Header(..., alias="X-Secret-Access-Key")
 ):
@@ -279,7 +670,18 @@ async def query_visual_task(
     需要在请求头中提供：
     - X-Access-Key-Id: 访问密钥ID
     - X-Secret-Access-Key: 访问密钥密钥
+
+    binary=url 时结果中的 binary_data_base64 在服务端解码一次并写入 Blob 存储，
+    改为返回 binary_data_urls（/api/blobs/{digest}，按内容类型返回原始字节，支持 Range），
+    响应体和浏览器内存占用都更小
     """
+    if result_cache.is_cached_task(request.task_id):
+        cached = await task_status.lookup_cached_task(request.task_id, x_access_key_id, x_secret_access_key)
+        if not cached['success']:
+            raise HTTPException(status_code=cached['error']['status'], detail=cached['error']['message'])
+        data = attach_proxy_urls(cached['data'], prefetch=True)
+        return await _binary_results_as_urls(data) if binary == 'url' else data
+    
     try:
         print(f"📥 收到查询请求: action={action}, version={version}")
         print(f"🔑 Access Key ID: {x_access_key_id[:10]}...{x_access_key_id[-4:] if len(x_access_key_id) > 14 else ''}")
@@ -296,10 +698,13 @@ async def query_visual_task(
         
         if not result['success']:
             print(f"❌ 查询失败: {result.get('error')}")
-            raise HTTPException(status_code=500, detail=result['error'])
+            raise upstream_http_error(result['error'])
         
         print(f"✅ 查询成功")
-        return result['data']
+        data = await task_status.finish_visual_query(
+            request.task_id, x_access_key_id, x_secret_access_key, result['data']
+        )
+        return await _binary_results_as_urls(data) if binary == 'url' else data
     except Exception as e:
         print(f"❌ 异常: {type(e).__name__}: {str(e)}")
         import traceback
@@ -307,6 +712,71 @@ async def query_visual_task(
         raise
 
 
+@router.post("/api/volcano/tasks/status:batch")
+async def batch_task_status(
+    request: TaskStatusBatchRequest,
+    authorization: Optional[str] = Header(None),
+    x_access_key_id: Optional[str] = Header(None, alias="X-Access-Key-Id"),
+    x_secret_access_key: Optional[str] = Header(None, alias="X-Secret-Access-Key")
+):
+    """
+    批量查询方舟视频任务和视觉服务任务的状态
+
+    查询方舟任务需要 Authorization: Bearer <api_key>，
+    查询视觉服务任务需要 X-Access-Key-Id 和 X-Secret-Access-Key。
+    已结束的任务直接返回本地状态，其余任务并发查询上游；
+    单个任务查询失败不影响其他任务，结果中 success 为 false 并带有 error
+    """
+    api_key = None
+    if authorization:
+        if not authorization.startswith('Bearer '):
+            raise HTTPException(status_code=401, detail="Invalid authorization header")
+        api_key = authorization[7:]
+
+    return await task_status.batch_status(
+        [task.dict() for task in request.tasks],
+        api_key,
+        x_access_key_id,
+        x_secret_access_key
+    )
+
+
+@router.get("/api/volcano/result-cache/stats")
+async def get_result_cache_stats():
+    """确定性结果缓存统计：命中率、条目数与占用空间"""
+    return result_cache.stats()
+
+
+@router.get("/api/volcano/task-status/stats")
+async def get_batch_task_status_stats():
+    """批量任务状态查询统计：本地命中和上游查询次数"""
+    return task_status.stats()
+
+
+@router.get("/api/volcano/image-preprocess/stats")
+async def get_image_preprocess_stats():
+    """图片预处理统计：处理数量与节省的上传字节"""
+    return image_preprocess.stats()
+
+
+@router.get("/api/volcano/payload-offload/stats")
+async def get_payload_offload_stats():
+    """大载荷卸载统计：直接处理与交给工作进程处理的次数和字节数"""
+    return payload_offload.stats()
+
+
+@router.get("/api/volcano/credential-pool/stats")
+async def get_credential_pool_stats():
+    """凭证池统计：各密钥的并发占用、剩余速率额度和限流摘除状态（不含密钥本身）"""
+    return credential_pool.stats()
+
+
+@router.get("/api/volcano/scheduler/stats")
+async def get_scheduler_stats():
+    """上游调用调度统计：各优先级的排队、运行数量与等待耗时"""
+    return upstream_scheduler.stats()
+
+
 @router.get("/api/volcano/test")
 async def test_connection(authorization: str = Header(...)):
     """
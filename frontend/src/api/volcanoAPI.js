@@ -10,6 +10,18 @@ class VolcanoAPIClient {
     this.baseURL = API_BASE_URL;
   }
 
+  /**
+   * 获取生成结果的预览图地址
+   * @param {Object} previewUrls - 任务数据中的 preview_urls（原始URL -> {thumb, poster, animated}）
+   * @param {string} mediaUrl - 原始图片/视频URL
+   * @param {string} variant - thumb（缩略图）、poster（封面图）或 animated（视频动态预览）
+   * @returns {string|undefined} 没有对应预览时返回 undefined
+   */
+  previewUrl(previewUrls, mediaUrl, variant = 'poster') {
+    const path = previewUrls?.[mediaUrl]?.[variant];
+    return path ? `${this.baseURL}${path}` : undefined;
+  }
+
   /**
    * 生成图片 (Seedream 4.0)
    */
@@ -56,6 +68,80 @@ class VolcanoAPIClient {
     }
   }
 
+  /**
+   * 流式生成图片 (Seedream 4.0, stream=true)
+   * 每收到一个上游事件就回调 onEvent，组图场景下第一张图片无需等待整组生成结束
+   */
+  async generateImagesStream(requestData, onEvent) {
+    try {
+      const response = await fetch(`${this.baseURL}/api/volcano/images/generate`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${requestData.apiKey}`
+        },
+        body: JSON.stringify({
+          model: requestData.model,
+          prompt: requestData.prompt,
+          size: requestData.size,
+          sequential_image_generation: requestData.sequential_image_generation,
+          stream: true,
+          response_format: requestData.response_format,
+          watermark: requestData.watermark,
+          guidance_scale: requestData.guidance_scale,
+          seed: requestData.seed,
+          sequential_image_generation_options: requestData.sequential_image_generation_options
+        })
+      });
+
+      if (!response.ok) {
+        const error = await response.json();
+        return {
+          success: false,
+          error: error
+        };
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const images = [];
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          const dataLines = block.split('\n')
+            .filter(line => line.startsWith('data:'))
+            .map(line => line.slice(5).trim());
+          if (dataLines.length === 0 || dataLines[0] === '[DONE]') continue;
+
+          const event = JSON.parse(dataLines.join('\n'));
+          if (event.type === 'image_generation.partial_succeeded') {
+            images.push(event);
+          }
+          if (onEvent) onEvent(event);
+        }
+      }
+
+      return {
+        success: true,
+        data: { data: images }
+      };
+    } catch (error) {
+      return {
+        success: false,
+        error: { message: error.message }
+      };
+    }
+  }
+
   /**
    * 提交即梦 4.0 任务
    */
@@ -122,7 +208,8 @@ class VolcanoAPIClient {
    */
   async queryJimeng40Task(requestData) {
     try {
-      const response = await fetch(`${this.baseURL}/api/volcano/visual/CVSync2AsyncGetResult/query`, {
+      // binary=url：结果图片由后端解码转存，返回 binary_data_urls，不再在 JSON 中传输 base64
+      const response = await fetch(`${this.baseURL}/api/volcano/visual/CVSync2AsyncGetResult/query?binary=url`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -147,7 +234,7 @@ class VolcanoAPIClient {
       const data = await response.json();
       console.log('✅ 查询即梦4.0任务成功，完整响应:', data);
       console.log('📋 状态:', data.status);
-      console.log('🖼️ 图片URLs:', data.image_urls);
+      console.log('🖼️ 图片URLs:', data.image_urls || data.binary_data_urls);
       return {
         success: true,
         data: data
@@ -230,10 +317,12 @@ class VolcanoAPIClient {
 
   /**
    * 获取视频任务状态
+   * @param {number} wait - 可选，长轮询等待秒数（最多60），任务状态变化或超时后返回
    */
-  async getVideoTask(taskId, apiKey) {
+  async getVideoTask(taskId, apiKey, wait) {
     try {
-      const response = await fetch(`${this.baseURL}/api/volcano/video/tasks/${taskId}`, {
+      const query = wait ? `?wait=${wait}` : '';
+      const response = await fetch(`${this.baseURL}/api/volcano/video/tasks/${taskId}${query}`, {
         method: 'GET',
         headers: {
           'Content-Type': 'application/json',
@@ -262,6 +351,89 @@ class VolcanoAPIClient {
     }
   }
 
+  /**
+   * 查询本地任务历史（游标分页）
+   * @param {Object} queryParams - { provider, status, req_key, limit, cursor }
+   * @param {Object} credentials - { apiKey, accessKeyId, secretAccessKey }，至少提供 apiKey 或 AK/SK
+   */
+  async listTasks(queryParams, credentials) {
+    try {
+      const params = new URLSearchParams();
+      ['provider', 'status', 'req_key', 'limit', 'cursor'].forEach(key => {
+        if (queryParams[key]) params.append(key, queryParams[key]);
+      });
+
+      const headers = { 'Content-Type': 'application/json' };
+      if (credentials.apiKey) headers['Authorization'] = `Bearer ${credentials.apiKey}`;
+      if (credentials.accessKeyId) headers['X-Access-Key-Id'] = credentials.accessKeyId;
+      if (credentials.secretAccessKey) headers['X-Secret-Access-Key'] = credentials.secretAccessKey;
+
+      const response = await fetch(`${this.baseURL}/api/tasks?${params}`, {
+        method: 'GET',
+        headers
+      });
+
+      if (!response.ok) {
+        const error = await response.json();
+        return {
+          success: false,
+          error: error
+        };
+      }
+
+      const data = await response.json();
+      return {
+        success: true,
+        data: data
+      };
+    } catch (error) {
+      return {
+        success: false,
+        error: { message: error.message }
+      };
+    }
+  }
+
+  /**
+   * 批量查询任务状态（方舟视频任务和视觉服务任务可混合提交，一次请求返回全部结果）
+   * @param {Array} tasks - [{ provider: 'ark' | 'visual', task_id, req_key }]，视觉服务任务需提供 req_key
+   * @param {Object} credentials - { apiKey, accessKeyId, secretAccessKey }，按任务类型提供
+   * @returns {Object} data.tasks 与提交顺序一致，单个任务失败时该项 success 为 false
+   */
+  async getTaskStatuses(tasks, credentials) {
+    try {
+      const headers = { 'Content-Type': 'application/json' };
+      if (credentials.apiKey) headers['Authorization'] = `Bearer ${credentials.apiKey}`;
+      if (credentials.accessKeyId) headers['X-Access-Key-Id'] = credentials.accessKeyId;
+      if (credentials.secretAccessKey) headers['X-Secret-Access-Key'] = credentials.secretAccessKey;
+
+      const response = await fetch(`${this.baseURL}/api/volcano/tasks/status:batch`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ tasks })
+      });
+
+      if (!response.ok) {
+        const error = await response.json();
+        return {
+          success: false,
+          error: error
+        };
+      }
+
+      const data = await response.json();
+      return {
+        success: true,
+        data: data
+      };
+    } catch (error) {
+      return {
+        success: false,
+        error: { message: error.message }
+      };
+    }
+  }
+
   /**
    * 获取视频任务列表
    */
@@ -337,6 +509,50 @@ class VolcanoAPIClient {
     }
   }
 
+  /**
+   * 以文件上传方式提交视觉服务任务
+   * 文件直接以 multipart 上传，由后端暂存后以 image_urls / video_urls 传给上游，无需 base64 编码
+   */
+  async submitVisualTaskWithFiles(action, files, params, requestData) {
+    try {
+      const formData = new FormData();
+      files.forEach(file => formData.append('files', file));
+      formData.append('params', JSON.stringify(params));
+      if (requestData.tosBucket && requestData.tosRegion) {
+        formData.append('tos_bucket', requestData.tosBucket);
+        formData.append('tos_region', requestData.tosRegion);
+      }
+
+      const response = await fetch(`${this.baseURL}/api/volcano/visual/${action}/upload`, {
+        method: 'POST',
+        headers: {
+          'X-Access-Key-Id': requestData.accessKeyId,
+          'X-Secret-Access-Key': requestData.secretAccessKey
+        },
+        body: formData
+      });
+
+      if (!response.ok) {
+        const error = await response.json();
+        return {
+          success: false,
+          error: error
+        };
+      }
+
+      const data = await response.json();
+      return {
+        success: true,
+        data: data
+      };
+    } catch (error) {
+      return {
+        success: false,
+        error: { message: error.message }
+      };
+    }
+  }
+
   /**
    * 提交 Inpainting 任务
    */
@@ -595,8 +811,9 @@ class VolcanoAPIClient {
 
   /**
    * 上传文件到TOS
+   * @param {string} reqKey - 可选，视频将用于的视觉服务 req_key，后端会先按该接口的规格规范化视频
    */
-  async uploadToTOS(file, tosConfig, accessKeyId, secretAccessKey) {
+  async uploadToTOS(file, tosConfig, accessKeyId, secretAccessKey, reqKey) {
     try {
       // 参数验证
       console.log('🔍 验证上传参数:', {
@@ -638,6 +855,9 @@ class VolcanoAPIClient {
       formData.append('region', tosConfig.region);
       formData.append('access_key_id', accessKeyId);
       formData.append('secret_access_key', secretAccessKey);
+      if (reqKey) {
+        formData.append('req_key', reqKey);
+      }
 
       console.log('📤 开始上传文件到TOS:', {
         fileName: file.name,
@@ -687,6 +907,130 @@ class VolcanoAPIClient {
     }
   }
 
+  /**
+   * 断点续传上传大文件到TOS
+   * 文件按分片并行上传，断线后再次调用会复用上传会话，只补传缺失的分片
+   * @param {File} file - 要上传的文件
+   * @param {Object} tosConfig - { bucket, region }
+   * @param {Object} options - { concurrency: 并行分片数, onProgress: (uploadedBytes, totalBytes) => void }
+   */
+  async uploadToTOSResumable(file, tosConfig, accessKeyId, secretAccessKey, options = {}) {
+    const { concurrency = 4, onProgress } = options;
+    const headers = {
+      'X-Access-Key-Id': accessKeyId,
+      'X-Secret-Access-Key': secretAccessKey
+    };
+    // 以文件名、大小和修改时间标识同一个文件，用于断线后恢复上传会话
+    const resumeKey = `tos-upload:${tosConfig.bucket}:${file.name}:${file.size}:${file.lastModified}`;
+
+    const parseError = async (response) => {
+      const error = await response.json().catch(() => ({}));
+      return typeof error.detail === 'string' ? error.detail : `HTTP ${response.status}`;
+    };
+
+    try {
+      let session = null;
+      const savedId = localStorage.getItem(resumeKey);
+      if (savedId) {
+        const response = await fetch(`${this.baseURL}/api/tos/uploads/${savedId}`, { headers });
+        if (response.ok) {
+          session = await response.json();
+          if (session.status === 'completed') {
+            localStorage.removeItem(resumeKey);
+            return { success: true, url: session.url };
+          }
+          if (session.status !== 'uploading') {
+            session = null;
+          }
+        }
+      }
+
+      if (!session) {
+        const response = await fetch(`${this.baseURL}/api/tos/uploads`, {
+          method: 'POST',
+          headers: { ...headers, 'Content-Type': 'application/json' },
+          body: JSON.stringify({
+            filename: file.name,
+            size: file.size,
+            content_type: file.type || null,
+            bucket: tosConfig.bucket,
+            region: tosConfig.region
+          })
+        });
+        if (!response.ok) {
+          return { success: false, error: await parseError(response) };
+        }
+        session = await response.json();
+        localStorage.setItem(resumeKey, session.upload_id);
+      }
+
+      const done = new Set(session.parts.map(part => part.part_number));
+      let uploadedBytes = session.parts.reduce((sum, part) => sum + part.size, 0);
+      onProgress && onProgress(uploadedBytes, file.size);
+
+      const pending = [];
+      for (let n = 1; n <= session.part_count; n++) {
+        if (!done.has(n)) pending.push(n);
+      }
+
+      const uploadPart = async (partNumber) => {
+        const start = (partNumber - 1) * session.part_size;
+        const chunk = file.slice(start, Math.min(start + session.part_size, file.size));
+        const buffer = await chunk.arrayBuffer();
+        const digest = await crypto.subtle.digest('SHA-256', buffer);
+        const sha256 = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+
+        // 网络错误、校验失败或服务端错误时重试该分片
+        let lastError = null;
+        for (let attempt = 1; attempt <= 3; attempt++) {
+          let response = null;
+          try {
+            response = await fetch(`${this.baseURL}/api/tos/uploads/${session.upload_id}/parts/${partNumber}`, {
+              method: 'PUT',
+              headers: { ...headers, 'X-Part-SHA256': sha256 },
+              body: buffer
+            });
+          } catch (error) {
+            lastError = error;
+          }
+          if (response) {
+            if (response.ok) {
+              uploadedBytes += buffer.byteLength;
+              onProgress && onProgress(uploadedBytes, file.size);
+              return;
+            }
+            lastError = new Error(await parseError(response));
+            if (response.status !== 400 && response.status < 500) throw lastError;
+          }
+          await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+        throw lastError;
+      };
+
+      const workers = Array.from({ length: Math.min(concurrency, pending.length) }, async () => {
+        while (pending.length) {
+          await uploadPart(pending.shift());
+        }
+      });
+      await Promise.all(workers);
+
+      const response = await fetch(`${this.baseURL}/api/tos/uploads/${session.upload_id}/complete`, {
+        method: 'POST',
+        headers
+      });
+      if (!response.ok) {
+        return { success: false, error: await parseError(response) };
+      }
+      const data = await response.json();
+      localStorage.removeItem(resumeKey);
+      console.log('✅ TOS断点续传上传成功:', data.url);
+      return { success: true, url: data.url };
+    } catch (error) {
+      console.error('❌ TOS断点续传上传异常:', error);
+      return { success: false, error: error.message };
+    }
+  }
+
   /**
    * 提交即梦动作模仿任务
    */
@@ -964,6 +1308,43 @@ class VolcanoAPIClient {
       };
     }
   }
+
+  /**
+   * 多模态检索（本地向量索引，请求格式兼容 SearchByMultiModal）
+   */
+  async searchByMultiModal(requestData) {
+    try {
+      const { accessKeyId, secretAccessKey, ...body } = requestData;
+      const response = await fetch(`${this.baseURL}/api/search`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Access-Key-Id': accessKeyId,
+          'X-Secret-Access-Key': secretAccessKey
+        },
+        body: JSON.stringify(body)
+      });
+
+      if (!response.ok) {
+        const error = await response.json();
+        return {
+          success: false,
+          error: { message: typeof error.detail === 'string' ? error.detail : JSON.stringify(error.detail) }
+        };
+      }
+
+      const data = await response.json();
+      return {
+        success: true,
+        data: data.result
+      };
+    } catch (error) {
+      return {
+        success: false,
+        error: { message: error.message }
+      };
+    }
+  }
 }
 
 // 创建单例实例
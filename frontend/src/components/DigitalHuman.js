@@ -535,7 +535,8 @@ function DigitalHuman() {
       if (result.success) {
         const updates = {
           status: result.data.status,
-          video_url: result.data.video_url
+          video_url: result.data.video_url,
+          preview_urls: result.data.preview_urls
         };
 
         updateTaskInHistory(task.task_id, updates);
@@ -1327,7 +1328,13 @@ function DigitalHuman() {
               {selectedTask.status === 'done' && selectedTask.video_url && (
                 <>
                   <h6>生成视频</h6>
-                  <video controls className="w-100" style={{ maxHeight: '400px' }}>
+                  <video
+                    controls
+                    preload="none"
+                    poster={volcanoAPI.previewUrl(selectedTask.preview_urls, selectedTask.video_url)}
+                    className="w-100"
+                    style={{ maxHeight: '400px' }}
+                  >
                     <source src={selectedTask.video_url} />
                   </video>
                   <div className="mt-2">
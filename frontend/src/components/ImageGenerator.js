@@ -259,6 +259,9 @@ function ImageGenerator() {
             let images = [];
             if (queryResult.data.image_urls && queryResult.data.image_urls.length > 0) {
               images = queryResult.data.image_urls;
+            } else if (queryResult.data.binary_data_urls && queryResult.data.binary_data_urls.length > 0) {
+              // 后端已把base64结果转存为文件，直接使用文件地址
+              images = queryResult.data.binary_data_urls;
             } else if (queryResult.data.binary_data_base64 && queryResult.data.binary_data_base64.length > 0) {
               images = queryResult.data.binary_data_base64.map(base64 => `data:image/png;base64,${base64}`);
               console.log('🖼️ 从base64转换了', images.length, '张图片');
@@ -420,6 +423,9 @@ function ImageGenerator() {
             if (queryResult.data.image_urls && queryResult.data.image_urls.length > 0) {
               // 如果有图片URL，直接使用
               images = queryResult.data.image_urls;
+            } else if (queryResult.data.binary_data_urls && queryResult.data.binary_data_urls.length > 0) {
+              // 后端已把base64结果转存为文件，直接使用文件地址
+              images = queryResult.data.binary_data_urls;
             } else if (queryResult.data.binary_data_base64 && queryResult.data.binary_data_base64.length > 0) {
               // 如果是base64数据，转换为data URL
               images = queryResult.data.binary_data_base64.map(base64 => `data:image/png;base64,${base64}`);
@@ -609,6 +615,9 @@ function ImageGenerator() {
             let images = [];
             if (queryResult.data.image_urls && queryResult.data.image_urls.length > 0) {
               images = queryResult.data.image_urls;
+            } else if (queryResult.data.binary_data_urls && queryResult.data.binary_data_urls.length > 0) {
+              // 后端已把base64结果转存为文件，直接使用文件地址
+              images = queryResult.data.binary_data_urls;
             } else if (queryResult.data.binary_data_base64 && queryResult.data.binary_data_base64.length > 0) {
               images = queryResult.data.binary_data_base64.map(base64 => `data:image/png;base64,${base64}`);
               console.log('🖼️ 从base64转换了', images.length, '张图片');
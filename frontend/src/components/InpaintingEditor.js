@@ -542,7 +542,7 @@ API返回错误：原图和Mask图的尺寸不一致。
                     onChange={(e) => handleInputChange('seed', parseInt(e.target.value))}
                   />
                   <Form.Text className="text-muted">
-                    -1 表示随机生成，固定值可复现结果
+                    -1 表示随机生成；固定值可复现结果，重复提交相同参数时直接返回缓存结果
                   </Form.Text>
                 </Form.Group>
 
@@ -255,6 +255,7 @@ function MotionImitation() {
         
         if (status === 'done' && result.data.video_url) {
           updates.video_url = result.data.video_url;
+          updates.preview_urls = result.data.preview_urls;
           console.log('🎬 任务已完成，视频URL:', result.data.video_url);
         }
         
@@ -318,6 +319,61 @@ function MotionImitation() {
     }
   };
 
+  // 刷新任务列表：一次批量请求更新所有运行中的任务
+  const refreshTaskList = async () => {
+    loadTaskHistory();
+
+    const accessKeyId = storage.getAccessKeyId();
+    const secretAccessKey = storage.getSecretAccessKey();
+    // Electron 环境没有批量查询接口，仍按单个任务刷新
+    if (!accessKeyId || !secretAccessKey || window.electronAPI) {
+      return;
+    }
+
+    const history = localStorage.getItem(STORAGE_KEY);
+    const tasks = history ? JSON.parse(history) : [];
+    // 提交不到30秒的任务上游可能还未注册，留到下次刷新
+    const running = tasks.filter(t =>
+      (t.status === 'generating' || t.status === 'in_queue') &&
+      (!t.create_time || (new Date() - new Date(t.create_time)) / 1000 >= 30)
+    );
+    if (running.length === 0) {
+      return;
+    }
+
+    const result = await volcanoAPI.getTaskStatuses(
+      running.map(t => ({
+        provider: 'visual',
+        task_id: t.task_id,
+        req_key: t.api_version === 'jimeng' ? 'jimeng_imitator_ii2v' : 'realman_avatar_imitator_v2v_gen_video'
+      })),
+      { accessKeyId, secretAccessKey }
+    );
+    if (!result.success) {
+      console.error('❌ 批量刷新任务状态失败:', result.error);
+      return;
+    }
+
+    let updatedCount = 0;
+    result.data.tasks.forEach(item => {
+      if (!item.success) {
+        console.warn('⚠️ 任务状态查询失败:', item.task_id, item.error);
+        return;
+      }
+      const updates = {
+        status: item.status,
+        message: item.data.message || ''
+      };
+      if (item.status === 'done' && item.data.video_url) {
+        updates.video_url = item.data.video_url;
+        updates.preview_urls = item.data.preview_urls;
+      }
+      updateTaskInHistory(item.task_id, updates);
+      updatedCount += 1;
+    });
+    console.log(`🔄 批量刷新任务状态: ${updatedCount}/${running.length}`);
+  };
+
   // 删除任务
   const deleteTask = (taskId) => {
     if (!window.confirm('确定要删除这个任务吗？')) {
@@ -540,7 +596,8 @@ function MotionImitation() {
           file, 
           tosConfig, 
           uploadAccessKeyId.trim(), 
-          uploadSecretAccessKey.trim()
+          uploadSecretAccessKey.trim(),
+          type === 'video' ? 'realman_avatar_imitator_v2v_gen_video' : undefined  // 驱动视频按动作模仿的规格规范化
         );
         
         if (!result.success) {
@@ -1252,7 +1309,7 @@ function MotionImitation() {
                         
                         {/* 刷新按钮 */}
                         <Col md={2}>
-                          <Button variant="primary" onClick={loadTaskHistory}>
+                          <Button variant="primary" onClick={refreshTaskList}>
                             <i className="bi bi-arrow-clockwise"></i> 刷新
                           </Button>
                         </Col>
@@ -1505,6 +1562,7 @@ function MotionImitation() {
                   <video 
                     controls 
                     autoPlay
+                    poster={volcanoAPI.previewUrl(selectedTask.preview_urls, selectedTask.video_url)}
                     className="w-100"
                     style={{ maxHeight: '500px', borderRadius: '8px' }}
                   >
@@ -5,6 +5,7 @@ import {
   Tabs, Tab, ProgressBar
 } from 'react-bootstrap';
 import { storage } from '../utils/storage';
+import volcanoAPI from '../api/volcanoAPI';
 
 function SmartSearch() {
   // 认证配置
@@ -238,58 +239,55 @@ function SmartSearch() {
       });
 
       // 调用多模态搜索API
-      if (window.electronAPI && window.electronAPI.searchByMultiModal) {
-        const response = await window.electronAPI.searchByMultiModal(requestData);
+      const response = (window.electronAPI && window.electronAPI.searchByMultiModal)
+        ? await window.electronAPI.searchByMultiModal(requestData)
+        : await volcanoAPI.searchByMultiModal(requestData);
 
-        if (!response.success) {
-          throw new Error(response.error.message);
-        }
-
-        console.log('✅ 搜索成功:', response.data);
+      if (!response.success) {
+        throw new Error(response.error.message);
+      }
 
-        // API 返回的数据结构：response.data.data 是数组，response.data.total_return_count 是总数
-        const items = response.data.data || [];
-        const total = response.data.total_return_count || 0;
+      console.log('✅ 搜索成功:', response.data);
+
+      // API 返回的数据结构：response.data.data 是数组，response.data.total_return_count 是总数
+      const items = response.data.data || [];
+      const total = response.data.total_return_count || 0;
+
+      // 转换数据格式：fields -> 直接的字段，score -> score
+      const formattedItems = items.map(item => ({
+        fields: item.fields || {},
+        score: item.score || 0,
+        id: item.id || ''
+      }));
+
+      const resultData = {
+        items: formattedItems,
+        total: total,
+        timestamp: new Date().toISOString(),
+        searchMode: searchMode,
+        query: {
+          text: textInput,
+          hasImage: !!(imagePreview || imageUrl),
+          hasVideo: !!(videoPreview || videoUrl)
+        }
+      };
 
-        // 转换数据格式：fields -> 直接的字段，score -> score
-        const formattedItems = items.map(item => ({
-          fields: item.fields || {},
-          score: item.score || 0,
-          id: item.id || ''
-        }));
+      setSearchResult(resultData);
 
-        const resultData = {
-          items: formattedItems,
-          total: total,
+      // 添加到历史
+      const newHistory = [
+        {
+          id: Date.now(),
           timestamp: new Date().toISOString(),
-          searchMode: searchMode,
-          query: {
-            text: textInput,
-            hasImage: !!(imagePreview || imageUrl),
-            hasVideo: !!(videoPreview || videoUrl)
-          }
-        };
-
-        setSearchResult(resultData);
-
-        // 添加到历史
-        const newHistory = [
-          {
-            id: Date.now(),
-            timestamp: new Date().toISOString(),
-            mode: searchMode,
-            collection: collectionName,
-            index: indexName,
-            query: textInput || '图片/视频搜索',
-            resultCount: resultData.items.length
-          },
-          ...searchHistory.slice(0, 19)
-        ];
-        saveHistory(newHistory);
-
-      } else {
-        throw new Error('此功能需要在 Electron 环境中运行');
-      }
+          mode: searchMode,
+          collection: collectionName,
+          index: indexName,
+          query: textInput || '图片/视频搜索',
+          resultCount: resultData.items.length
+        },
+        ...searchHistory.slice(0, 19)
+      ];
+      saveHistory(newHistory);
 
     } catch (err) {
       console.error('搜索失败:', err);
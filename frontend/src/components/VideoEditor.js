@@ -137,7 +137,8 @@ function VideoEditor() {
             file,  // 直接传递文件对象
             tosConfig,  // TOS 配置对象
             accessKeyId,  // 访问密钥ID
-            secretAccessKey  // 秘密访问密钥
+            secretAccessKey,  // 秘密访问密钥
+            'dm_seedance_videoedit_tob'  // 按视频指令编辑的规格规范化视频
           );
 
           if (result.success) {
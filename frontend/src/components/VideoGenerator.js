@@ -17,6 +17,7 @@ import {
   InputGroup
 } from 'react-bootstrap';
 import { storage } from '../utils/storage';
+import volcanoAPI from '../api/volcanoAPI';
 
 function VideoGenerator() {
   // 状态管理
@@ -1665,6 +1666,10 @@ function VideoGenerator() {
                         className="w-100"
                         style={{ maxHeight: '400px' }}
                         preload="metadata"
+                        poster={volcanoAPI.previewUrl(
+                          selectedTask.preview_urls,
+                          selectedTask.content?.video_url || selectedTask.video_url
+                        )}
                         crossOrigin="anonymous"
                         controlsList="nodownload"
                         playsInline